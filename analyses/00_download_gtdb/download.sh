@@ -21,13 +21,14 @@ log() {
     echo "$1" | tee -a "$LOG_FILE"
 }
 
-log "Downloading GTDB representative genomes..." # High priority
-wget -c --show-progress -a "$LOG_FILE" -P "$TARGET_DIR" "$URL_REPS"
+log "Downloading & extracting GTDB representative genomes..." # High priority
+# Concurrent range requests, MD5 against MD5SUM.txt & tar extraction in a single pass, resumed from .gtdb_genomes_reps_r226.tar.gz.part after an interruption, logged to logs/*_download_reps.log
+python download_reps.py --url "$URL_REPS" --md5sum_url "${URL_BASE}MD5SUM.txt" --target_dir "$TARGET_DIR"
 log "Priority download complete."
 
 log "Downloading all GTDB files except genomic_files_all/..."
 wget -r -c -np -nH --cut-dirs=5 --show-progress -a "$LOG_FILE" \
-  -R "index.html*,robots.txt" \
+  -R "index.html*,robots.txt,$(basename "$URL_REPS")" \
   -X "$URL_EXCLUDE" \
   -P "$OUT_DIR" \
   "$URL_BASE"
@@ -0,0 +1,336 @@
+import io
+import sys
+import gzip
+import zlib
+import time
+import shutil
+import hashlib
+import itertools
+import tarfile
+import argparse
+from pathlib import Path
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+from urllib.parse import urlsplit
+import logging
+from tqdm import tqdm
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
+
+URL_BASE = "https://data.ace.uq.edu.au/public/gtdb/data/releases/release226/226.0/"
+BLOCK_SIZE = 1 << 20 # bytes per read of a single stream
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Download the GTDB representative genomes archive with concurrent HTTP range requests, "
+                    "verifying its MD5 & extracting tar members while the data arrives (each byte is read once). "
+                    "Members are extracted into a staging directory & moved into target_dir once the archive is verified. "
+                    "Downloaded bytes are kept in a partial archive, so an interrupted download resumes from where it stopped."
+    )
+    parser.add_argument("--url", default=URL_BASE + "genomic_files_reps/gtdb_genomes_reps_r226.tar.gz")
+    parser.add_argument("--md5sum_url", default=URL_BASE + "MD5SUM.txt", help="'none' to skip MD5 verification")
+    parser.add_argument("--target_dir", default="../../data/gtdb/226.0/genomic_files_reps")
+    parser.add_argument("--connections", type=int, default=8, help="concurrent range requests")
+    parser.add_argument("--part_mb", type=int, default=32, help="size of each range request")
+    parser.add_argument("--window", type=int, default=None, help="parts fetched ahead & held in memory (default: 2*connections)")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--keep_archive", action="store_true", help="also keep the archive in target_dir once verified")
+    parser.add_argument("--force", action="store_true", help="extract again even if a previous run completed")
+    parser.add_argument("--log_dir", default=None, help="default: logs/ next to this script")
+    return parser.parse_args()
+
+
+def probe(url: str, timeout: float):
+    """
+    Size of a remote file & whether the server serves byte ranges.
+
+    :param url: URL of the file
+    :param timeout: Timeout of the request (seconds)
+    """
+    with urlopen(Request(url, headers={"Range": "bytes=0-0"}), timeout=timeout) as res:
+        if res.status == 206: # Content-Range: bytes 0-0/<size>
+            return int(res.headers["Content-Range"].rsplit("/", 1)[1]), True
+        size = res.headers.get("Content-Length")
+        return (int(size) if size is not None else None), False
+
+
+def fetch_range(url: str, start: int, end: int, retries: int, timeout: float) -> bytes:
+    """
+    Bytes [start, end] (inclusive) of a remote file, retried with exponential backoff.
+
+    :param url: URL of the file
+    :param start: First byte
+    :param end: Last byte
+    :param retries: Retries after a failed or truncated request
+    :param timeout: Timeout of each request (seconds)
+    """
+    for attempt in range(retries + 1):
+        try:
+            with urlopen(Request(url, headers={"Range": f"bytes={start}-{end}"}), timeout=timeout) as res:
+                if res.status != 206:
+                    raise IOError(f"Range request answered with status {res.status}")
+                data = res.read()
+            if len(data) != end - start + 1:
+                raise IOError(f"Truncated range {start}-{end}: {len(data)} bytes")
+            return data
+        except OSError as e: # URLError, HTTPError, timeouts & truncated reads
+            if attempt == retries:
+                raise
+            log.warning(f"Range {start}-{end} failed ({e}), retry {attempt + 1}/{retries}")
+            time.sleep(min(2**attempt, 60))
+
+
+def ranged_chunks(
+        url: str, size: int, part_size: int, connections: int, window: int, retries: int, timeout: float, offset: int = 0
+):
+    """
+    Yields consecutive parts of a remote file in order from offset, fetched by concurrent range requests.
+    At most window parts are fetched ahead of the consumer, bounding memory to window*part_size.
+    """
+    starts = iter(range(offset, size, part_size))
+    pending = deque()
+    with ThreadPoolExecutor(connections) as pool:
+        try:
+            for start in starts:
+                pending.append(pool.submit(fetch_range, url, start, min(start + part_size, size) - 1, retries, timeout))
+                if len(pending) >= window:
+                    break
+            while pending:
+                data = pending.popleft().result()
+                start = next(starts, None)
+                if start is not None:
+                    pending.append(pool.submit(fetch_range, url, start, min(start + part_size, size) - 1, retries, timeout))
+                yield data
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def local_chunks(path: Path, block_size: int = BLOCK_SIZE):
+    """
+    Yields blocks of an already downloaded part of the archive.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            yield data
+
+
+def streamed_chunks(url: str, timeout: float, block_size: int = BLOCK_SIZE):
+    """
+    Yields blocks of a remote file from a single request (servers without range support).
+    """
+    with urlopen(url, timeout=timeout) as res:
+        while True:
+            data = res.read(block_size)
+            if not data:
+                break
+            yield data
+
+
+class ChunkStream(io.RawIOBase):
+    """Readable file over downloaded chunks, hashing them (MD5) & optionally copying them to a sink as they are consumed.
+
+    Args:
+        chunks: Iterator of bytes in file order.
+        sink: Binary file the archive is saved to (optional).
+        progress (tqdm): Progress bar updated with consumed bytes (optional).
+        sink_offset (int): Bytes already in the sink (resumed download), not written again.
+    """
+    def __init__(self, chunks, sink=None, progress=None, sink_offset=0):
+        self.chunks = chunks
+        self.sink = sink
+        self.progress = progress
+        self.sink_offset = sink_offset
+        self.md5 = hashlib.md5()
+        self.n_bytes = 0
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_chunk(self) -> bool:
+        data = next(self.chunks, None)
+        if data is None:
+            return False
+        self.md5.update(data)
+        if self.sink is not None and self.n_bytes + len(data) > self.sink_offset:
+            self.sink.write(data[max(0, self.sink_offset - self.n_bytes):])
+        if self.progress is not None:
+            self.progress.update(len(data))
+        self.n_bytes += len(data)
+        self._buffer = memoryview(data)
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._buffer and not self._next_chunk():
+            return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def drain(self):
+        """Consumes the rest of the file (e.g. gzip trailer & padding after the end of the tar archive) into the MD5.
+        """
+        self._buffer = memoryview(b"")
+        while self._next_chunk():
+            self._buffer = memoryview(b"")
+
+
+def load_md5sum(url: str, name: str, timeout: float):
+    """
+    Expected MD5 of a file from an MD5SUM.txt listing ('<md5>  <path>' lines), None if not listed.
+
+    :param url: URL of MD5SUM.txt
+    :param name: File name of the archive
+    :param timeout: Timeout of the request (seconds)
+    """
+    with urlopen(url, timeout=timeout) as res:
+        lines = res.read().decode().splitlines()
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and Path(parts[-1].lstrip("*")).name == name:
+            return parts[0].lower()
+    return None
+
+
+def extract_stream(stream: ChunkStream, target_dir: Path):
+    """
+    Extract members of a streamed tar.gz into target_dir as they arrive.
+    Requires the tarfile "data" filter, which rejects absolute paths, links outside target_dir & special files.
+
+    :param stream: Archive stream
+    :param target_dir: Extraction directory
+    """
+    n_files, n_bytes = 0, 0
+    with tarfile.open(fileobj=stream, mode="r|gz") as tar:
+        for member in tar:
+            tar.extract(member, path=target_dir, filter="data")
+            if member.isfile():
+                n_files += 1
+                n_bytes += member.size
+    return n_files, n_bytes
+
+
+def move_into_place(staging_dir: Path, target_dir: Path):
+    """
+    Move extracted entries of staging_dir into target_dir, replacing entries of a previous extraction.
+
+    :param staging_dir: Directory the archive was extracted into
+    :param target_dir: Extraction directory
+    """
+    for entry in staging_dir.iterdir():
+        dest = target_dir/entry.name
+        if dest.is_dir() and not dest.is_symlink():
+            shutil.rmtree(dest)
+        elif dest.exists() or dest.is_symlink():
+            dest.unlink()
+        entry.replace(dest)
+    staging_dir.rmdir()
+
+
+def main():
+    args = parse_args()
+    # "data" filter of tarfile (Python >= 3.12, backported to 3.8+ security releases) guards extraction of members
+    if not hasattr(tarfile, "data_filter"):
+        log.error("tarfile of this Python has no extraction filters, use Python >= 3.12 or a patch release with the backport")
+        sys.exit(1)
+    target_dir = Path(args.target_dir).resolve()
+    target_dir.mkdir(parents=True, exist_ok=True)
+    name = Path(urlsplit(args.url).path).name
+    marker = target_dir/f".{name}.extracted" # MD5 of the archive of a completed extraction
+
+    # Logging
+    log_dir = Path(args.log_dir or Path(__file__).resolve().parent/"logs")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    file_handler = logging.FileHandler(log_dir/f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_download_reps.log")
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(file_handler)
+
+    expected = None
+    if args.md5sum_url.lower() != "none":
+        expected = load_md5sum(args.md5sum_url, name, args.timeout)
+        if expected is None:
+            log.warning(f"{name} is not listed in {args.md5sum_url}, MD5 is not verified")
+    if marker.exists() and not args.force and (expected is None or marker.read_text().strip() == expected):
+        log.info(f"{name} was already extracted into {target_dir} (remove {marker} or use --force to extract again)")
+        return
+
+    marker.unlink(missing_ok=True) # written again once the new extraction is verified
+    archive_path = target_dir/name
+    part_path = target_dir/f".{name}.part" # downloaded bytes, kept until the archive is verified (as wget -c)
+    size, ranges = probe(args.url, args.timeout)
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    if offset > 0 and (not ranges or offset > size):
+        log.warning(f"Partial download {part_path} cannot be resumed from this server, downloading again")
+        offset = 0
+    if ranges:
+        part_size = args.part_mb << 20
+        remote = ranged_chunks(
+            args.url, size, part_size, args.connections, args.window or 2*args.connections, args.retries, args.timeout, offset
+        )
+        log.info(f"Downloading {name} ({size/2**30:.2f} GiB) with {args.connections} range requests of {args.part_mb} MB...")
+        if offset > 0:
+            log.info(f"Resuming from {part_path} ({offset/2**30:.2f} GiB already downloaded)")
+    else:
+        remote = streamed_chunks(args.url, args.timeout)
+        log.warning(f"Server does not serve byte ranges, downloading {name} as a single stream...")
+    # bytes of the partial download are read back (hashed & extracted again) before the remaining parts
+    chunks = itertools.chain(local_chunks(part_path) if offset > 0 else [], remote)
+
+    staging_dir = target_dir/f".{name}.staging" # members of an unverified archive never reach target_dir
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    staging_dir.mkdir()
+    sink = open(part_path, 'ab' if offset > 0 else 'wb')
+    try:
+        with tqdm(total=size, unit="B", unit_scale=True, desc=name) as progress:
+            stream = ChunkStream(chunks, sink, progress, sink_offset=offset)
+            n_files, n_bytes = extract_stream(stream, staging_dir)
+            stream.drain()
+    except (tarfile.TarError, gzip.BadGzipFile, zlib.error, EOFError) as e: # corrupted archive, resuming would fail again
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        part_path.unlink(missing_ok=True)
+        log.error(f"Invalid archive {name}: {e} (extracted files & partial download were removed, rerun to download again)")
+        sys.exit(1)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    finally:
+        remote.close()
+        sink.close()
+    log.info(f"Extracted {n_files} files ({n_bytes/2**30:.2f} GiB) into {staging_dir}")
+
+    md5 = stream.md5.hexdigest()
+    error = None
+    if size is not None and stream.n_bytes != size:
+        error = f"Downloaded {stream.n_bytes} bytes, expected {size}"
+    elif expected is not None and md5 != expected:
+        error = f"MD5 mismatch for {name}: {md5} != {expected}"
+    if error is not None:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        part_path.unlink(missing_ok=True)
+        log.error(f"{error} (extracted files & partial download were removed, rerun to download again)")
+        sys.exit(1)
+    log.info(f"MD5 {md5}" + (" verified" if expected is not None else ""))
+    move_into_place(staging_dir, target_dir)
+    log.info(f"Moved extracted files into {target_dir}")
+    if args.keep_archive:
+        part_path.replace(archive_path)
+        log.info(f"Archive saved to {archive_path}")
+    else:
+        part_path.unlink()
+    marker.write_text(md5 + "\n")
+    log.info("Download complete.")
+
+
+if __name__ == "__main__":
+    main()
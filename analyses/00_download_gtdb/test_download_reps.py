@@ -0,0 +1,133 @@
+import io
+import os
+import re
+import sys
+import hashlib
+import tarfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_reps
+
+
+NAME = "reps.tar.gz"
+MEMBERS = {
+    "database/GCA/000/000/001/GCA_000000001.1_genomic.fna.gz": os.urandom(1_500_000), # incompressible, several parts
+    "database/GCF/000/000/002/GCF_000000002.1_genomic.fna.gz": b">contig_1\nACGT\n",
+    "metadata.tsv": b"accession\nGCA_000000001.1\nGCF_000000002.1\n",
+}
+
+
+def make_archive() -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, data in MEMBERS.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+ARCHIVE = make_archive()
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Serves ARCHIVE & its MD5SUM.txt, with byte ranges if the server has ranges=True
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        files = {f"/{NAME}": ARCHIVE, "/MD5SUM.txt": self.server.md5sum}
+        data = files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if self.server.ranges and match:
+            start, end = int(match[1]), min(int(match[2]), len(data) - 1)
+            self.server.requested.append((start, end))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            data = data[start:end + 1]
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(params=[True, False], ids=["ranged", "streamed"])
+def server(request):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    server.ranges = request.param
+    server.requested = []
+    server.md5sum = f"{hashlib.md5(ARCHIVE).hexdigest()}  genomic_files_reps/{NAME}\n".encode()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(server, target_dir: Path, *args):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    argv = [
+        "download_reps.py", "--url", f"{url}/{NAME}", "--md5sum_url", f"{url}/MD5SUM.txt",
+        "--target_dir", str(target_dir), "--log_dir", str(target_dir.parent/"logs"),
+        "--part_mb", "1", "--connections", "2", "--retries", "0", *args,
+    ]
+    old_argv, sys.argv = sys.argv, argv
+    try:
+        download_reps.main()
+    finally:
+        sys.argv = old_argv
+
+
+def assert_extracted(target_dir: Path):
+    for name, data in MEMBERS.items():
+        assert (target_dir/name).read_bytes() == data
+    assert (target_dir/f".{NAME}.extracted").read_text().strip() == hashlib.md5(ARCHIVE).hexdigest()
+    assert not (target_dir/f".{NAME}.part").exists()
+    assert not (target_dir/f".{NAME}.staging").exists()
+
+
+def test_download(server, tmp_path):
+    target_dir = tmp_path/"reps"
+    run(server, target_dir, "--keep_archive")
+    assert_extracted(target_dir)
+    assert (target_dir/NAME).read_bytes() == ARCHIVE
+    if server.ranges:
+        assert sorted(server.requested)[1:] == [(0, (1 << 20) - 1), (1 << 20, len(ARCHIVE) - 1)] # after probe (0, 0)
+
+    # completed extraction is not downloaded again
+    server.requested.clear()
+    run(server, target_dir)
+    assert server.requested == []
+
+
+def test_resume(server, tmp_path):
+    target_dir = tmp_path/"reps"
+    target_dir.mkdir()
+    offset = 1_200_000 # interrupted download
+    (target_dir/f".{NAME}.part").write_bytes(ARCHIVE[:offset])
+    run(server, target_dir)
+    assert_extracted(target_dir)
+    if server.ranges: # only the remaining bytes are requested
+        assert sorted(server.requested)[1:] == [(offset, min(offset + (1 << 20), len(ARCHIVE)) - 1)]
+
+
+def test_corrupted_part(server, tmp_path):
+    target_dir = tmp_path/"reps"
+    target_dir.mkdir()
+    (target_dir/f".{NAME}.part").write_bytes(b"\0"*1000)
+    if server.ranges:
+        with pytest.raises(SystemExit): # partial download is removed, so that a rerun starts over
+            run(server, target_dir)
+        assert not (target_dir/f".{NAME}.part").exists()
+        assert not any((target_dir/name).exists() for name in MEMBERS)
+    run(server, target_dir)
+    assert_extracted(target_dir)
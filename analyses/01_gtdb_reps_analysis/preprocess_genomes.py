@@ -0,0 +1,207 @@
+import sys
+import yaml
+import argparse
+from pathlib import Path
+from datetime import datetime
+import logging
+from multiprocessing import Pool
+from tqdm import tqdm
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1])) # analyses/
+from common.fasta import iter_fasta, profile_record
+from common.split import output_paths, split_genome, source_key, journal_options, journal_entry
+from common.genome_store import GenomeStoreWriter, GenomePart
+from common.schedule import genome_cost, scheduled_imap
+from common.metrics import GenomeMetrics, MetricsWriter
+from common.prefetch import ReadAhead
+from profile_gtdb_reps import (
+    CONTIG_STATS_COLS, load_metadata, load_genome_index, get_file_path,
+    get_single_genome_info, profile_result, file_key, load_profile_cache, save_profile_cache, concat_nonempty
+)
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Profile, split & pack every genome in a single pass over its decompressed bytes. "
+                    "Results are written where profile_gtdb_reps.py (profile cache), split_plasmids.py (split journal) "
+                    "& generate_dataset.py (genome store) resume from, so those scripts only read them back."
+    )
+    # profile (01_gtdb_reps_analysis)
+    parser.add_argument("--metadata_bac", default="../../data/gtdb/226.0/bac120_metadata_r226.tsv.gz")
+    parser.add_argument("--metadata_ar", default="../../data/gtdb/226.0/ar53_metadata_r226.tsv.gz")
+    parser.add_argument("--genome_dir", default="../../data/gtdb/226.0/genomic_files_reps/gtdb_genomes_reps_r226/database/")
+    parser.add_argument("--genome_index", default="../../data/gtdb/226.0/genome_index_reps.tsv")
+    parser.add_argument("--rebuild_index", action="store_true")
+    parser.add_argument("--profile_cache", default="../../data/gtdb/226.0/profile_cache")
+    # split (02_split_plasmids)
+    parser.add_argument("--gtdb_dir", default="../../data/gtdb/")
+    parser.add_argument("--gtdb_split_dir", default="../../data/gtdb_split/")
+    parser.add_argument("--split_journal", default=None, help="default: <gtdb_split_dir>/split_journal.jsonl")
+    parser.add_argument("--unknown_mode", default="chromosome", choices=["chromosome", "discard"])
+    parser.add_argument("--compression", default="gzip", choices=["gzip", "bgzf"])
+    parser.add_argument("--compress_threads", type=int, default=1)
+    parser.add_argument("--no_validate", action="store_true")
+    # genome store (04_dataset_generation)
+    parser.add_argument("--store_dir", default=None, help="genome store for generate_dataset.py (skipped if not set)")
+    parser.add_argument("--n_workers", type=int, default=32)
+    # read-ahead of genome files (NFS), see common.prefetch.ReadAhead
+    parser.add_argument("--read_ahead", type=int, default=0, help="genomes fetched ahead (0: disabled)")
+    parser.add_argument("--read_ahead_threads", type=int, default=4)
+    parser.add_argument("--read_ahead_mb", type=int, default=2048, help="memory cap of fetched genome files")
+    parser.add_argument("--scratch_dir", default=None, help="fetch onto local scratch instead of memory")
+    return parser.parse_args()
+
+
+def preprocess_single_genome(args: tuple):
+    """
+    Wrapper function to profile, split & pack a single genome for multi-processing.
+    Records are streamed once from the genome file (see common.fasta.iter_fasta) & each record is
+    profiled, packed into the genome store & passed on to the split outputs before the next one is read.
+
+    :param args: Tuple containing (accession, path, split target directory, split options, genome store directory or None)
+    """
+    accession, path, target_dir, split_options, store_dir = args
+    metrics = GenomeMetrics("preprocess", accession)
+    result, _, _ = get_single_genome_info((accession, None)) # initial value if file not found
+    if path is None:
+        return result, None, None, None, metrics.record()
+
+    try:
+        key = file_key(path)
+        source = source_key(Path(path).resolve()) # before reading, so that a later change fails verify of the journal entry
+    except Exception:
+        result["file_status"] = "error"
+        return result, None, None, None, metrics.record()
+
+    contigs, read_error = [], []
+    part = GenomePart(store_dir) if store_dir is not None else None
+    def fan_out():
+        try:
+            for header, seq in iter_fasta(path, metrics=metrics):
+                # 01: header classification & per-contig stats
+                with metrics.phase("profile"):
+                    contigs.append(profile_record(header, seq, metrics))
+                # 04: sampler-ready contigs, written by the worker (only a reference is sent back)
+                if part is not None:
+                    with metrics.phase("pack"):
+                        part.add(header.split()[0] if header else "", seq)
+                yield header, seq
+        except Exception as e:
+            read_error.append(e)
+            raise
+
+    # 02: chromosome & plasmid outputs, fed by the same pass over the records
+    records = fan_out()
+    split = split_genome(records, *output_paths(path, target_dir), **split_options, metrics=metrics)
+    try:
+        for _ in records: # rest of the genome if the split stopped early
+            pass
+    except Exception:
+        pass # recorded in read_error
+    if read_error:
+        result["file_status"] = "error"
+        if part is not None:
+            part.abort()
+        return result, None, None, None, metrics.record()
+
+    with metrics.phase("profile"):
+        result, contig_stats = profile_result(result, path, contigs)
+    result.update({"file_size": key[1], "file_mtime_ns": key[2]})
+    split.update({"accession": accession, **source})
+    store_ref = part.commit() if part is not None else None
+    return result, contig_stats, split, store_ref, metrics.record()
+
+
+def main():
+    args = parse_args()
+    for arg in ["metadata_bac", "metadata_ar", "genome_dir", "genome_index", "profile_cache", "gtdb_dir", "gtdb_split_dir"]:
+        setattr(args, arg, str(Path(getattr(args, arg)).resolve()))
+    args.split_journal = str(Path(args.split_journal or Path(args.gtdb_split_dir)/"split_journal.jsonl").resolve())
+
+    # Output directory
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    out_dir = Path.cwd()/"out"/f"preprocess_{timestamp}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(out_dir/"config.yaml", 'w') as f:
+        yaml.dump(vars(args), f, default_flow_style=False)
+
+    # Logging
+    file_handler = logging.FileHandler(out_dir/"preprocess.log")
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(file_handler)
+
+    # load metadata & resolve genome files
+    df = load_metadata(args.metadata_bac, args.metadata_ar, raw=True)
+    genome_index = load_genome_index(args.genome_index, args.genome_dir, args.rebuild_index)
+    split_options = {
+        "unknown_mode": args.unknown_mode,
+        "validate": not args.no_validate,
+        "compression": args.compression,
+        "compress_threads": args.compress_threads,
+    }
+    gtdb_dir, gtdb_split_dir = Path(args.gtdb_dir), Path(args.gtdb_split_dir)
+    task_args = []
+    for accession in df["accession"]:
+        path = get_file_path(accession, genome_index)
+        target_dir = gtdb_split_dir/path.relative_to(gtdb_dir).parent if path is not None else None
+        task_args.append((accession, path, target_dir, split_options, args.store_dir))
+    log.info(f"Start processing {len(task_args)} genomes with {args.n_workers} workers...")
+
+    # Single pass: profile results, split journal & genome store are written as genomes complete,
+    # largest genomes first in adaptive chunks
+    results, contig_stats = [], {col: [] for col in ["accession"] + CONTIG_STATS_COLS}
+    stats = {"found": 0, "missing": 0, "error": 0, "split_error": 0}
+    store = GenomeStoreWriter(args.store_dir) if args.store_dir is not None else None
+    Path(args.split_journal).parent.mkdir(parents=True, exist_ok=True)
+    costs = genome_cost(df["genome_size"], df["contig_count"]) # task_args follow metadata order
+    metrics_writer = MetricsWriter(out_dir/"metrics.jsonl")
+    read_ahead = ReadAhead(
+        lambda task: [task[1]], args.read_ahead, args.read_ahead_threads, args.read_ahead_mb, args.scratch_dir
+    )
+    with Pool(args.n_workers) as pool, read_ahead, open(args.split_journal, 'a') as journal_file, metrics_writer:
+        imap = scheduled_imap(pool, preprocess_single_genome, task_args, costs, args.n_workers, read_ahead=read_ahead)
+        for result, stats_, split, store_ref, metrics in tqdm(imap, total=len(task_args)):
+            results.append(result)
+            metrics_writer.write(metrics)
+            stats[result["file_status"]] += 1
+            if stats_ is not None:
+                contig_stats["accession"].extend([result["accession"]]*len(stats_["header_id"]))
+                for col in CONTIG_STATS_COLS:
+                    contig_stats[col].extend(stats_[col])
+            if split is not None:
+                if split["status"] == "success":
+                    journal_file.write(journal_entry(split, journal_options(args.unknown_mode, args.compression)))
+                    journal_file.flush()
+                else:
+                    stats["split_error"] += 1
+            if store is not None and store_ref is not None:
+                store.add_genome_part(result["accession"], result["local_file_path"], store_ref)
+    if store is not None:
+        store.close()
+        log.info(f"Genome store saved to {args.store_dir} (Genomes: {len(store.genomes)}, Bases: {store.n_bases})")
+    log.info(f"Split journal appended to {args.split_journal}")
+
+    # Profile cache of found genomes, reused by profile_gtdb_reps.py
+    df_res = pd.DataFrame(results)
+    found = df_res["file_status"] == "found"
+    df_cache = df_res[found].astype({"file_size": "int64", "file_mtime_ns": "int64"})
+    df_contigs = pd.DataFrame(contig_stats)
+    # genomes of an existing cache that were not processed in this run are kept
+    df_old, df_old_contigs = load_profile_cache(args.profile_cache)
+    if len(df_old) > 0:
+        kept = df_old.loc[~df_old["accession"].isin(df_res["accession"]), "accession"]
+        df_cache = concat_nonempty([df_old[df_old["accession"].isin(kept)], df_cache])
+        df_contigs = concat_nonempty([df_old_contigs[df_old_contigs["accession"].isin(kept)], df_contigs])
+    save_profile_cache(args.profile_cache, df_cache, df_contigs)
+    log.info(f"Profile cache saved to {args.profile_cache}")
+    log.info(f"Done. Stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
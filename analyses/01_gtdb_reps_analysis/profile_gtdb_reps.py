@@ -1,37 +1,69 @@
+import os
+import sys
 import yaml
 import argparse
 from pathlib import Path
 from datetime import datetime
 import logging
-import gzip
 from multiprocessing import Pool
 from tqdm import tqdm
 import pandas as pd
 
+sys.path.append(str(Path(__file__).resolve().parents[1])) # analyses/
+from common.fasta import scan_fasta
+from common.metadata import read_metadata, build_metadata_cache
+from common.schedule import genome_cost, scheduled_imap
+from common.metrics import GenomeMetrics, MetricsWriter
+from common.prefetch import ReadAhead
+
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 log = logging.getLogger(__name__)
 
+RESULT_COLS = [
+    "accession", "local_file_path", "file_status", "plasmid_count", 
+    "scan_contig_count", "scan_genome_size", "scan_gc_count", "scan_n_count", "scan_plasmid_count", 
+] # per-genome result of get_single_genome_info
+CONTIG_STATS_COLS = ["header_id", "length", "gc_count", "n_count", "seq_type", "class_reason"]
+CACHE_KEY_COLS = ["local_file_path", "file_size", "file_mtime_ns"] # identity of a profiled genome file
+GENOME_SUFFIX = "_genomic.fna.gz"
+DERIVED_SUFFIXES = ("_cds_from_genomic.fna.gz", "_rna_from_genomic.fna.gz") # NCBI CDS & RNA FASTA, not genomes
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--metadata_bac", default="../../data/gtdb/226.0/bac120_metadata_r226.tsv.gz")
     parser.add_argument("--metadata_ar", default="../../data/gtdb/226.0/ar53_metadata_r226.tsv.gz")
     parser.add_argument("--genome_dir", default="../../data/gtdb/226.0/genomic_files_reps/gtdb_genomes_reps_r226/database/")
+    parser.add_argument("--genome_index", default="../../data/gtdb/226.0/genome_index_reps.tsv")
+    parser.add_argument("--rebuild_index", action="store_true")
+    parser.add_argument("--profile_cache", default="../../data/gtdb/226.0/profile_cache")
+    parser.add_argument("--rebuild_cache", action="store_true")
     parser.add_argument("--n_workers", type=int, default=32)
+    # read-ahead of genome files (NFS), see common.prefetch.ReadAhead
+    parser.add_argument("--read_ahead", type=int, default=0, help="genomes fetched ahead (0: disabled)")
+    parser.add_argument("--read_ahead_threads", type=int, default=4)
+    parser.add_argument("--read_ahead_mb", type=int, default=2048, help="memory cap of fetched genome files")
+    parser.add_argument("--scratch_dir", default=None, help="fetch onto local scratch instead of memory")
     return parser.parse_args()
 
 
-def load_metadata(path_bac, path_ar):
+def load_metadata(path_bac, path_ar, raw=False):
     """
     Load & concatenate bacterial & archaeal metadata.
+    Metadata are read from typed Parquet caches, which are built next to the TSVs on the first run.
     
     :param path_bac: Path to metadata of bacteria
     :param path_ar: Path to metadata of archaea
+    :param raw: Read the TSVs as strings instead (values are written back as in GTDB, e.g. "none" & integers)
     """
     log.info("Loading metadata...")
-    df_bac = pd.read_csv(path_bac, sep='\t', dtype=str)
-    df_ar = pd.read_csv(path_ar, sep='\t', dtype=str)
+    if raw:
+        df_bac = pd.read_csv(path_bac, sep='\t', dtype=str)
+        df_ar = pd.read_csv(path_ar, sep='\t', dtype=str)
+    else:
+        df_bac = read_metadata(path_bac)
+        df_ar = read_metadata(path_ar)
 
     df = pd.concat([df_bac, df_ar], ignore_index=True)
     log.info(f"Bacterial genomes in metadata: {len(df_bac)}")
@@ -41,62 +73,199 @@ def load_metadata(path_bac, path_ar):
     return df
 
 
-def get_file_path(accession, genome_dir):
+def strip_accession(accession):
     """
-    Get genome file (.fna.gz) path with specific GTDB accession.
+    Remove database prefix from GTDB accession (e.g. RS_GCF_000005845.2 -> GCF_000005845.2).
     
     :param accession: GTDB accession of genome
+    """
+    return accession.replace("GB_", "").replace("RS_", "")
+
+
+def build_genome_index(genome_dir):
+    """
+    Walk genome directory once & map accessions to genome files (*_genomic.fna.gz).
+    CDS & RNA FASTA (*_cds_from_genomic.fna.gz, *_rna_from_genomic.fna.gz) next to genomes are skipped.
+    
+    :param genome_dir: Base directory path (<source>/<p1>/<p2>/<p3>/<accession>_<asm>_genomic.fna.gz)
+    """
+    index = {}
+    stack = [genome_dir]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir():
+                    stack.append(entry.path)
+                elif entry.name.endswith(GENOME_SUFFIX) and not entry.name.endswith(DERIVED_SUFFIXES):
+                    accession = "_".join(entry.name.split('_')[:2]) # e.g. GCF_000005845.2
+                    index[accession] = entry.path
+    return index
+
+
+def load_genome_index(index_path, genome_dir, rebuild=False):
+    """
+    Load accession -> genome file index. Build & save it if it does not exist.
+    
+    :param index_path: Path to index file (.tsv)
     :param genome_dir: Base directory path
+    :param rebuild: Rebuild index even if index file exists
     """
-    accession = accession.replace("GB_", "").replace("RS_", "") # remove prefix
+    index_path = Path(index_path)
+    if index_path.exists() and not rebuild:
+        log.info(f"Loading genome index from {index_path}...")
+        df_index = pd.read_csv(index_path, sep='\t', dtype=str)
+        return dict(zip(df_index["accession"], df_index["path"]))
+
+    log.info(f"Building genome index of {genome_dir}...")
+    index = build_genome_index(genome_dir)
+    df_index = pd.DataFrame(sorted(index.items()), columns=["accession", "path"])
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_name(f"{index_path.name}.tmp")
+    df_index.to_csv(tmp_path, sep='\t', index=False)
+    os.replace(tmp_path, index_path)
+    log.info(f"Indexed {len(df_index)} genomes. Saved to {index_path}")
+    return index
+
+
+def get_file_path(accession, genome_index):
+    """
+    Get genome file (.fna.gz) path with specific GTDB accession.
     
-    try:
-        source, acc = accession.split('_')
-        num = acc.split('.')[0]
-        p1, p2, p3 = num[0:3], num[3:6], num[6:9]
-    except Exception:
-        return None
+    :param accession: GTDB accession of genome
+    :param genome_index: Dict mapping accessions (without prefix) to genome files
+    """
+    path = genome_index.get(strip_accession(accession))
+    return Path(path) if path else None
 
-    tgt_dir = Path(genome_dir)/source/p1/p2/p3
-    files = list(tgt_dir.glob(f"{accession}*genomic.fna.gz"))
 
-    return files[0] if files else None
+def file_key(path):
+    """
+    Identity of a genome file used as key of the profile cache.
+    
+    :param path: Path to genome file
+    """
+    stat = os.stat(path)
+    return str(path), stat.st_size, stat.st_mtime_ns
 
 
-def get_single_genome_info(args: tuple):
+def load_profile_cache(cache_dir):
     """
-    Wrapper function to get single information for multi-processing
+    Load per-genome results & per-contig stats of previous runs.
     
-    :param args: Tuple containing (accession, genome_dir)
-    """
-    accession, genome_dir = args
-    path = get_file_path(accession, genome_dir)
-    result = {
-        "accession": accession, 
-        "local_file_path": None, 
-        "file_status": "missing",
-        "plasmid_count": None
+    :param cache_dir: Directory of profile cache (genomes.parquet & contig_stats.parquet)
+    """
+    cache_dir = Path(cache_dir)
+    if not (cache_dir/"genomes.parquet").exists() or not (cache_dir/"contig_stats.parquet").exists():
+        return pd.DataFrame(columns=["accession"] + CACHE_KEY_COLS), pd.DataFrame(columns=["accession"] + CONTIG_STATS_COLS)
+    log.info(f"Loading profile cache from {cache_dir}...")
+    return pd.read_parquet(cache_dir/"genomes.parquet"), pd.read_parquet(cache_dir/"contig_stats.parquet")
+
+
+def save_profile_cache(cache_dir, df_genomes, df_contigs):
+    """
+    Save per-genome results & per-contig stats of found genomes atomically.
+    
+    :param cache_dir: Directory of profile cache
+    :param df_genomes: Per-genome results with CACHE_KEY_COLS
+    :param df_contigs: Per-contig stats with accession
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for name, df in [("genomes.parquet", df_genomes), ("contig_stats.parquet", df_contigs)]:
+        tmp_path = cache_dir/f".{name}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_dir/name)
+
+
+def concat_nonempty(frames):
+    """
+    Concatenate DataFrames skipping empty ones, which would turn integer columns into float.
+    
+    :param frames: List of DataFrames with the same columns
+    """
+    return pd.concat([df for df in frames if len(df)] or frames[-1:], ignore_index=True)
+
+
+def split_cached(task_args, df_cache, rebuild=False):
+    """
+    Split tasks into genomes whose cached results are still valid & genomes to (re)compute.
+    A cached result is valid if path, size & mtime of the genome file are unchanged.
+    Status of each accession: reused, recomputed (file changed), missing (cached but file not found), 
+    new (not cached) or removed (cached but no longer in metadata).
+    
+    :param task_args: List of (accession, path)
+    :param df_cache: Per-genome results of profile cache
+    :param rebuild: Recompute all genomes
+    """
+    cached = {} if rebuild else {
+        acc: key for acc, *key in df_cache[["accession"] + CACHE_KEY_COLS].itertuples(index=False)
     }
+    reused, todo, status = [], [], {}
+    for accession, path in task_args:
+        key = None
+        if path is not None:
+            try:
+                key = list(file_key(path))
+            except OSError:
+                pass
+        if key is not None and cached.get(accession) == key:
+            reused.append(accession)
+            status[accession] = "reused"
+        else:
+            todo.append((accession, path))
+            if accession not in cached:
+                status[accession] = "new"
+            else:
+                status[accession] = "recomputed" if key is not None else "missing" # cached file is gone
+    for accession in set(df_cache["accession"]) - set(status):
+        status[accession] = "removed" # no longer in metadata
+    return reused, todo, status
+
+
+def get_single_genome_info(args: tuple):
+    """
+    Wrapper function to get single information for multi-processing.
+    Genome file is scanned once as bytes (see common.fasta.scan_fasta) 
+    to collect header classification & per-contig stats.
+    Returns (result, per-contig stats, metrics record of common.metrics.GenomeMetrics).
+    
+    :param args: Tuple containing (accession, path), path is None if genome file not found
+    """
+    accession, path = args
+    metrics = GenomeMetrics("profile", accession)
+    result = dict.fromkeys(RESULT_COLS)
+    result.update({"accession": accession, "file_status": "missing"})
     if path is None:
-        return result # initial value if file not found
+        return result, None, metrics.record() # initial value if file not found
 
-    # count plasmid number in header
-    plasmid_count = 0
     try:
-        with gzip.open(path, 'rt') as f:
-            for line in f:
-                if line.startswith('>'):
-                    if 'plasmid' in line.lower():
-                        plasmid_count += 1               
-        result.update({
-            "local_file_path": str(path), 
-            "file_status": "found", 
-            "plasmid_count": plasmid_count
-        })
+        contigs = scan_fasta(path, metrics=metrics)
     except Exception:
         result["file_status"] = "error"
+        return result, None, metrics.record()
+    return (*profile_result(result, path, contigs), metrics.record())
 
-    return result
+
+def profile_result(result, path, contigs):
+    """
+    Fill per-genome result & per-contig stats of a found genome from its per-contig stats.
+    
+    :param result: Initial result of get_single_genome_info
+    :param path: Path to genome file
+    :param contigs: Per-contig stats from common.fasta.scan_fasta or profile_records
+    """
+    result.update({
+        "local_file_path": str(path), 
+        "file_status": "found", 
+        "plasmid_count": sum('plasmid' in c["description"].lower() for c in contigs), # count plasmid number in header
+        "scan_contig_count": len(contigs), 
+        "scan_genome_size": sum(c["length"] for c in contigs), 
+        "scan_gc_count": sum(c["gc_count"] for c in contigs), 
+        "scan_n_count": sum(c["n_count"] for c in contigs), 
+        "scan_plasmid_count": sum(c["seq_type"] == "plasmid" for c in contigs), # by classify_sequence
+    })
+    contig_stats = {col: [c[col] for c in contigs] for col in CONTIG_STATS_COLS}
+    return result, contig_stats
 
 
 def main():
@@ -104,6 +273,8 @@ def main():
     args.metadata_bac = str(Path(args.metadata_bac).resolve())
     args.metadata_ar = str(Path(args.metadata_ar).resolve())
     args.genome_dir = str(Path(args.genome_dir).resolve())
+    args.genome_index = str(Path(args.genome_index).resolve())
+    args.profile_cache = str(Path(args.profile_cache).resolve())
 
     # Output directory
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -118,19 +289,56 @@ def main():
     file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
     logging.getLogger().addHandler(file_handler)
 
-    # load metadata
-    df = load_metadata(args.metadata_bac, args.metadata_ar)
+    # load metadata (as strings, so that metadata_ex.tsv keeps the rendering of GTDB metadata)
+    df = load_metadata(args.metadata_bac, args.metadata_ar, raw=True)
     accessions = df["accession"].tolist()
 
-    task_args = [(acc, args.genome_dir) for acc in accessions]
+    # resolve genome files without per-genome directory listing
+    genome_index = load_genome_index(args.genome_index, args.genome_dir, args.rebuild_index)
+    task_args = [(acc, get_file_path(acc, genome_index)) for acc in accessions]
+
+    # Reuse results of unchanged genome files from profile cache
+    df_cache, df_cache_contigs = load_profile_cache(args.profile_cache)
+    reused, task_args, cache_status = split_cached(task_args, df_cache, args.rebuild_cache)
+    df_status = pd.DataFrame(sorted(cache_status.items()), columns=["accession", "cache_status"])
+    df_status.to_csv(out_dir/"cache_report.tsv", sep='\t', index=False)
+    log.info(f"Profile cache: {df_status['cache_status'].value_counts().to_dict()}")
     log.info(f"Start processing {len(task_args)} genomes with {args.n_workers} workers...")
     
-    # Count 'plasmids'
-    with Pool(args.n_workers) as pool:
-        imap = pool.imap_unordered(get_single_genome_info, task_args)
-        results = list(tqdm(imap, total=len(task_args)))
+    # Scan genomes (plasmid counts & per-contig stats), largest genomes first in adaptive chunks
+    cost_of = dict(zip(df["accession"], genome_cost(df["genome_size"], df["contig_count"])))
+    costs = [cost_of[acc] for acc, _ in task_args]
+    read_ahead = ReadAhead(
+        lambda task: [task[1]], args.read_ahead, args.read_ahead_threads, args.read_ahead_mb, args.scratch_dir
+    )
+    with Pool(args.n_workers) as pool, read_ahead, MetricsWriter(out_dir/"metrics.jsonl") as metrics_writer:
+        imap = scheduled_imap(pool, get_single_genome_info, task_args, costs, args.n_workers, read_ahead=read_ahead)
+        results, contig_stats = [], {col: [] for col in ["accession"] + CONTIG_STATS_COLS}
+        for result, stats, metrics in tqdm(imap, total=len(task_args)):
+            results.append(result)
+            metrics_writer.write(metrics)
+            if stats is not None:
+                contig_stats["accession"].extend([result["accession"]]*len(stats["header_id"]))
+                for col in CONTIG_STATS_COLS:
+                    contig_stats[col].extend(stats[col])
+
+    # Merge with reused results & update cache with found genomes
+    df_new = pd.DataFrame(results, columns=RESULT_COLS)
+    found = df_new["file_status"] == "found"
+    keys = [file_key(path) for path in df_new.loc[found, "local_file_path"]]
+    df_found = df_new[found].assign(file_size=[key[1] for key in keys], file_mtime_ns=[key[2] for key in keys])
+    df_cache = concat_nonempty([df_cache[df_cache["accession"].isin(reused)], df_found])
+    df_contigs = concat_nonempty([
+        df_cache_contigs[df_cache_contigs["accession"].isin(reused)], 
+        pd.DataFrame(contig_stats), 
+    ])
+    save_profile_cache(args.profile_cache, df_cache, df_contigs)
+    log.info(f"Profile cache saved to {args.profile_cache}")
 
-    df_res = pd.DataFrame(results)
+    df_res = concat_nonempty([df_cache.drop(columns=CACHE_KEY_COLS[1:]), df_new[~found]])
+    contig_stats_path = out_dir/"contig_stats.parquet"
+    df_contigs.to_parquet(contig_stats_path, index=False)
+    log.info(f"Per-contig stats saved to {contig_stats_path}")
 
     # Merge & N_ratio
     log.info("Merging results...")
@@ -152,7 +360,8 @@ def main():
     # Output
     out_path = out_dir/"metadata_ex.tsv"
     df_ex.to_csv(out_path, sep='\t', index=False)
-    log.info(f"Done. Saved to {out_path}")
+    cache_path = build_metadata_cache(out_path) # typed cache read by downstream stages
+    log.info(f"Done. Saved to {out_path} & {cache_path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
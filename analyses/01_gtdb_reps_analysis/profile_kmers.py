@@ -0,0 +1,238 @@
+import os
+import sys
+import yaml
+import argparse
+from pathlib import Path
+from datetime import datetime
+import logging
+from multiprocessing import Pool
+from tqdm import tqdm
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1])) # analyses/
+from common.fasta import read_fasta
+from common.kmer import count_kmers, concat_sequences, n_features, KmerMatrixWriter
+from common.schedule import genome_cost, scheduled_imap
+from common.metrics import GenomeMetrics, MetricsWriter
+from common.prefetch import ReadAhead
+from profile_gtdb_reps import load_metadata, load_genome_index, get_file_path, strip_accession
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
+
+# ASCII of token ids written by 04_dataset_generation/tokenized.py (special tokens map to N)
+TOKEN_BASES = np.full(256, ord("N"), dtype=np.uint8)
+TOKEN_BASES[7:12] = np.frombuffer(b"ACGTN", dtype=np.uint8)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Canonical k-mer count matrices of GTDB representative genomes (per genome & optionally per contig), "
+                    "or of sampled contigs of a dataset split written by generate_dataset.py (--dataset)."
+    )
+    parser.add_argument("--metadata_bac", default="../../data/gtdb/226.0/bac120_metadata_r226.tsv.gz")
+    parser.add_argument("--metadata_ar", default="../../data/gtdb/226.0/ar53_metadata_r226.tsv.gz")
+    parser.add_argument("--genome_dir", default="../../data/gtdb/226.0/genomic_files_reps/gtdb_genomes_reps_r226/database/")
+    parser.add_argument("--genome_index", default="../../data/gtdb/226.0/genome_index_reps.tsv")
+    parser.add_argument("--rebuild_index", action="store_true")
+    parser.add_argument("--dataset", default=None, help="split directory of generate_dataset.py output (parquet or tokenized shards)")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--per_contig", action="store_true", help="also write a row per contig (genome mode)")
+    parser.add_argument("--format", default="dense", choices=["dense", "sparse"])
+    parser.add_argument("--chunk_rows", type=int, default=4096)
+    parser.add_argument("--out_dir", default=None, help="default: ../../data/gtdb/226.0/kmer_reps_k<k> or <dataset>_kmer_k<k>")
+    parser.add_argument("--n_workers", type=int, default=32)
+    # read-ahead of genome files (NFS), see common.prefetch.ReadAhead
+    parser.add_argument("--read_ahead", type=int, default=0, help="genomes fetched ahead (0: disabled)")
+    parser.add_argument("--read_ahead_threads", type=int, default=4)
+    parser.add_argument("--read_ahead_mb", type=int, default=2048, help="memory cap of fetched genome files")
+    parser.add_argument("--scratch_dir", default=None, help="fetch onto local scratch instead of memory")
+    return parser.parse_args()
+
+
+def kmer_single_genome(args: tuple):
+    """
+    Wrapper function to count canonical k-mers of a single genome for multi-processing.
+    Contigs are counted separately, so k-mers spanning two contigs are never counted.
+
+    :param args: Tuple containing (accession, path, k, whether to keep per-contig rows)
+    """
+    accession, path, k, per_contig = args
+    metrics = GenomeMetrics("kmer", accession)
+    if path is None:
+        return accession, "missing", None, None, metrics.record()
+    try:
+        records = read_fasta(path, metrics)
+    except Exception:
+        return accession, "error", None, None, metrics.record()
+
+    with metrics.phase("count"):
+        contig_counts = count_kmers(*concat_sequences([seq for _, seq in records]), k)
+    header_ids = [header.split()[0] if header else "" for header, _ in records]
+    lengths = [len(seq) for _, seq in records]
+    keys = {
+        "level": ["genome"],
+        "header_id": [None],
+        "length": [sum(lengths)],
+    }
+    counts = [contig_counts.sum(axis=0, dtype=np.uint32, keepdims=True)]
+    if per_contig:
+        keys["level"] += ["contig"]*len(records)
+        keys["header_id"] += header_ids
+        keys["length"] += lengths
+        counts.append(contig_counts)
+    metrics.add("bases", sum(lengths))
+    return accession, "found", keys, np.concatenate(counts), metrics.record()
+
+
+def load_shard(shard_path: Path):
+    """
+    Load sampled contigs of a dataset shard as an ASCII buffer & offsets with their keys.
+
+    :param shard_path: Parquet shard (sequence strings) or tokenized shard directory (see tokenized.py)
+    """
+    shard_path = Path(shard_path)
+    if shard_path.is_dir():
+        offsets = np.load(shard_path/"offsets.npy")
+        buffer = (
+            TOKEN_BASES[np.fromfile(shard_path/"tokens.bin", dtype=np.uint8)] if offsets[-1] > 0
+            else np.empty(0, dtype=np.uint8)
+        )
+        genomes = pd.read_parquet(shard_path.parent/"genomes.parquet").set_index("genome_id")
+        labels = pd.read_csv(shard_path.parent/"labels.tsv", sep='\t')["label"].to_numpy()
+        contigs = pd.read_parquet(shard_path/"contigs.parquet")
+        genome_id = np.load(shard_path/"genome_id.npy")
+        keys = {
+            "accession": genomes["accession"].reindex(genome_id).to_numpy(),
+            "label": labels[np.load(shard_path/"label_id.npy")],
+            "header": contigs["header"].to_numpy()[np.load(shard_path/"contig_id.npy")],
+            "start": np.load(shard_path/"start.npy"),
+            "end": np.load(shard_path/"end.npy"),
+            "strand": np.where(np.load(shard_path/"strand.npy") > 0, "+", "-"),
+        }
+        return buffer, offsets, keys
+    df = pd.read_parquet(shard_path)
+    buffer, offsets = concat_sequences([seq.encode('ascii', errors='replace') for seq in df["sequence"]])
+    # accession is resolved from local_file_path in the parent (see profile_dataset)
+    keys = {col: df[col].to_numpy() for col in ["local_file_path", "label", "header", "start", "end", "strand"]}
+    return buffer, offsets, keys
+
+
+def kmer_single_shard(args: tuple):
+    """
+    Wrapper function to count canonical k-mers of sampled contigs of a dataset shard for multi-processing.
+
+    :param args: Tuple containing (shard path, k)
+    """
+    shard_path, k = args
+    metrics = GenomeMetrics("kmer", Path(shard_path).name)
+    with metrics.phase("load"):
+        buffer, offsets, keys = load_shard(shard_path)
+    with metrics.phase("count"):
+        counts = count_kmers(buffer, offsets, k)
+    keys["shard"] = [Path(shard_path).name]*len(counts)
+    keys["index"] = np.arange(len(counts))
+    metrics.add("bases", len(buffer))
+    return Path(shard_path).name, keys, counts, metrics.record()
+
+
+def accession_of_file(path, gtdb_accession: dict) -> str:
+    """
+    GTDB accession of a genome file (e.g. .../GCF_000005845.2_ASM584v2_genomic.fna.gz -> RS_GCF_000005845.2).
+    Files of genomes absent from the metadata keep their NCBI accession.
+
+    :param gtdb_accession: Map from accessions without database prefix to GTDB accessions
+    """
+    accession = "_".join(Path(path).name.split('_')[:2])
+    return gtdb_accession.get(accession, accession)
+
+
+def profile_genomes(args, writer: KmerMatrixWriter, metrics_writer: MetricsWriter) -> dict:
+    df = load_metadata(args.metadata_bac, args.metadata_ar)
+    genome_index = load_genome_index(args.genome_index, args.genome_dir, args.rebuild_index)
+    task_args = [
+        (accession, get_file_path(accession, genome_index), args.k, args.per_contig) for accession in df["accession"]
+    ]
+    costs = genome_cost(df["genome_size"], df["contig_count"]) # task_args follow metadata order
+    log.info(f"Start counting {args.k}-mers of {len(task_args)} genomes with {args.n_workers} workers...")
+
+    stats = {"found": 0, "missing": 0, "error": 0}
+    read_ahead = ReadAhead(
+        lambda task: [task[1]], args.read_ahead, args.read_ahead_threads, args.read_ahead_mb, args.scratch_dir
+    )
+    with Pool(args.n_workers) as pool, read_ahead:
+        imap = scheduled_imap(pool, kmer_single_genome, task_args, costs, args.n_workers, read_ahead=read_ahead)
+        for accession, status, keys, counts, metrics in tqdm(imap, total=len(task_args)):
+            stats[status] += 1
+            metrics_writer.write(metrics)
+            if keys is not None:
+                writer.add(pd.DataFrame({"accession": accession, **keys}), counts)
+    return stats
+
+
+def profile_dataset(args, writer: KmerMatrixWriter, metrics_writer: MetricsWriter) -> dict:
+    dataset = Path(args.dataset)
+    shards = sorted(p for p in dataset.glob("part-*") if p.is_dir() or p.suffix == ".parquet")
+    if not shards:
+        raise FileNotFoundError(f"No dataset shards (part-*) in {dataset}")
+    task_args = [(str(path), args.k) for path in shards]
+    costs = [os.stat(path/"tokens.bin" if path.is_dir() else path).st_size for path in shards]
+    log.info(f"Start counting {args.k}-mers of {len(shards)} shards of {dataset} with {args.n_workers} workers...")
+
+    stats = {"shards": 0, "contigs": 0}
+    gtdb_accession = {}
+    if any(not path.is_dir() for path in shards): # parquet shards only keep local_file_path
+        df = load_metadata(args.metadata_bac, args.metadata_ar)
+        gtdb_accession = dict(zip(df["accession"].map(strip_accession), df["accession"]))
+    with Pool(args.n_workers) as pool:
+        imap = scheduled_imap(pool, kmer_single_shard, task_args, costs, args.n_workers)
+        for _, keys, counts, metrics in tqdm(imap, total=len(task_args)):
+            metrics_writer.write(metrics)
+            if "accession" not in keys: # parquet shard
+                keys = {"accession": [accession_of_file(path, gtdb_accession) for path in keys["local_file_path"]], **keys}
+            writer.add(pd.DataFrame(keys), counts)
+            stats["shards"] += 1
+            stats["contigs"] += len(counts)
+    return stats
+
+
+def main():
+    args = parse_args()
+    for arg in ["metadata_bac", "metadata_ar", "genome_dir", "genome_index"]:
+        setattr(args, arg, str(Path(getattr(args, arg)).resolve()))
+    n_features(args.k) # validates k
+    if args.out_dir is None:
+        args.out_dir = (
+            f"{Path(args.dataset).resolve()}_kmer_k{args.k}" if args.dataset is not None
+            else f"../../data/gtdb/226.0/kmer_reps_k{args.k}"
+        )
+    args.out_dir = str(Path(args.out_dir).resolve())
+
+    # Output directory
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    out_dir = Path.cwd()/"out"/f"kmer_{timestamp}"
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(out_dir/"config.yaml", 'w') as f:
+        yaml.dump(vars(args), f, default_flow_style=False)
+
+    # Logging
+    file_handler = logging.FileHandler(out_dir/"profile_kmers.log")
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    logging.getLogger().addHandler(file_handler)
+
+    # Rows are appended as genomes (shards) complete & written in chunks of chunk_rows
+    writer = KmerMatrixWriter(args.out_dir, args.k, dense=args.format == "dense", chunk_rows=args.chunk_rows)
+    with writer, MetricsWriter(out_dir/"metrics.jsonl") as metrics_writer:
+        if args.dataset is not None:
+            stats = profile_dataset(args, writer, metrics_writer)
+        else:
+            stats = profile_genomes(args, writer, metrics_writer)
+    log.info(f"K-mer matrix saved to {args.out_dir} (Rows: {writer.n_rows}, Chunks: {writer.n_chunks})")
+    log.info(f"Done. Stats: {stats}")
+
+
+if __name__ == "__main__":
+    main()
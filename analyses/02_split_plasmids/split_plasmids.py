@@ -1,104 +1,77 @@
-import re
-import gzip
+import sys
 from pathlib import Path
+from typing import Dict, Tuple
+from functools import partial
+import multiprocessing
 from tqdm import tqdm
 import logging
 import hydra
 from omegaconf import DictConfig, OmegaConf
 import pandas as pd
-from Bio import SeqIO
 
-
-log = logging.getLogger(__name__)
-
-
-PLASMID_REGEX = re.compile(
-    r"\bplasmids?\b|" # \b excludes "mycoplasmid"
-    r"extrachromosomal|"
-    r"\bInc[A-Z0-9]+[-_a-z0-9]*\b|" # Incompatibility group e.g. IncF, IncFII, IncP-1
-    r"\bInc\s+group\b|" # e.g. Inc group
-    r"\bp[A-Za-z]{2,}\d+|" # naming convention (p + <2 alphabets + number) e.g. pBR322, pXO1
-    r"megaplasmid", 
-    re.IGNORECASE
-)
-CHROMOSOME_REGEX = re.compile(
-    r"\bchromosomes?\b|" # Chromosome
-    r"complete\s+genome|" # Complete Genome
-    r"main\s+genome", # Main Genome
-    re.IGNORECASE
+sys.path.append(str(Path(__file__).resolve().parents[1])) # analyses/
+from common.fasta import iter_fasta
+from common.metadata import read_metadata
+from common.metrics import NO_METRICS, GenomeMetrics, MetricsWriter
+from common.schedule import genome_cost, scheduled_imap
+from common.prefetch import ReadAhead
+from common.split import (
+    output_paths, split_genome, 
+    read_journal, source_key, journal_options, is_current, verify_entry, journal_result, journal_entry
 )
 
 
-def classify_sequence(description):
-    """Classify sequence type & its reason based on its header.
-    """
-    p_match = PLASMID_REGEX.search(description)
-    if p_match:
-        return "plasmid", f"match={p_match.group(0)}"
-    c_match = CHROMOSOME_REGEX.search(description)
-    if c_match:
-        return "chromosome", f"match={c_match.group(0)}"
-    return "unknown", "no_match"
+log = logging.getLogger(__name__)
 
 
 def process_genome(
         file_path: Path, 
         target_dir: Path, 
-        cfg: DictConfig
-):
-    """"Split single genome file into chromosome & plasmid.
+        cfg: DictConfig, 
+        metrics=NO_METRICS
+) -> Dict:
+    """"Split single genome file into chromosome & plasmid (see common.split.split_genome).
+    Records are streamed from the genome file straight into the outputs.
+
     Args: 
         file_path (Path): Path to original genome file (.fna.gz)
         target_dir (Path): Directory path to output chromosome & plasmids
         cfg (DictConfig): Config
-    """
-    target_dir.mkdir(parents=True, exist_ok=True)
-    name = file_path.name
-    for ext in ['.gz', '.fna', '.fa', '.fasta']:
-        name = name.replace(ext, "")
-    # file_name = file_path.name
-    # stem = file_name.replace(".fna.gz", "").replace(".fna", "")
-
-    chromosome_path = target_dir/f"{name}_chromosome.fna.gz"
-    plasmid_path = target_dir/f"{name}_plasmid.fna.gz"
-    if chromosome_path.exists(): # for resume function
-        p_path_str = str(plasmid_path) if plasmid_path.exists() else None
-        return "skipped", str(chromosome_path), p_path_str
+        metrics (GenomeMetrics): Per-genome timings & bytes (optional)
 
+    Returns:
+        Dict: Result containing status, output paths & detection reasons, 
+        & per output size, record count & MD5 for the completion journal
+    """
+    chromosome_path, plasmid_path = output_paths(file_path, target_dir)
+    return split_genome(
+        iter_fasta(file_path, metrics=metrics), chromosome_path, plasmid_path, 
+        unknown_mode=cfg.unknown_mode, 
+        validate=cfg.process.validate, 
+        compression=cfg.process.get("compression", "gzip"), 
+        compress_threads=cfg.process.get("compress_threads", 1), 
+        metrics=metrics
+    )
+
+
+def process_task(task: Tuple, cfg: DictConfig) -> Dict:
+    """Wrapper function of process_genome for multi-processing
+
+    Args:
+        task (Tuple): Tuple containing (accession, original_path, target_dir)
+        cfg (DictConfig): Config
+    """
+    accession, original_path, target_dir = task
+    metrics = GenomeMetrics("split", accession)
     try:
-        # Split
-        records_chromosome, records_plasmid = [], []
-        with gzip.open(file_path, 'rt') as f:
-            for record in SeqIO.parse(f, "fasta"):
-                seq_type, reason = classify_sequence(record.description)
-                record.description += f" [seq_type={seq_type}] [class_reason={reason}]"
-                if seq_type == "plasmid":
-                    records_plasmid.append(record)
-                elif seq_type == "chromosome":
-                    records_chromosome.append(record)
-                else: # unknown
-                    if cfg.unknown_mode == "chromosome":
-                        record.description += " [seq_type=unknown]"
-                        records_chromosome.append(record)
-                    elif cfg.unknown_mode == "discard":
-                        pass
-                    
-        # Output
-        c_path_str, p_path_str = None, None
-        if records_chromosome:
-            with gzip.open(chromosome_path, 'wt') as f:
-                SeqIO.write(records_chromosome, f, "fasta")
-            c_path_str = str(chromosome_path)
-        if records_plasmid:
-            with gzip.open(plasmid_path, 'wt') as f:
-                SeqIO.write(records_plasmid, f, "fasta")
-            p_path_str = str(plasmid_path)
-            
-        return "success", c_path_str, p_path_str
-
-    except Exception as e:
-        log.error(f"Error processing {file_path.name}: {e}")
-        return "error", None, None
+        source = source_key(original_path) # before reading, so that a later change fails verify on resume
+    except OSError:
+        source = {"source": str(original_path)} # missing file, the split fails too
+    result = process_genome(original_path, target_dir, cfg, metrics)
+    result["accession"] = accession
+    result.update(source)
+    result["metrics"] = metrics.record()
+    return result
 
 
 @hydra.main(version_base=None, config_path="conf", config_name="config")
@@ -112,32 +85,80 @@ def main(cfg: DictConfig):
 
     # Metadata
     log.info(f"Loading metadata from {cfg.paths.metadata}...")
-    df = pd.read_csv(cfg.paths.metadata, sep='\t', low_memory=False)
-    df = df[df["file_status"] == 'found']
+    df = read_metadata(
+        cfg.paths.metadata, 
+        columns=["accession", "local_file_path", "genome_size", "contig_count"], 
+        filters=[("file_status", "==", "found")]
+    )
     log.info(f"Target genomes to process: {len(df)}")
 
-    # Perform splitting
-    summary = []
-    stats = {"success": 0, "skipped": 0, "error": 0}
-    for idx, row in tqdm(df.iterrows(), total=len(df)):
-        accession = row['accession']
-        
-        original_path = Path(row['local_file_path']).resolve()
+    # Optionally resolve genome files from accession index built by 01_gtdb_reps_analysis
+    if cfg.paths.get("genome_index"):
+        log.info(f"Loading genome index from {cfg.paths.genome_index}...")
+        df_index = pd.read_csv(cfg.paths.genome_index, sep='\t', dtype=str)
+        genome_index = dict(zip(df_index["accession"], df_index["path"]))
+        accessions = df['accession'].str.replace(r'^(RS_|GB_)', '', regex=True)
+        df = df.assign(local_file_path=accessions.map(genome_index).fillna(df['local_file_path']))
+
+    # Completed genomes from the journal (single sequential read instead of reading outputs back)
+    journal_path = Path(cfg.paths.get("journal") or gtdb_split_dir/"split_journal.jsonl")
+    journal = read_journal(journal_path)
+    verify = cfg.process.get("verify")
+    options = journal_options(cfg.unknown_mode, cfg.process.get("compression", "gzip"))
+    log.info(f"Loaded {len(journal)} completed genomes from {journal_path} (verify={verify})")
+
+    tasks, costs, summary = [], [], []
+    stats = {"success": 0, "skipped": 0, "error": 0, "invalid": 0, "stale": 0}
+    cost_of = genome_cost(df['genome_size'], df['contig_count'])
+    for accession, local_file_path, cost in zip(df['accession'], df['local_file_path'], cost_of):
+        original_path = Path(local_file_path).resolve()
+        entry = journal.get(accession)
+        if entry is not None:
+            if not is_current(entry, original_path, options):
+                log.warning(f"Source path or split options of {accession} changed since it was journaled, re-processing")
+                stats["stale"] += 1
+            elif not verify or verify_entry(entry, verify):
+                stats["skipped"] += 1
+                result = journal_result(entry)
+                if result["chromosome_path"] is not None:
+                    summary.append(result)
+                continue
+            else:
+                log.warning(f"Source file or outputs of {accession} do not match the journal, re-processing")
+                stats["invalid"] += 1
         rel_path = original_path.relative_to(gtdb_dir)
-        target_dir = gtdb_split_dir/rel_path.parent
-
-        status, c_path, p_path = process_genome(original_path, target_dir, cfg)
-        stats[status] += 1
-        if status in ["success", "skipped"] and c_path is not None:
-            summary.append({
-                "accession": accession, 
-                "chromosome_path": c_path, 
-                "plasmid_path": p_path
-            })
+        tasks.append((accession, original_path, gtdb_split_dir/rel_path.parent))
+        costs.append(cost)
+
+    # Perform splitting (largest genomes first) & append completed genomes to the journal
+    log.info(f"Start processing {len(tasks)} genomes with {cfg.process.num_workers} workers...")
+    func = partial(process_task, cfg=cfg)
+    journal_path.parent.mkdir(parents=True, exist_ok=True)
+    metrics_writer = MetricsWriter(Path("metrics.jsonl")) # per-genome metrics in the Hydra run directory
+    read_ahead = ReadAhead(lambda task: [task[1]], **cfg.process.get("read_ahead", {}))
+    with multiprocessing.Pool(cfg.process.num_workers) as p, read_ahead, open(journal_path, 'a') as journal_file, metrics_writer:
+        imap = scheduled_imap(
+            p, func, tasks, costs, cfg.process.num_workers, 
+            max_in_flight=cfg.process.get("max_in_flight"), read_ahead=read_ahead
+        )
+        for result in tqdm(imap, total=len(tasks)):
+            metrics_writer.write(result.pop("metrics"))
+            stats[result["status"]] += 1
+            if result["status"] == "success":
+                journal_file.write(journal_entry(result, options))
+                journal_file.flush()
+                if result["chromosome_path"] is not None:
+                    summary.append(result)
 
     # Output summary
     summary_path = Path("split_summary.csv")
-    pd.DataFrame(summary).to_csv(summary_path, index=False) # assume hydra.job.chdir: True
+    summary_cols = [
+        "accession", 
+        "chromosome_path", "plasmid_path", 
+        "chromosome_reason", "plasmid_reason", 
+    ]
+    df_summary = pd.DataFrame(summary, columns=summary_cols).sort_values("accession")
+    df_summary.to_csv(summary_path, index=False) # assume hydra.job.chdir: True
 
     log.info(f"Processing complete. Stats: {stats}")
     log.info(f"Summary saved to: {summary_path}")
@@ -1,19 +1,95 @@
 import os
+import sys
 from pathlib import Path
 import logging
 import hydra
 from omegaconf import DictConfig, OmegaConf
 import pandas as pd
 
+sys.path.append(str(Path(__file__).resolve().parents[1])) # analyses/
+from common.metadata import read_metadata
+from common.metrics import GenomeMetrics, MetricsWriter
+
 
 log = logging.getLogger(__name__)
 
 
+FILTER_DIR = Path(__file__).resolve().parent/"config"/"filter"
+
+OUT_COLS = [
+    'accession',
+
+    # Path
+    'local_file_path',
+    'chromosome_path',
+    'plasmid_path',
+
+    # Quality
+    'genome_size',
+    'contig_count', 'mean_contig_length',
+    'longest_contig', 'n50_contigs',
+    'plasmid_count',
+
+    # {quality_tool}_completeness & {quality_tool}_contamination are inserted here
+
+    # Label
+    'gtdb_taxonomy',
+    'domain', 'phylum', 'class', 'order',
+    'family', 'genus', 'species',
+]
+
+
+def strip_accession(accessions: pd.Series) -> pd.Series:
+    """
+    Remove database prefix from GTDB accessions (e.g. RS_GCF_000005845.2 -> GCF_000005845.2)
+    """
+    return accessions.str.replace(r'^(RS_|GB_)', '', regex=True)
+
+
+def quality_cols(spec: DictConfig) -> list:
+    """
+    Completeness & contamination columns of the quality tool of a filter
+    """
+    return [f"{spec.quality_tool}_completeness", f"{spec.quality_tool}_contamination"]
+
+
+def load_filters(cfg: DictConfig) -> dict:
+    """
+    Filter specs to evaluate, keyed by name.
+    In batch mode (cfg.filters), each entry is either a filter spec or the name of a file in config/filter/,
+    otherwise the single cfg.filter is used.
+
+    :param cfg: Config to generate manifests
+    """
+    if not cfg.get("filters"):
+        return {None: cfg.filter}
+    specs = {}
+    for name, spec in cfg.filters.items():
+        specs[name] = OmegaConf.load(FILTER_DIR/f"{spec}.yaml") if isinstance(spec, str) else spec
+    return specs
+
+
+def filter_mask(df: pd.DataFrame, spec: DictConfig) -> pd.Series:
+    """
+    Boolean mask of genomes passing a filter spec
+
+    :param df: Metadata of found genomes
+    :param spec: Filter spec (genome_category, quality_tool, min_completeness, max_contamination)
+    """
+    col_completeness, col_contamination = quality_cols(spec)
+    return (
+        df['ncbi_genome_category'].isin(list(spec.genome_category)) &
+        (df[col_completeness] >= spec.min_completeness) &
+        (df[col_contamination] <= spec.max_contamination)
+    )
+
+
 @hydra.main(version_base=None, config_path="config", config_name="config")
 def main(cfg: DictConfig):
     """
-    Generate manifest of training dataset
-    
+    Generate manifest(s) of training dataset.
+    Metadata & split summary are loaded & joined once, then each filter is evaluated as a boolean mask.
+
     :param cfg: Config to generate manifest of training dataset
     :type cfg: DictConfig
     """
@@ -21,79 +97,77 @@ def main(cfg: DictConfig):
     out_dir = Path(os.getcwd()) # Execution directory created by Hydra
     log.info(f"Working directory: {out_dir}")
     log.info(f"Configuration:\n{OmegaConf.to_yaml(cfg)}")
+    specs = load_filters(cfg)
+    with MetricsWriter(out_dir/"metrics.jsonl") as metrics_writer: # stage-level records: load & one per filter
+        metrics = GenomeMetrics("manifest", "load")
 
-    # 1. Load Data
-    log.info("Loading metadata...")
-    df = pd.read_csv(cfg.paths.metadata, sep='\t', low_memory=False)
-    df = df[df["file_status"]=='found']
-    log.info(f"Total genomes matched: {len(df)}")
-
-    # 2. Filtering
-    log.info(f"Filter Conditions:")
-    log.info(f"  - Category: {cfg.filter.genome_category}")
-    log.info(f"  - Tool: {cfg.filter.quality_tool}")
-    log.info(f"  - Completeness >= {cfg.filter.min_completeness}")
-    log.info(f"  - Contamination <= {cfg.filter.max_contamination}")
-    
-    col_completeness = f"{cfg.filter.quality_tool}_completeness"
-    col_contamination = f"{cfg.filter.quality_tool}_contamination"
-
-    target_categories = list(cfg.filter.genome_category)
-    df = df[df['ncbi_genome_category'].isin(target_categories)]
-    df = df[
-        (df[col_completeness] >= cfg.filter.min_completeness) & 
-        (df[col_contamination] <= cfg.filter.max_contamination)
-    ]
-    
-    if len(df) == 0:
-        log.warning("No genomes found. Exiting.")
-        return
-    else: 
-        log.info(f"Genomes after filtering: {len(df)}")
-
-    # 3. Merge split
-    split_csv_path = Path(cfg.paths.split_summary)
-    log.info(f"Loading split summary from {split_csv_path}...")
-    df_split = (
-        pd.read_csv(split_csv_path)
-        .set_index('accession')
-        [['chromosome_path', 'plasmid_path']]
-    )
-    df = pd.merge(
-        df, df_split, 
-        df['accession'].str.replace(r'^(RS_|GB_)', '', regex=True),
-        right_index=True, 
-        how='left' 
-    )
+        # 1. Load Data (only used columns of found genomes, from typed metadata cache)
+        log.info("Loading metadata...")
+        tool_cols = list(dict.fromkeys(col for spec in specs.values() for col in quality_cols(spec)))
+        with metrics.phase("read"):
+            df = read_metadata(
+                cfg.paths.metadata,
+                columns=[col for col in OUT_COLS if col not in ['chromosome_path', 'plasmid_path']] + ['ncbi_genome_category'] + tool_cols,
+                filters=[("file_status", "==", "found")]
+            )
+        log.info(f"Total genomes matched: {len(df)}")
+
+        # 2. Merge split (accessions without database prefix on both sides)
+        split_csv_path = Path(cfg.paths.split_summary)
+        log.info(f"Loading split summary from {split_csv_path}...")
+        with metrics.phase("merge"):
+            df_split = pd.read_csv(split_csv_path)
+            df_split = df_split.set_index(strip_accession(df_split['accession']))[['chromosome_path', 'plasmid_path']]
+            accessions = strip_accession(df['accession'])
+            for col in ['chromosome_path', 'plasmid_path']:
+                df[col] = accessions.map(df_split[col])
+        metrics.add("genomes", len(df))
+        metrics_writer.write(metrics.record())
+
+        # 3. Filtering & Output
+        summary = []
+        for name, spec in specs.items():
+            log.info(f"Filter Conditions{'' if name is None else f' ({name})'}:")
+            log.info(f"  - Category: {spec.genome_category}")
+            log.info(f"  - Tool: {spec.quality_tool}")
+            log.info(f"  - Completeness >= {spec.min_completeness}")
+            log.info(f"  - Contamination <= {spec.max_contamination}")
+
+            metrics = GenomeMetrics("manifest", name if name is not None else cfg.manifest_name)
+            with metrics.phase("filter"):
+                df_filtered = df[filter_mask(df, spec)]
+            metrics.add("genomes", len(df_filtered))
+            summary.append({
+                "filter": name if name is not None else cfg.manifest_name,
+                "genome_category": ",".join(spec.genome_category),
+                "quality_tool": spec.quality_tool,
+                "min_completeness": spec.min_completeness,
+                "max_contamination": spec.max_contamination,
+                "genomes": len(df_filtered),
+                "species": df_filtered['species'].nunique(),
+                "with_plasmid": int(df_filtered['plasmid_path'].notna().sum()),
+                "total_genome_size": int(df_filtered['genome_size'].sum()),
+            })
+            if len(df_filtered) == 0:
+                log.warning("No genomes found.")
+                metrics_writer.write(metrics.record())
+                continue
+            log.info(f"Genomes after filtering: {len(df_filtered)}")
+
+            # Output (batch mode: <name>/<manifest_name>)
+            out_path = out_dir/cfg.manifest_name if name is None else out_dir/name/cfg.manifest_name
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            out_cols = OUT_COLS[:OUT_COLS.index('plasmid_count') + 1] + quality_cols(spec) + OUT_COLS[OUT_COLS.index('gtdb_taxonomy'):]
+            with metrics.phase("write"):
+                df_filtered[out_cols].to_csv(out_path, index=False)
+            metrics.add("bytes_out", out_path.stat().st_size)
+            metrics_writer.write(metrics.record())
+            log.info(f"Manifest saved to: {out_path} (n={len(df_filtered)})")
 
-    # Output
-    out_path = out_dir/cfg.manifest_name
-    out_cols = [
-        'accession', 
-        
-        # Path
-        'local_file_path', 
-        'chromosome_path', 
-        'plasmid_path', 
-
-        # Quality
-        'genome_size', 
-        'contig_count', 'mean_contig_length', 
-        'longest_contig', 'n50_contigs', 
-        'plasmid_count', 
-
-        f"{col_completeness}", 
-        f"{col_contamination}", 
-
-        # Label
-        'gtdb_taxonomy', 
-        'domain', 'phylum', 'class', 'order', 
-        'family', 'genus', 'species', 
-    ]
-    df[out_cols].to_csv(out_path, index=False)
-    
-    log.info(f"Manifest saved to: {out_path} (n={len(df)})")
+    summary_path = out_dir/"filter_summary.csv"
+    pd.DataFrame(summary).to_csv(summary_path, index=False)
+    log.info(f"Filter summary saved to: {summary_path}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
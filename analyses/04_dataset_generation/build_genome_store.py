@@ -0,0 +1,69 @@
+import sys
+import argparse
+from pathlib import Path
+import logging
+from multiprocessing import Pool
+from tqdm import tqdm
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1])) # analyses/
+from common.fasta import read_fasta
+from common.genome_store import GenomeStoreWriter, find_n_runs
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Convert manifest genomes into a packed, memory-mapped genome store for GenomeSampler."
+    )
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--store_dir", required=True)
+    parser.add_argument("--path_col", default="local_file_path")
+    parser.add_argument("--n_workers", type=int, default=32)
+    return parser.parse_args()
+
+
+def load_single_genome(args: tuple):
+    """
+    Wrapper function to read a single genome for multi-processing
+    
+    :param args: Tuple containing (accession, path)
+    """
+    accession, path = args
+    try:
+        contigs = []
+        for header, seq in read_fasta(path):
+            seq = np.frombuffer(seq, dtype=np.uint8)
+            contigs.append((header.split()[0] if header else "", seq, find_n_runs(seq)))
+        return accession, path, contigs
+    except Exception as e:
+        log.warning(f"Error reading {path}: {e}")
+        return accession, path, None
+
+
+def main():
+    args = parse_args()
+    df = pd.read_csv(args.manifest)
+    df = df[df[args.path_col].notna()]
+    task_args = list(zip(df["accession"], df[args.path_col]))
+    log.info(f"Packing {len(task_args)} genomes into {args.store_dir} with {args.n_workers} workers...")
+
+    n_errors = 0
+    with GenomeStoreWriter(args.store_dir) as writer, Pool(args.n_workers) as pool:
+        imap = pool.imap(load_single_genome, task_args, chunksize=4) # ordered, store follows manifest order
+        for accession, path, contigs in tqdm(imap, total=len(task_args)):
+            if contigs is None:
+                n_errors += 1
+                continue
+            writer.add_genome(accession, path, contigs)
+
+    log.info(f"Done. Genomes: {len(writer.genomes)}, Contigs: {len(writer.headers)}, "
+             f"Bases: {writer.n_bases}, Errors: {n_errors}")
+
+
+if __name__ == "__main__":
+    main()
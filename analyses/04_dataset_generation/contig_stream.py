@@ -0,0 +1,184 @@
+import queue
+import threading
+import logging
+from types import SimpleNamespace
+from typing import Dict, Iterator, List
+import numpy as np
+import pandas as pd
+try: # torch is only needed to feed a DataLoader, the stream itself is a plain iterable
+    from torch.utils.data import IterableDataset, get_worker_info
+except ImportError:
+    IterableDataset = object
+    get_worker_info = lambda: None
+
+from generate_dataset import GenomeSampler, labeled_genomes, num_contigs_of, split_coverages, stable_hash
+from tokenized import tokenize
+
+
+log = logging.getLogger(__name__)
+
+
+_DONE = object() # end of a producer
+SPLIT_ALIASES = {"val": "validation"} # short names of splits of generate_dataset.py
+
+
+class ContigStream(IterableDataset):
+    """Streams batches of contigs sampled on the fly from genomes, instead of a materialized dataset.
+
+    Every epoch draws fresh windows (seeded by (process.seed, accession, split, epoch), see set_epoch).
+    Genomes are shuffled per epoch & partitioned between ranks & DataLoader workers, so each genome
+    is sampled by exactly one worker. A background thread loads & samples genomes into a bounded queue
+    of prefetch genomes, & contigs of several genomes are mixed in a shuffle buffer before batching.
+
+    Args:
+        cfg (DictConfig): Config of generate_dataset.py (dataset, process & optional paths.genome_store)
+        manifest (pd.DataFrame): Manifest with columns accession, local_file_path, species & genome_size
+            (genomes without species are dropped)
+        split (str): Split name as in generate_dataset.py: train, validation (or val) or a name in dataset.splits
+        batch_size (int): Contigs per batch
+        prefetch (int): Max number of sampled genomes waiting in the queue
+        shuffle_buffer (int): Number of contigs mixed before batching (0 to keep genome order)
+        tokenized (bool): Yield HyenaDNA token ids ("input_ids") instead of strings ("sequence")
+        rank (int): Rank of the process in distributed training
+        world_size (int): Number of processes in distributed training
+    """
+    def __init__(
+            self,
+            cfg,
+            manifest: pd.DataFrame,
+            split: str = "train",
+            batch_size: int = 32,
+            prefetch: int = 4,
+            shuffle_buffer: int = 4096,
+            tokenized: bool = False,
+            rank: int = 0,
+            world_size: int = 1
+    ):
+        coverages = split_coverages(cfg)
+        split = SPLIT_ALIASES.get(split, split)
+        if split not in coverages:
+            raise ValueError(f"Unknown split {split!r}, expected one of {list(coverages)} (or {list(SPLIT_ALIASES)})")
+        manifest, self.labels = labeled_genomes(manifest)
+        self.sampler = GenomeSampler(cfg)
+        self.split = split
+        self.num_contigs = num_contigs_of(
+            coverages[split], manifest["genome_size"].max(), self.sampler.expected_contig_len
+        )
+        label_ids = manifest["species"].map({l: i for i, l in enumerate(self.labels)})
+        self.rows = [
+            {"accession": r["accession"], "local_file_path": r["local_file_path"], "species": r["species"], "label_id": label_id}
+            for r, label_id in zip(manifest.to_dict('records'), label_ids)
+        ]
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.shuffle_buffer = shuffle_buffer
+        self.tokenized = tokenized
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """Sets the epoch, which changes genome order & sampled windows (as DistributedSampler.set_epoch)
+        """
+        self.epoch = epoch
+
+    def worker_rows(self) -> List[Dict]:
+        """Genomes of this rank & DataLoader worker in this epoch
+        """
+        info = get_worker_info()
+        worker_id, num_workers = (info.id, info.num_workers) if info is not None else (0, 1)
+        rng = np.random.default_rng([self.sampler.seed, self.epoch])
+        order = rng.permutation(len(self.rows))
+        n_parts = self.world_size*num_workers
+        part = self.rank*num_workers + worker_id
+        return [self.rows[i] for i in order[part::n_parts]]
+
+    def _produce(self, rows: List[Dict], q: queue.Queue, stop: threading.Event):
+        """Loads & samples genomes into q, followed by _DONE (or the raised exception)
+        """
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for row in rows:
+                row = SimpleNamespace(**row)
+                rng = self.sampler.genome_rng(row.accession, f"{self.split}/{self.epoch}")
+                windows, buffer, offsets = self.sampler.sample_contigs(row, self.num_contigs, rng=rng)
+                if windows and not put((row, windows, buffer, offsets)):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    def contigs(self) -> Iterator[Dict]:
+        """Yields single contigs of this worker's genomes in genome order
+        """
+        q = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(self.worker_rows(), q, stop), daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = q.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                row, windows, buffer, offsets = item
+                key = "input_ids" if self.tokenized else "sequence"
+                if self.tokenized:
+                    buffer = tokenize(buffer)
+                for (header, start, end, strand), lo, hi in zip(windows, offsets[:-1], offsets[1:]):
+                    seq = buffer[lo:hi]
+                    yield {
+                        key: seq if self.tokenized else seq.tobytes().decode('ascii'),
+                        "label": row.label_id,
+                        "accession": row.accession,
+                        "header": header,
+                        "start": start,
+                        "end": end,
+                        "strand": strand,
+                    }
+        finally:
+            stop.set()
+            producer.join()
+
+    def __iter__(self) -> Iterator[Dict[str, List]]:
+        """Yields batches (dict of lists) of batch_size contigs, the last one may be smaller
+        """
+        info = get_worker_info()
+        worker_id = info.id if info is not None else 0
+        rng = np.random.default_rng([self.sampler.seed, self.epoch, self.rank, worker_id, stable_hash(self.split)])
+        buffer, batch = [], []
+        for contig in self.contigs():
+            if self.shuffle_buffer > 0:
+                # Replace a random contig of the full buffer & emit it
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(contig)
+                    continue
+                i = int(rng.integers(len(buffer)))
+                buffer[i], contig = contig, buffer[i]
+            batch.append(contig)
+            if len(batch) == self.batch_size:
+                yield collate(batch)
+                batch = []
+        rng.shuffle(buffer)
+        for contig in buffer:
+            batch.append(contig)
+            if len(batch) == self.batch_size:
+                yield collate(batch)
+                batch = []
+        if batch:
+            yield collate(batch)
+
+
+def collate(contigs: List[Dict]) -> Dict[str, List]:
+    """Turns a list of contigs into a dict of lists
+    """
+    return {key: [contig[key] for contig in contigs] for key in contigs[0]}
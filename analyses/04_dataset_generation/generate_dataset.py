@@ -1,25 +1,45 @@
 import os
+import sys
+import json
 import yaml
-import gzip
+import shutil
 import logging
 from pathlib import Path
 from tqdm import tqdm
 from typing import List, Dict, Tuple
 import hydra
+from hydra.core.hydra_config import HydraConfig
 from omegaconf import DictConfig, OmegaConf
 import multiprocessing
 import math
-import random
-from itertools import groupby
+import hashlib
 from functools import partial
+from types import SimpleNamespace
 import numpy as np
 import pandas as pd
-from Bio.Seq import Seq
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).resolve().parents[1])) # analyses/
+from common.fasta import read_fasta
+from common.genome_store import GenomeStore, find_n_runs
+from common.schedule import genome_cost, scheduled_imap
+from common.metrics import NO_METRICS, GenomeMetrics, MetricsWriter
+from common.prefetch import ReadAhead
+from common.sequence import extract_windows, decode_windows
+from window_sampler import WeightedWindowSampler, exclude_runs, longest_gap
+from tokenized import TokenizedShardWriter, write_tables
 
 
 log = logging.getLogger(__name__)
 
 
+def stable_hash(key: str) -> int:
+    """64-bit hash of a string, stable across processes & machines (unlike hash()).
+    """
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], 'little')
+
+
 class GenomeSampler():
     """Initializes the GenomeSampler.
 
@@ -31,41 +51,43 @@ class GenomeSampler():
         self.max_len = cfg.dataset.max_len
         self.expected_contig_len = (self.min_len + self.max_len)/2 # for coverage-based sampling
         self.decay = cfg.dataset.decay
+        self.block_size = cfg.dataset.get("block_size", 256) # block size of WeightedWindowSampler
+        self.seed = cfg.process.seed
+        # Packed genome store built by build_genome_store.py (optional)
+        genome_store = cfg.paths.get("genome_store")
+        self.store = GenomeStore(genome_store) if genome_store else None
         # self.plasmid_action = cfg.dataset.plasmid_action
         # self.plasmid_label_name = cfg.dataset.plasmid_label_name
 
-    def parse_fasta(self, file_path: Path) -> Dict[str, List]:
+    def parse_fasta(self, file_path: Path, metrics=NO_METRICS) -> Dict[str, List]:
         """Parses a FASTA file and handles plasmid logic.
 
         Args:
             file_path (Path): Path to the gzipped FASTA file.
+            metrics (GenomeMetrics): Timings of read, decompress & parse (optional).
 
         Returns:
             Dict[str, List]: A dictionary where keys are sequence IDs and values are 
-            lists containing [sequence_string, probability_map, is_plasmid_flag].
+            lists containing [sequence (uint8 array), probability_map, is_plasmid_flag, n_runs].
+            probability_map is a WeightedWindowSampler & n_runs is a sorted (n_runs, 2) array 
+            of [start, end) of 'N' runs.
         """
         seqdict = {}
         try:
-            with gzip.open(file_path, 'rt') as f:
-                fasta_iter = (x[1] for x in groupby(f, key=lambda line: line[0] == ">"))
-                
-                for header_obj in fasta_iter:
-                    header_line = str(header_obj.__next__()).strip()
-                    header_id = header_line[1:].split()[0] # e.g. ">NC_000913.3 Escherichia coli..." -> "NC_000913.3"
-                    
-                    seq_lines = fasta_iter.__next__()
-                    seq = "".join(s.strip() for s in seq_lines)
-
-                    # # Plasmid Check
-                    # is_plasmid = "plasmid" in header_line.lower()
-                    # if is_plasmid:
-                    #     if self.plasmid_action == "exclude":
-                    #         continue # Skip
-                    #     elif self.plasmid_action == "separate_label":
-                    #         seqdict[header_id] = [seq, np.ones(len(seq)), True] # ?
-                    #         continue
-                
-                    seqdict[header_id] = [seq, np.ones(len(seq)), False] # sequence, prob. map, is_plasmid
+            for header_line, seq in read_fasta(file_path, metrics):
+                header_id = header_line.split()[0] # e.g. "NC_000913.3 Escherichia coli..." -> "NC_000913.3"
+
+                # # Plasmid Check
+                # is_plasmid = "plasmid" in header_line.lower()
+                # if is_plasmid:
+                #     if self.plasmid_action == "exclude":
+                #         continue # Skip
+                #     elif self.plasmid_action == "separate_label":
+                #         seqdict[header_id] = [seq, np.ones(len(seq)), True] # ?
+                #         continue
+
+                seq = np.frombuffer(seq, dtype=np.uint8)
+                seqdict[header_id] = [seq, self.new_prob_map(len(seq)), False, find_n_runs(seq)] # sequence, prob. map, is_plasmid, N runs
 
         except Exception as e:
             log.warning(f"Error parsing {file_path}: {e}")
@@ -73,103 +95,397 @@ class GenomeSampler():
 
         return seqdict
 
+    def new_prob_map(self, length: int) -> WeightedWindowSampler:
+        """Initializes sampling probability map of a contig.
+        """
+        return WeightedWindowSampler(length, self.decay, self.block_size)
+
+    def load_genome(self, row: Tuple, metrics=NO_METRICS) -> Dict[str, List]:
+        """Loads a genome from the genome store if available, otherwise from its FASTA file.
+
+        Args:
+            row (Tuple): A row from the manifest DataFrame
+            metrics (GenomeMetrics): Timings of read, decompress & parse (optional).
+
+        Returns:
+            Dict[str, List]: Same structure as parse_fasta. Sequences from the 
+            genome store are zero-copy views into the memory-mapped blob.
+        """
+        accession = getattr(row, "accession")
+        if self.store is not None and accession in self.store:
+            return {
+                header_id: [seq, self.new_prob_map(len(seq)), False, n_runs] 
+                for header_id, (seq, n_runs) in self.store.get_genome(accession).items()
+            }
+        return self.parse_fasta(getattr(row, "local_file_path"), metrics)
+
+    def genome_rng(self, accession: str, split: str = "") -> np.random.Generator:
+        """Random generator seeded from (global seed, accession, split).
+        Sampling of a genome does not depend on worker count, scheduling or sharding.
+        """
+        return np.random.default_rng([self.seed, stable_hash(accession), stable_hash(split)])
+
+    def reset_prob_maps(self, record_dict: Dict[str, List]) -> Dict[str, List]:
+        """Returns a genome sharing sequences of record_dict with fresh probability maps, 
+        so that each split sampled from one loaded genome has its own decay state.
+        """
+        return {
+            key: [value[0], self.new_prob_map(len(value[0]))] + value[2:] 
+            for key, value in record_dict.items()
+        }
+
     def sample_from_genome(
             self, 
             row: Tuple, 
-            num_contigs: int
+            num_contigs: int, 
+            record_dict: Dict[str, List] = None, 
+            rng: np.random.Generator = None
     ) -> pd.DataFrame:
         """Samples contigs from a genome based on target coverage.
 
         Args:
             row (Tuple): A row from the manifest DataFrame
             num_contigs (int): Number of contigs to generate
+            record_dict (Dict[str, List]): Genome already loaded by load_genome (optional). 
+                Its probability maps are decayed in place.
+            rng (np.random.Generator): Random generator (default: genome_rng(accession))
 
         Returns:
             pd.DataFrame: A DataFrame containing generated contigs 
             with columns ['sequence', 'label', 'local_file_path'].
         """
+        return contigs_to_dataframe(row, *self.sample_contigs(row, num_contigs, record_dict, rng))
+
+    def sample_contigs(
+            self, 
+            row: Tuple, 
+            num_contigs: int, 
+            record_dict: Dict[str, List] = None, 
+            rng: np.random.Generator = None, 
+            metrics=NO_METRICS
+    ) -> Tuple[List[Tuple], np.ndarray, np.ndarray]:
+        """Samples contigs from a genome as in sample_from_genome, without building strings.
+        Attempts & rejected draws are counted in metrics (sample_attempts & sample_rejections).
+        A draw of a length without any N-free window center on the drawn contig is rejected & redrawn,
+        sampling stops after num_contigs*5 rejected draws (accepted draws always yield a contig).
+
+        Returns:
+            Tuple[List[Tuple], np.ndarray, np.ndarray]: (header, start, stop, strand) of each contig, 
+            & uint8 sequences of contigs with their offsets (see extract_windows).
+        """
         path = getattr(row, "local_file_path")
 
-        record_dict = self.parse_fasta(path)
+        if record_dict is None:
+            record_dict = self.load_genome(row)
+        if rng is None:
+            rng = self.genome_rng(getattr(row, "accession"))
         contig_list = []
-        keys = list(record_dict.keys())
+        # Longest N-free stretch of each contig, contigs without any valid window are never drawn
+        free_lens = {key: longest_gap(len(value[0]), value[3]) for key, value in record_dict.items()}
+        keys = [key for key, free_len in free_lens.items() if free_len >= self.min_len]
+        if not keys:
+            log.warning(f"No contig without N longer than {self.min_len} in {path}.")
+            return contig_list, np.empty(0, dtype=np.uint8), np.zeros(1, dtype=np.int64)
         attempts = 0
+        redraws = 0
         
         # Sampling
         while len(contig_list) < num_contigs:
-            attempts += 1
-            if attempts > num_contigs*5:
+            if redraws >= num_contigs*5:
                 log.warning(
-                    f"Max attempts reached for {path}. \
-                    Generated {len(contig_list)}/{num_contigs*5}"
+                    f"Max rejected draws reached for {path}. \
+                    Generated {len(contig_list)}/{num_contigs}"
                 )
                 break
 
-            seq_id = random.choice(keys)
+            seq_id = keys[rng.integers(len(keys))]
             seq_data = record_dict[seq_id]
             
-            genome = Seq(seq_data[0])
+            genome = seq_data[0]
             genome_len = len(genome)
             prob_map = seq_data[1]
             # is_plasmid = seq_data[2]
-            
-            if genome_len < self.min_len: # ?
-                continue
+            n_runs = seq_data[3]
 
-            # Sample contig length
-            sample_len = random.randint(self.min_len, min(genome_len, self.max_len))
+            # Sample contig length (windows longer than the longest N-free stretch always contain N)
+            sample_len = int(rng.integers(self.min_len, min(free_lens[seq_id], self.max_len), endpoint=True))
             half_len = sample_len/2
             
             # Sample start index
             min_idx = math.floor(half_len)
             max_idx = genome_len - math.ceil(half_len)
             
-            if min_idx >= max_idx:
+            if min_idx >= max_idx: # whole contig, N-free as sample_len <= longest N-free stretch
                 start = 0
                 stop = genome_len
             else:
+                # Centers of windows without N, computed from N runs instead of slicing & upper-casing contigs
+                starts, stops = exclude_runs(min_idx, max_idx, n_runs, math.floor(half_len), math.ceil(half_len))
+                if len(starts) == 0: # only N-free window ends at contig end, outside of center range
+                    redraws += 1
+                    continue
+
                 # 確率マップに基づいて中心点を選択
-                reg_factor = np.sum(prob_map[min_idx:max_idx])
-                p_dist = prob_map[min_idx:max_idx]/reg_factor
-                
-                base_idx = np.random.choice(range(min_idx, max_idx), p=p_dist)
+                base_idx = prob_map.sample_intervals(starts, stops, rng)
                 start = base_idx - math.floor(half_len)
                 stop = base_idx + math.ceil(half_len)
 
-            # 3. Generate contig from genome
-            contig = genome[start:stop]
-
-            strand = "+"
-            original_start = start
-            original_end = stop
-
-            # Skip if contig contain "N"
-            if "N" in contig.upper():
-                continue
+            attempts += 1
 
-            # Reverse Complement
-            if random.random() < 0.5:
-                contig = contig.reverse_complement()
-                strand = "-" # If reversed, make strand "-"
+            # Reverse Complement (applied in batch by extract_windows)
+            strand = "-" if rng.random() < 0.5 else "+" # If reversed, make strand "-"
             
             # Decay probability
-            prob_map[start:stop] *= self.decay
+            prob_map.decay_range(start, stop)
             
             # 4. ラベル決定
             # if is_plasmid and self.plasmid_action == "separate_label":
             #     label_id = self.plasmid_label_id
             
-            contig_list.append({
-                "sequence": str(contig),
-                "label": getattr(row, 'species'),
-                "local_file_path": str(path), 
-                "header": seq_id, 
-                "start": original_start, 
-                "end": original_end, 
-                "strand": strand
-            })
+            contig_list.append((seq_id, start, stop, strand))
 
-        return pd.DataFrame(contig_list)
+        metrics.add("sample_attempts", attempts)
+        metrics.add("sample_rejections", redraws)
+
+        # 3. Generate contigs from genome
+        buffer, offsets = extract_windows({key: value[0] for key, value in record_dict.items()}, contig_list)
+        return contig_list, buffer, offsets
+
+
+def contigs_to_dataframe(row: Tuple, windows: List[Tuple], buffer: np.ndarray, offsets: np.ndarray) -> pd.DataFrame:
+    """Builds the Parquet rows of contigs sampled by GenomeSampler.sample_contigs
+    """
+    seq_ids, contig_starts, contig_stops, strands = zip(*windows) if windows else ((), (), (), ())
+    return pd.DataFrame({
+        "sequence": decode_windows(buffer, offsets),
+        "label": getattr(row, 'species'),
+        "local_file_path": str(getattr(row, "local_file_path")), 
+        "header": list(seq_ids), 
+        "start": list(contig_starts), 
+        "end": list(contig_stops), 
+        "strand": list(strands)
+    })
+
+
+# Columns of Parquet shards (fixed, so that a shard without contigs is written with the same schema)
+CONTIG_SCHEMA = pa.schema([
+    ("sequence", pa.string()), 
+    ("label", pa.string()), 
+    ("local_file_path", pa.string()), 
+    ("header", pa.string()), 
+    ("start", pa.int64()), 
+    ("end", pa.int64()), 
+    ("strand", pa.string()), 
+])
+
+
+class ParquetShardWriter():
+    """Writes contigs of a shard into a Parquet file, one row group per genome.
+    The file is written to a temporary path & renamed when closed.
+    A shard without contigs is written as an empty file, so that a resumed run skips it.
+
+    Args:
+        out_dir (Path): Parquet dataset directory
+        name (str): Name of the shard
+    """
+    def __init__(self, out_dir: Path, name: str):
+        self.path = out_dir/f"{name}.parquet"
+        self.tmp_path = out_dir/f".{name}.parquet.tmp"
+        self.writer = None
+        self.n_contigs = 0
+
+    def write(self, row: Tuple, windows: List[Tuple], buffer: np.ndarray, offsets: np.ndarray):
+        """Appends contigs sampled from a genome.
+        """
+        if not windows:
+            return
+        table = pa.Table.from_pandas(
+            contigs_to_dataframe(row, windows, buffer, offsets), schema=CONTIG_SCHEMA, preserve_index=False
+        )
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, CONTIG_SCHEMA)
+        self.writer.write_table(table)
+        self.n_contigs += len(windows)
+
+    def close(self, commit: bool = True):
+        """Closes the file & moves it into place.
+        """
+        if self.writer is None:
+            if not commit:
+                return
+            self.writer = pq.ParquetWriter(self.tmp_path, CONTIG_SCHEMA) # empty shard
+        self.writer.close()
+        if commit:
+            os.replace(self.tmp_path, self.path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+
+
+# Output formats of dataset.output_format
+SHARD_WRITERS = {
+    "parquet": ParquetShardWriter, 
+    "tokenized": TokenizedShardWriter, 
+}
+
+
+def num_contigs_of(coverage: float, max_genome_size: int, expected_contig_len: float) -> int:
+    """Contigs sampled per genome to reach coverage of the largest genome
+    """
+    total_bases = max_genome_size*coverage
+    return int(total_bases/expected_contig_len)
+
+
+def split_coverages(cfg) -> Dict[str, float]:
+    """Coverage of each generated split: train, validation & further named splits in dataset.splits
+    """
+    coverages = {"train": cfg.dataset.coverage_train, "validation": cfg.dataset.coverage_val}
+    for split, split_cfg in cfg.dataset.get("splits", {}).items():
+        coverages[split] = split_cfg.coverage
+    return coverages
+
+
+def labeled_genomes(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """Genomes of a manifest with a species label & the sorted label vocabulary.
+    Genomes without species (e.g. taxonomy that could not be split) cannot be labeled & are dropped.
+    """
+    unlabeled = df["species"].isna()
+    if unlabeled.any():
+        log.warning(f"Dropping {int(unlabeled.sum())} genomes without species label.")
+        df = df[~unlabeled]
+    return df, sorted(df["species"].dropna().unique())
+
+
+def shard_name(shard_idx: int, node_shard: Tuple[int, int] = (0, 1)) -> str:
+    """Name of an output shard, prefixed by the node shard (i/N) producing it
+    """
+    return f"part-{node_shard[0]:03d}of{node_shard[1]:03d}-{shard_idx:05d}"
+
+
+def file_digest(path: Path, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file (e.g. the manifest), read in blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def generation_options(cfg, coverage: float, num_contigs: int, manifest_digest: str) -> Dict:
+    """Parameters & manifest changing the output shards of a split, recorded next to them (see resume_split)
+    """
+    return {
+        "manifest_sha256": manifest_digest, 
+        "seed": cfg.process.seed, 
+        "min_len": cfg.dataset.min_len, 
+        "max_len": cfg.dataset.max_len, 
+        "decay": cfg.dataset.decay, 
+        "block_size": cfg.dataset.get("block_size", 256), 
+        "coverage": coverage, 
+        "num_contigs": num_contigs, 
+        "genomes_per_shard": cfg.process.get("genomes_per_shard", 64), 
+        "output_format": cfg.dataset.get("output_format", "parquet"), 
+    }
+
+
+def resume_split(out_dir: Path, options: Dict, node_shard: Tuple[int, int] = (0, 1)) -> set:
+    """Completed shards of a split written by an interrupted run of the node shard with the same options.
+
+    Options are recorded in generation-<i>of<N>.json of the split directory. 
+    Shards written with other options (or without record) are removed, so that they are generated again.
+
+    Args:
+        out_dir (Path): Output dataset directory of the split
+        options (Dict): Options of the current run (see generation_options)
+        node_shard (Tuple[int, int]): Node shard (i, N) of the run
+
+    Returns:
+        set: Names of completed shards
+    """
+    record_path = out_dir/f"generation-{node_shard[0]:03d}of{node_shard[1]:03d}.json"
+    shards = list(out_dir.glob(f"part-{node_shard[0]:03d}of{node_shard[1]:03d}-*"))
+    recorded = None
+    if record_path.exists():
+        with open(record_path) as f:
+            recorded = json.load(f)
+    if recorded != options:
+        if shards:
+            log.warning(f"Removing {len(shards)} shards of {out_dir} written with other options ({record_path.name})")
+        for path in shards:
+            if path.is_dir(): # tokenized shard
+                shutil.rmtree(path)
+            else:
+                path.unlink()
+        shards = []
+        tmp_path = record_path.with_name(f".{record_path.name}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(options, f, indent=2)
+        os.replace(tmp_path, record_path)
+    return {p.name.split('.')[0] for p in shards}
+
+
+def parse_node_shard(shard: str) -> Tuple[int, int]:
+    """Parses "i/N" into (i, N)
+    """
+    i, n = (int(x) for x in str(shard).split('/'))
+    if not 0 <= i < n:
+        raise ValueError(f"Invalid shard {shard}, expected i/N with 0 <= i < N")
+    return i, n
+
+
+def write_shard(
+        shard: Tuple[int, List], 
+        sampler: GenomeSampler, 
+        splits: Dict[str, Tuple[int, Path]], 
+        node_shard: Tuple[int, int] = (0, 1), 
+        output_format: str = "parquet"
+) -> Dict:
+    """Samples contigs of all splits from a shard of genomes & writes them into one output shard per split.
+
+    Each genome is loaded once & every split is sampled from it with its own decay state.
+    Contigs are written genome by genome, so a worker holds one genome's contigs at a time.
+    Outputs are written to temporary paths & renamed when the shard is complete.
+
+    Args:
+        shard (Tuple[int, List]): Shard index & rows of the manifest
+        sampler (GenomeSampler): Sampler
+        splits (Dict[str, Tuple[int, Path]]): Split name -> (contigs per genome, output dataset directory)
+        node_shard (Tuple[int, int]): Node shard (i, N) of the run, used in file names
+        output_format (str): "parquet" or "tokenized" (see SHARD_WRITERS)
+
+    Returns:
+        Dict: Summary of the shard, with per-genome metrics records
+    """
+    shard_idx, rows = shard
+    name = shard_name(shard_idx, node_shard)
+    summary = {"shard": name, "genomes": len(rows), "metrics": []}
+    summary.update({split: {"contigs": 0, "bases": 0} for split in splits})
+    writers = {split: SHARD_WRITERS[output_format](out_dir, name) for split, (_, out_dir) in splits.items()}
+    completed = False
+    try:
+        for row in rows:
+            metrics = GenomeMetrics("sample", getattr(row, "accession"))
+            record_dict = sampler.load_genome(row, metrics)
+            for split, (num_contigs, out_dir) in splits.items():
+                with metrics.phase("sample"):
+                    windows, buffer, offsets = sampler.sample_contigs(
+                        row, num_contigs, 
+                        sampler.reset_prob_maps(record_dict), 
+                        sampler.genome_rng(getattr(row, "accession"), split), 
+                        metrics
+                    )
+                with metrics.phase("write"):
+                    writers[split].write(row, windows, buffer, offsets)
+                metrics.add("contigs_out", len(windows))
+                metrics.add("bytes_out", int(offsets[-1]))
+                summary[split]["contigs"] += len(windows)
+                summary[split]["bases"] += int(offsets[-1])
+            summary["metrics"].append(metrics.record())
+        completed = True
+    finally:
+        for writer in writers.values():
+            writer.close(commit=completed)
+    return summary
 
 
 @hydra.main(version_base=None, config_path="config", config_name="config")
@@ -177,9 +493,9 @@ def main(cfg: DictConfig):
     log.info(f"Start Dataset Generation in: {os.getcwd()}")
     log.info(f"Config:\n{OmegaConf.to_yaml(cfg)}")
     
-    # 0. Fix seed
-    random.seed(cfg.process.seed)
-    np.random.seed(cfg.process.seed)
+    # 0. Seed: each genome & split draws from its own generator seeded by 
+    # (process.seed, accession, split), see GenomeSampler.genome_rng
+    node_shard = parse_node_shard(cfg.process.get("shard", "0/1"))
 
     # 1. Load manifest
     manifest_path = Path(cfg.paths.manifest)
@@ -189,44 +505,92 @@ def main(cfg: DictConfig):
 
     df = pd.read_csv(manifest_path)
     log.info(f"Loaded manifest with {len(df)} genomes.")
+    df, labels = labeled_genomes(df)
+
+    # Genome sizes over the whole manifest, so that all node shards sample the same number of contigs
+    max_genome_size = df["genome_size"].max()
+
+    # Genome & label ids over the whole manifest, shared by all splits & node shards
+    output_format = cfg.dataset.get("output_format", "parquet")
+    if output_format not in SHARD_WRITERS:
+        log.error(f"Unknown output format {output_format}, expected one of {list(SHARD_WRITERS)}")
+        return
+    df = df.assign(genome_id=np.arange(len(df)), label_id=df["species"].map({l: i for i, l in enumerate(labels)}))
+    df_genomes = df[["genome_id", "accession", "local_file_path", "label_id"]]
+
+    # 2. Hash partition of manifest for distributed generation (process.shard="i/N")
+    if node_shard[1] > 1:
+        in_shard = df["accession"].map(lambda acc: stable_hash(acc)%node_shard[1] == node_shard[0])
+        df = df[in_shard]
+        log.info(f"Shard {node_shard[0]}/{node_shard[1]}: {len(df)} genomes.")
 
     # 3. Worker
     sampler = GenomeSampler(cfg)
-    tasks = list(df.itertuples(index=False)) # df is slow by Picklization
+    tasks = [SimpleNamespace(**r) for r in df.to_dict('records')] # itertuples() rows cannot be pickled
 
     # Calculate num_contigs
-    max_genome_size = df["genome_size"].max()
-
     def calculate_num_contigs(coverage: float):
-        total_bases = max_genome_size*coverage
-        return int(total_bases/sampler.expected_contig_len)
+        return num_contigs_of(coverage, max_genome_size, sampler.expected_contig_len)
     
-    num_contigs_train = calculate_num_contigs(cfg.dataset.coverage_train)
-    num_contigs_val = calculate_num_contigs(cfg.dataset.coverage_val)
-
-    # 4. Generate training & validation dataset
-    def run_generation(tasks, num_contigs, mode):
-        """
-        Wrapper function for multiprocessing
-        """
-        log.info(f"Generating {mode} dataset (Contigs={num_contigs})...")
-        func = partial(sampler.sample_from_genome, num_contigs=num_contigs)
-        with multiprocessing.Pool(cfg.process.num_workers) as p:
-            results = list(tqdm(p.imap(func, tasks), total=len(tasks), desc=mode))
-        df_result = pd.concat(results, ignore_index=True)
-        return df_result
-
-    # Training dataset
-    df_train = run_generation(tasks, num_contigs_train, "Train")
-    out_train = Path(cfg.paths.out_train)
-    df_train.to_parquet(out_train, index=False)
-    log.info(f"Train dataset saved: {out_train} (shape: {df_train.shape})")
-
-    # Validation dataset
-    df_val = run_generation(tasks, num_contigs_val, "Validation")
-    out_val = Path(cfg.paths.out_val)
-    df_val.to_parquet(out_val, index=False)
-    log.info(f"Validation dataset saved: {out_val} (shape: {df_val.shape})")
+    # Splits: train & validation, plus further named splits in dataset.splits 
+    # e.g. dataset.splits={test: {coverage: 1.0, out: /path/to/test.parquet}}
+    out_dirs = {"train": Path(cfg.paths.out_train), "validation": Path(cfg.paths.out_val)}
+    for split, split_cfg in cfg.dataset.get("splits", {}).items():
+        out_dirs[split] = Path(split_cfg.out)
+    splits = {
+        split: (calculate_num_contigs(coverage), out_dirs[split]) for split, coverage in split_coverages(cfg).items()
+    }
+
+    # 4. Generate all splits in a single pass over genomes
+    genomes_per_shard = cfg.process.get("genomes_per_shard", 64)
+    shards = [
+        (shard_idx, tasks[start:start + genomes_per_shard]) 
+        for shard_idx, start in enumerate(range(0, len(tasks), genomes_per_shard))
+    ]
+
+    # Completed shards of an interrupted run with the same options & manifest are kept & skipped
+    done = None
+    manifest_digest = file_digest(manifest_path)
+    for split, (num_contigs, out_dir) in splits.items():
+        out_dir.mkdir(parents=True, exist_ok=True)
+        options = generation_options(cfg, split_coverages(cfg)[split], num_contigs, manifest_digest)
+        names = resume_split(out_dir, options, node_shard)
+        done = names if done is None else done & names
+        if output_format == "tokenized":
+            write_tables(out_dir, df_genomes, labels)
+        log.info(f"Split {split}: Contigs={num_contigs}, Output={out_dir}")
+    todo = [shard for shard in shards if shard_name(shard[0], node_shard) not in done]
+    log.info(f"Generating {len(splits)} splits (Shards={len(todo)}/{len(shards)})...")
+
+    # Workers write output shards & return only their summaries, largest shards first in adaptive chunks
+    func = partial(write_shard, sampler=sampler, splits=splits, node_shard=node_shard, output_format=output_format)
+    costs = [
+        genome_cost([row.genome_size for row in rows], [row.contig_count for row in rows]).sum() 
+        for _, rows in todo
+    ]
+    summary = {split: {"contigs": 0, "bases": 0} for split in splits}
+    metrics_writer = MetricsWriter(Path(HydraConfig.get().runtime.output_dir)/"metrics.jsonl")
+    # Optional read-ahead of genome files not in the genome store, e.g. 
+    # +process.read_ahead={genomes: 64, threads: 4, max_mb: 2048, scratch_dir: null} (see common.prefetch)
+    def genome_files(shard):
+        return [
+            row.local_file_path for row in shard[1] 
+            if sampler.store is None or row.accession not in sampler.store
+        ]
+    read_ahead = ReadAhead(genome_files, **cfg.process.get("read_ahead", {}))
+    with multiprocessing.Pool(cfg.process.num_workers) as p, read_ahead, metrics_writer:
+        imap = scheduled_imap(
+            p, func, todo, costs, cfg.process.num_workers, 
+            max_in_flight=cfg.process.get("max_in_flight"), read_ahead=read_ahead
+        )
+        for result in tqdm(imap, total=len(todo)):
+            metrics_writer.write_all(result["metrics"])
+            for split in splits:
+                summary[split]["contigs"] += result[split]["contigs"]
+                summary[split]["bases"] += result[split]["bases"]
+
+    for split, (_, out_dir) in splits.items():
+        log.info(f"{split} dataset saved: {out_dir} ({summary[split]})")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import os
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+
+# Vocabulary of HyenaDNA CharacterTokenizer(characters=['A', 'C', 'G', 'T', 'N'])
+# (external/hyena-dna/src/dataloaders/datasets/hg38_char_tokenizer.py)
+SPECIAL_TOKENS = ["[CLS]", "[SEP]", "[BOS]", "[MASK]", "[PAD]", "[RESERVED]", "[UNK]"]
+CHARACTERS = ["A", "C", "G", "T", "N"]
+UNK_ID = SPECIAL_TOKENS.index("[UNK]")
+
+
+def _token_table() -> np.ndarray:
+    """uint8 lookup table from ASCII to token ids. Lowercase (soft-masked) bases map to their uppercase ids.
+    """
+    table = np.full(256, UNK_ID, dtype=np.uint8)
+    for i, char in enumerate(CHARACTERS):
+        table[ord(char)] = table[ord(char.lower())] = len(SPECIAL_TOKENS) + i
+    table.flags.writeable = False
+    return table
+
+
+TOKEN_IDS = _token_table()
+
+
+def tokenize(buffer: np.ndarray) -> np.ndarray:
+    """Converts a uint8 (ASCII) buffer into token ids.
+    """
+    return TOKEN_IDS[buffer]
+
+
+def write_tables(out_dir: Path, df_genomes: pd.DataFrame, labels: List[str]):
+    """Writes genome table & label vocabulary shared by all shards of a split.
+
+    Args:
+        out_dir (Path): Directory of the tokenized dataset
+        df_genomes (pd.DataFrame): Genome table with columns ['genome_id', 'accession', 'local_file_path', 'label_id']
+        labels (List[str]): Label (species) of each label id
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_dir/".genomes.parquet.tmp"
+    df_genomes.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, out_dir/"genomes.parquet")
+    tmp_path = out_dir/".labels.tsv.tmp"
+    pd.DataFrame({"label_id": range(len(labels)), "label": labels}).to_csv(tmp_path, sep='\t', index=False)
+    os.replace(tmp_path, out_dir/"labels.tsv")
+    tmp_path = out_dir/".vocab.json.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"special_tokens": SPECIAL_TOKENS, "characters": CHARACTERS}, f, indent=2)
+    os.replace(tmp_path, out_dir/"vocab.json")
+
+
+class TokenizedShardWriter():
+    """Writes contigs of a shard as token ids in a flat, memory-mappable layout.
+
+    Layout of out_dir/<name>/:
+        tokens.bin      uint8 token ids of all contigs, concatenated
+        offsets.npy     int64 (n+1), contig i is tokens[offsets[i]:offsets[i+1]]
+        genome_id.npy   int32, row of genomes.parquet
+        label_id.npy    int32, row of labels.tsv
+        contig_id.npy   int32, row of contigs.parquet (source contig header)
+        start.npy, end.npy  int64, window on the source contig
+        strand.npy      int8, 1 for '+' & -1 for '-'
+        contigs.parquet genome_id & header of source contigs
+
+    The shard is written into a temporary directory & renamed when closed.
+
+    Args:
+        out_dir (Path): Directory of the tokenized dataset
+        name (str): Name of the shard
+    """
+    def __init__(self, out_dir: Path, name: str):
+        self.out_dir = Path(out_dir)
+        self.path = self.out_dir/name
+        self.tmp_path = self.out_dir/f".{name}.tmp"
+        if self.tmp_path.exists():
+            shutil.rmtree(self.tmp_path)
+        self.tmp_path.mkdir(parents=True)
+        self._tokens = open(self.tmp_path/"tokens.bin", 'wb')
+        self.n_tokens = 0
+        self.columns = {col: [] for col in ["offsets", "genome_id", "label_id", "contig_id", "start", "end", "strand"]}
+        self.contigs = {} # (genome_id, header) -> contig_id
+        self.n_contigs = 0
+
+    def write(self, row, windows: List[Tuple[str, int, int, str]], buffer: np.ndarray, offsets: np.ndarray):
+        """Appends contigs sampled from a genome.
+
+        Args:
+            row: A row of the manifest with genome_id & label_id
+            windows (List[Tuple[str, int, int, str]]): (header, start, stop, strand) of each contig
+            buffer (np.ndarray): uint8 (ASCII) sequences of contigs from extract_windows
+            offsets (np.ndarray): Offsets of contigs in buffer
+        """
+        if not windows:
+            return
+        genome_id = getattr(row, "genome_id")
+        self._tokens.write(tokenize(buffer).tobytes())
+        self.columns["offsets"].append(offsets[:-1] + self.n_tokens)
+        self.n_tokens += int(offsets[-1])
+        self.columns["genome_id"].append(np.full(len(windows), genome_id, dtype=np.int32))
+        self.columns["label_id"].append(np.full(len(windows), getattr(row, "label_id"), dtype=np.int32))
+        contig_ids = [self.contigs.setdefault((genome_id, header), len(self.contigs)) for header, _, _, _ in windows]
+        self.columns["contig_id"].append(np.asarray(contig_ids, dtype=np.int32))
+        self.columns["start"].append(np.asarray([w[1] for w in windows], dtype=np.int64))
+        self.columns["end"].append(np.asarray([w[2] for w in windows], dtype=np.int64))
+        self.columns["strand"].append(np.asarray([1 if w[3] == "+" else -1 for w in windows], dtype=np.int8))
+        self.n_contigs += len(windows)
+
+    def close(self, commit: bool = True):
+        """Writes metadata arrays & moves the shard into place.
+
+        Args:
+            commit (bool): Move the shard into place. If False, the temporary shard is removed.
+        """
+        self._tokens.close()
+        if not commit:
+            shutil.rmtree(self.tmp_path)
+            return
+        dtypes = {"offsets": np.int64, "genome_id": np.int32, "label_id": np.int32, "contig_id": np.int32,
+                  "start": np.int64, "end": np.int64, "strand": np.int8}
+        for col, chunks in self.columns.items():
+            values = np.concatenate(chunks) if chunks else np.empty(0, dtype=dtypes[col])
+            if col == "offsets":
+                values = np.append(values, self.n_tokens)
+            np.save(self.tmp_path/f"{col}.npy", values.astype(dtypes[col]))
+        pd.DataFrame(
+            [(genome_id, header) for genome_id, header in self.contigs], columns=["genome_id", "header"]
+        ).to_parquet(self.tmp_path/"contigs.parquet", index=False)
+        if self.path.exists(): # rerun of a shard
+            shutil.rmtree(self.path)
+        os.replace(self.tmp_path, self.path)
+
+
+class TokenizedContigDataset():
+    """Random access to a tokenized dataset written by TokenizedShardWriter.
+
+    Token ids are returned as zero-copy views of memory-mapped shards,
+    so it can be wrapped by a torch Dataset without any parsing.
+
+    Args:
+        data_dir (Path): Directory of the tokenized dataset
+    """
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        self.shard_paths = sorted(p for p in self.data_dir.glob("part-*") if p.is_dir())
+        self.tokens, self.offsets, self.label_id = [], [], []
+        for path in self.shard_paths:
+            offsets = np.load(path/"offsets.npy", mmap_mode='r')
+            self.offsets.append(offsets)
+            self.tokens.append(
+                np.memmap(path/"tokens.bin", dtype=np.uint8, mode='r') if offsets[-1] > 0
+                else np.empty(0, dtype=np.uint8)
+            )
+            self.label_id.append(np.load(path/"label_id.npy", mmap_mode='r'))
+        self.cum_sizes = np.cumsum([0] + [len(offsets) - 1 for offsets in self.offsets])
+        self.labels = pd.read_csv(self.data_dir/"labels.tsv", sep='\t')["label"].tolist()
+
+    def __len__(self) -> int:
+        return int(self.cum_sizes[-1])
+
+    def __getitem__(self, idx: int) -> Dict:
+        if idx < 0:
+            idx += len(self)
+        shard = int(np.searchsorted(self.cum_sizes, idx, side='right')) - 1
+        i = idx - self.cum_sizes[shard]
+        offsets = self.offsets[shard]
+        return {
+            "input_ids": self.tokens[shard][offsets[i]:offsets[i + 1]],
+            "label": int(self.label_id[shard][i]),
+        }
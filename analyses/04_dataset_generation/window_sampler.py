@@ -0,0 +1,252 @@
+from functools import lru_cache
+import numpy as np
+
+
+REBUILD_CHUNK = 1 << 20 # positions per chunk when recomputing block sums
+
+
+@lru_cache(maxsize=None)
+def decay_table(decay: float, max_count: int) -> np.ndarray:
+    """Weight of a position sampled k times, decay**k for k in [0, max_count].
+    Shared by all samplers with the same decay.
+    """
+    table = decay**np.arange(max_count + 1, dtype=np.float64)
+    table.flags.writeable = False
+    return table
+
+
+def count_dtype(decay: float):
+    """Smallest dtype of decay counts whose saturation weight is negligible (< 1e-12).
+    """
+    if decay**np.iinfo(np.uint8).max < 1e-12:
+        return np.uint8
+    return np.uint16
+
+
+def exclude_runs(lo: int, hi: int, runs: np.ndarray, left: int, right: int):
+    """Window centers in [lo, hi) whose window [center - left, center + right) 
+    does not overlap any run.
+
+    Args:
+        lo (int): First center of the range.
+        hi (int): End (exclusive) of the range.
+        runs (np.ndarray): Sorted, disjoint [start, end) runs of shape (n_runs, 2), e.g. N runs.
+        left (int): Window length left of the center.
+        right (int): Window length right of the center (center included).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: starts & stops (exclusive) of valid center ranges.
+    """
+    # a run [s, e) overlaps the window iff center is in [s - right + 1, e + left)
+    starts = np.concatenate([[lo], np.asarray(runs[:, 1]) + left]).clip(lo, hi)
+    stops = np.concatenate([np.asarray(runs[:, 0]) - right + 1, [hi]]).clip(lo, hi)
+    valid = starts < stops
+    return starts[valid], stops[valid]
+
+
+def longest_gap(length: int, runs: np.ndarray) -> int:
+    """Length of the longest stretch of [0, length) not covered by runs.
+    """
+    if len(runs) == 0:
+        return length
+    gaps = np.concatenate([[runs[0, 0]], runs[1:, 0] - runs[:-1, 1], [length - runs[-1, 1]]])
+    return int(gaps.max())
+
+
+class WeightedWindowSampler():
+    """Weighted sampler of positions on a contig with multiplicative decay of sampled ranges.
+
+    Equivalent to keeping a per-base probability map, drawing a position
+    in [lo, hi) with probability proportional to the map & multiplying
+    the map by decay over [start, stop) after each draw, but without
+    touching the whole map per draw.
+    Positions are grouped into blocks & block sums are kept in a Fenwick tree,
+    so a draw costs O(log(n/block_size) + block_size) (a draw from k ranges, e.g. between N runs,
+    takes O(log(n/block_size)) vector ops over its 2k bounds, see prefixes) & a decay update costs
+    O(stop - start + (stop - start)/block_size*log(n/block_size)).
+
+    The map is stored as per-base decay counts k (weight = decay**k) in
+    uint8/uint16 (see count_dtype) instead of float64, allocated on the first
+    decay. Counts saturate at the dtype maximum, where weights are negligible.
+
+    Args:
+        length (int): Length of the contig.
+        decay (float): Multiplicative decay applied to sampled ranges.
+        block_size (int): Number of positions per block.
+    """
+    def __init__(self, length: int, decay: float, block_size: int = 256):
+        self.length = length
+        self.decay = decay
+        self.block_size = block_size
+        self.n_blocks = max(1, -(-length//block_size))
+        self.dtype = count_dtype(decay)
+        self.max_count = int(np.iinfo(self.dtype).max)
+        self.counts = None # allocated on the first decay
+        self._rebuild()
+
+    def weights(self, start: int, stop: int) -> np.ndarray:
+        """Weights of positions [start, stop).
+        """
+        start, stop = max(start, 0), min(stop, self.length)
+        if self.counts is None:
+            return np.ones(max(stop - start, 0))
+        return decay_table(self.decay, self.max_count)[self.counts[start:stop]]
+
+    def _rebuild(self):
+        """Recomputes block sums & the Fenwick tree from decay counts.
+        Called periodically to discard floating point drift of incremental updates.
+        """
+        if self.counts is None:
+            self.block_sums = np.full(self.n_blocks, float(self.block_size))
+            self.block_sums[-1] = self.length - (self.n_blocks - 1)*self.block_size
+        else:
+            self.block_sums = np.empty(self.n_blocks)
+            chunk = max(1, REBUILD_CHUNK//self.block_size)*self.block_size
+            for start in range(0, self.length, chunk):
+                w = self.weights(start, start + chunk)
+                self.block_sums[start//self.block_size:(start + len(w) - 1)//self.block_size + 1] = \
+                    np.add.reduceat(w, np.arange(0, len(w), self.block_size))
+        # tree[i] (1-indexed) = sum of blocks (i - lowbit(i), i]
+        cumsum = np.concatenate([[0.0], np.cumsum(self.block_sums)])
+        idx = np.arange(1, self.n_blocks + 1)
+        self.tree = np.zeros(self.n_blocks + 1)
+        self.tree[1:] = cumsum[idx] - cumsum[idx - (idx & -idx)]
+        self.n_updates = 0
+
+    def _block_prefix(self, block: int) -> float:
+        """Sum of weights of blocks [0, block).
+        """
+        total = 0.0
+        while block > 0:
+            total += self.tree[block]
+            block &= block - 1
+        return total
+
+    def _block_add(self, block: int, delta: float):
+        """Adds delta to the sum of a block (0-indexed).
+        """
+        i = block + 1
+        while i <= self.n_blocks:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, idx: int) -> float:
+        """Sum of weights of positions [0, idx).
+        """
+        return float(self.prefixes(np.array([idx]))[0])
+
+    def prefixes(self, idx: np.ndarray) -> np.ndarray:
+        """Sums of weights of positions [0, idx[i]) for many indices at once (vectorized prefix).
+        The Fenwick tree is walked for all indices together (one vector op per tree level) 
+        & partial blocks are summed over a single gather of their rows of decay counts.
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        blocks, rems = np.divmod(idx, self.block_size)
+        totals = np.zeros(len(idx))
+        nodes = blocks.copy()
+        while nodes.any(): # tree[0] is 0
+            totals += self.tree[nodes]
+            nodes &= nodes - 1
+        partial = np.flatnonzero(rems)
+        if self.counts is None:
+            totals[partial] += rems[partial]
+            return totals
+        # Blocks never decayed have weights 1 (their sums are exact)
+        lengths = np.minimum(self.block_size, self.length - blocks[partial]*self.block_size)
+        decayed = self.block_sums[blocks[partial]] != lengths
+        totals[partial[~decayed]] += rems[partial[~decayed]]
+        partial = partial[decayed]
+        if len(partial) == 0:
+            return totals
+        # Rows of decay counts of partial blocks (counts are padded to whole blocks)
+        rows = self.counts.reshape(self.n_blocks, self.block_size)[blocks[partial]]
+        weights = decay_table(self.decay, self.max_count)[rows]
+        in_prefix = np.arange(self.block_size) < rems[partial][:, None]
+        totals[partial] += np.where(in_prefix, weights, 0.0).sum(axis=1)
+        return totals
+
+    def sample(self, lo: int, hi: int, rng=np.random) -> int:
+        """Draws a position in [lo, hi) with probability proportional to its weight.
+
+        Args:
+            lo (int): First position of the range.
+            hi (int): End (exclusive) of the range.
+            rng: Random generator providing random() (np.random or np.random.Generator).
+
+        Returns:
+            int: Sampled position.
+        """
+        return self.sample_intervals(np.array([lo]), np.array([hi]), rng)
+
+    def sample_intervals(self, starts: np.ndarray, stops: np.ndarray, rng=np.random) -> int:
+        """Draws a position from disjoint, sorted ranges [starts[i], stops[i]) 
+        with probability proportional to its weight.
+        Masses of all ranges come from one vectorized prefix lookup (see prefixes),
+        then the Fenwick tree is descended once to the drawn position.
+
+        Args:
+            starts (np.ndarray): First positions of the ranges.
+            stops (np.ndarray): Ends (exclusive) of the ranges.
+            rng: Random generator providing random() (np.random or np.random.Generator).
+
+        Returns:
+            int: Sampled position.
+        """
+        bounds = self.prefixes(np.concatenate([starts, stops]))
+        bases = bounds[:len(starts)]
+        masses = bounds[len(starts):] - bases
+        total = masses.sum()
+        if total <= 0: # all weights decayed to zero
+            lengths = stops - starts
+            offset = int(rng.random()*lengths.sum())
+            i = min(int(np.searchsorted(np.cumsum(lengths), offset, side='right')), len(lengths) - 1)
+            return int(starts[i] + offset - (lengths[:i].sum()))
+        u = rng.random()*total
+        cum_masses = np.cumsum(masses)
+        i = min(int(np.searchsorted(cum_masses, u, side='right')), len(masses) - 1)
+        target = bases[i] + u - (cum_masses[i] - masses[i])
+        lo, hi = int(starts[i]), int(stops[i])
+
+        # Descend the Fenwick tree to the block containing target
+        block, rem = 0, target
+        step = 1 << (self.n_blocks.bit_length() - 1)
+        while step:
+            nxt = block + step
+            if nxt <= self.n_blocks and self.tree[nxt] <= rem:
+                block = nxt
+                rem -= self.tree[nxt]
+            step >>= 1
+        block = min(block, self.n_blocks - 1)
+
+        # Linear search within the block
+        start = block*self.block_size
+        cumsum = np.cumsum(self.weights(start, start + self.block_size))
+        idx = start + int(np.searchsorted(cumsum, rem, side='right'))
+        return min(max(idx, lo), hi - 1)
+
+    def decay_range(self, start: int, stop: int):
+        """Multiplies weights of positions [start, stop) by decay.
+        """
+        start, stop = max(start, 0), min(stop, self.length)
+        if start >= stop or self.decay == 1:
+            return
+        if self.counts is None:
+            self.counts = np.zeros(self.n_blocks*self.block_size, dtype=self.dtype) # padded to whole blocks
+        counts = self.counts[start:stop]
+        counts[counts < self.max_count] += 1
+        first, last = start//self.block_size, (stop - 1)//self.block_size
+        for block in range(first, last + 1):
+            block_start = block*self.block_size
+            new_sum = self.weights(block_start, block_start + self.block_size).sum()
+            self._block_add(block, new_sum - self.block_sums[block])
+            self.block_sums[block] = new_sum
+        self.n_updates += last - first + 1
+        if self.n_updates > self.n_blocks:
+            self._rebuild()
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the probability map.
+        """
+        counts = 0 if self.counts is None else self.counts.nbytes
+        return counts + self.block_sums.nbytes + self.tree.nbytes
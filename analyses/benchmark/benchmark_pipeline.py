@@ -0,0 +1,380 @@
+import sys
+import gzip
+import json
+import time
+import resource
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime
+import logging
+import numpy as np
+import pandas as pd
+
+ANALYSES_DIR = Path(__file__).resolve().parents[1] # analyses/
+sys.path.append(str(ANALYSES_DIR))
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+log = logging.getLogger(__name__)
+
+
+STAGES = ["profile", "split", "manifest", "sample"]
+LINE_WIDTH = 80 # as NCBI genome FASTA
+TAX_RANKS = ["domain", "phylum", "class", "order", "family", "genus", "species"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark pipeline stages on a synthetic GTDB-like tree. "
+                    "Each stage runs serially in its own process & reports genomes/s, MB/s (megabases of genome sequence), "
+                    "contigs/s & peak RSS into a JSON file, comparable across commits with --baseline."
+    )
+    parser.add_argument("--data_dir", default="out/synthetic_gtdb", help="synthetic tree (reused if generated with the same parameters)")
+    parser.add_argument("--out", default=None, help="result JSON (default: out/benchmark_<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="result JSON of another commit to compare with")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    # synthetic tree
+    parser.add_argument("--n_genomes", type=int, default=100)
+    parser.add_argument("--min_genome_size", type=int, default=500_000)
+    parser.add_argument("--max_genome_size", type=int, default=8_000_000)
+    parser.add_argument("--max_contigs", type=int, default=200)
+    parser.add_argument("--plasmid_ratio", type=float, default=0.3, help="ratio of genomes with plasmids")
+    parser.add_argument("--n_runs_per_mb", type=float, default=5.0, help="N runs per megabase")
+    parser.add_argument("--archaea_ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    # stage parameters
+    parser.add_argument("--compression", default="gzip", choices=["gzip", "bgzf"], help="split outputs")
+    parser.add_argument("--min_len", type=int, default=1000, help="sampled contig length")
+    parser.add_argument("--max_len", type=int, default=10000, help="sampled contig length")
+    parser.add_argument("--coverage", type=float, default=1.0, help="sampling coverage")
+    # internal: run a single stage in a child process
+    parser.add_argument("--run_stage", default=None, choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--work_dir", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def synthetic_params(args):
+    """
+    Parameters defining the synthetic tree, stored next to it to decide whether it can be reused.
+
+    :param args: Arguments
+    """
+    keys = ["n_genomes", "min_genome_size", "max_genome_size", "max_contigs", "plasmid_ratio", "n_runs_per_mb", "archaea_ratio", "seed"]
+    return {key: getattr(args, key) for key in keys}
+
+
+def random_contig(rng, length, n_runs_per_mb):
+    """
+    Random sequence with runs of N.
+
+    :param rng: Random generator
+    :param length: Sequence length
+    :param n_runs_per_mb: Expected N runs per megabase
+    """
+    seq = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, length)]
+    for _ in range(rng.poisson(n_runs_per_mb*length/1e6)):
+        run = int(rng.integers(1, 200))
+        start = int(rng.integers(0, max(1, length - run)))
+        seq[start:start + run] = ord('N')
+    return seq
+
+
+def write_genome(path, rng, accession, genome_size, n_contigs, n_plasmids, n_runs_per_mb):
+    """
+    Write a gzipped synthetic genome & return its metadata stats.
+    The first contig is the chromosome, the last n_plasmids contigs are plasmids & others are WGS contigs.
+
+    :param path: Output path (.fna.gz)
+    :param rng: Random generator
+    :param accession: Accession without database prefix
+    :param genome_size: Total bases
+    :param n_contigs: Number of contigs
+    :param n_plasmids: Number of plasmid contigs (< n_contigs)
+    :param n_runs_per_mb: Expected N runs per megabase
+    """
+    # chromosome takes most of the genome, others share the rest
+    weights = np.concatenate([[n_contigs], rng.uniform(0.05, 1.0, n_contigs - 1)])
+    lengths = np.maximum(1, (genome_size*weights/weights.sum()).astype(np.int64))
+    stats = {"genome_size": int(lengths.sum()), "ambiguous_bases": 0}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, 'wb', compresslevel=6) as f:
+        for i, length in enumerate(lengths):
+            if i == 0:
+                header = f"NZ_CP{i:06d}.1 Synthetic organism {accession} chromosome, complete genome"
+            elif i >= n_contigs - n_plasmids:
+                header = f"NZ_CP{i:06d}.1 Synthetic organism {accession} plasmid p{i}, complete sequence"
+            else:
+                header = f"NZ_JA{i:06d}.1 Synthetic organism {accession} contig_{i}, whole genome shotgun sequence"
+            seq = random_contig(rng, int(length), n_runs_per_mb)
+            stats["ambiguous_bases"] += int((seq == ord('N')).sum())
+            f.write(f">{header}\n".encode())
+            f.write(b"".join(seq[j:j + LINE_WIDTH].tobytes() + b"\n" for j in range(0, len(seq), LINE_WIDTH)))
+    sorted_lengths = np.sort(lengths)[::-1]
+    stats.update({
+        "contig_count": int(n_contigs),
+        "mean_contig_length": int(lengths.mean()),
+        "longest_contig": int(sorted_lengths[0]),
+        "n50_contigs": int(sorted_lengths[np.searchsorted(np.cumsum(sorted_lengths), lengths.sum()/2)]),
+    })
+    return stats
+
+
+def make_synthetic_gtdb(data_dir, args):
+    """
+    Generate a GTDB-like tree (<source>/<p1>/<p2>/<p3>/<accession>_<asm>_genomic.fna.gz)
+    with bac120 & ar53 metadata, genome index & metadata_ex.tsv (as written by profile_gtdb_reps.py).
+
+    :param data_dir: Output directory
+    :param args: Arguments (see synthetic_params)
+    """
+    rng = np.random.default_rng(args.seed)
+    genome_dir = data_dir/"gtdb"/"database"
+    n_species = max(1, args.n_genomes//3)
+    rows = []
+    for i in range(args.n_genomes):
+        source = "GCF" if i%2 == 0 else "GCA"
+        digits = f"{i + 1:09d}"
+        accession = f"{source}_{digits}.1"
+        path = genome_dir/source/digits[:3]/digits[3:6]/digits[6:]/f"{accession}_ASM{i}v1_genomic.fna.gz"
+        genome_size = int(rng.integers(args.min_genome_size, args.max_genome_size + 1))
+        n_contigs = int(rng.integers(1, args.max_contigs + 1))
+        n_plasmids = min(n_contigs - 1, int(rng.integers(1, 4))) if rng.random() < args.plasmid_ratio else 0
+        stats = write_genome(path, rng, accession, genome_size, n_contigs, n_plasmids, args.n_runs_per_mb)
+        archaea = rng.random() < args.archaea_ratio
+        species = int(rng.integers(0, n_species))
+        domain = "Archaea" if archaea else "Bacteria"
+        rows.append({
+            "accession": f"{'RS' if source == 'GCF' else 'GB'}_{accession}",
+            **stats,
+            "gtdb_taxonomy": f"d__{domain};p__P{species%5};c__C{species%7};o__O{species%11};f__F{species%13};g__G{species}_{domain[0]};s__S{species}_{domain[0]} sp",
+            "ncbi_genome_category": "none" if rng.random() < 0.9 else "derived from metagenome",
+            "checkm2_completeness": round(float(rng.uniform(80, 100)), 2),
+            "checkm2_contamination": round(float(rng.uniform(0, 8)), 2),
+            "_path": str(path),
+            "_archaea": archaea,
+            "_plasmid_count": n_plasmids,
+        })
+        if (i + 1)%10 == 0:
+            log.info(f"Generated {i + 1}/{args.n_genomes} genomes")
+
+    df = pd.DataFrame(rows)
+    df_meta = df.drop(columns=["_path", "_archaea", "_plasmid_count"])
+    df_meta[~df["_archaea"]].to_csv(data_dir/"bac120_metadata.tsv.gz", sep='\t', index=False)
+    df_meta[df["_archaea"]].to_csv(data_dir/"ar53_metadata.tsv.gz", sep='\t', index=False)
+    df_index = pd.DataFrame({"accession": df["accession"].str[3:], "path": df["_path"]})
+    df_index.to_csv(data_dir/"genome_index.tsv", sep='\t', index=False)
+
+    # metadata_ex.tsv as profile_gtdb_reps.py, input of manifest stage
+    df_ex = df_meta.assign(
+        local_file_path=df["_path"],
+        file_status="found",
+        plasmid_count=df["_plasmid_count"],
+        scan_contig_count=df["contig_count"],
+        scan_genome_size=df["genome_size"],
+        scan_n_count=df["ambiguous_bases"],
+        scan_plasmid_count=df["_plasmid_count"],
+        N_ratio=df["ambiguous_bases"]/df["genome_size"],
+    )
+    df_tax = df_ex["gtdb_taxonomy"].str.split(';', expand=True)
+    for i, rank in enumerate(TAX_RANKS):
+        df_ex[rank] = df_tax[i].str[3:]
+    df_ex.to_csv(data_dir/"metadata_ex.tsv", sep='\t', index=False)
+
+    with open(data_dir/"synthetic.json", 'w') as f:
+        json.dump(synthetic_params(args), f, indent=2)
+
+
+def stage_result(seconds, genomes, contigs, bases):
+    """
+    Throughput of a stage.
+
+    :param seconds: Elapsed time of the stage
+    :param genomes: Processed genomes
+    :param contigs: Processed (or sampled) contigs
+    :param bases: Processed genome bases
+    """
+    return {
+        "seconds": seconds,
+        "genomes": int(genomes),
+        "contigs": int(contigs),
+        "mb": bases/1e6,
+        "genomes_per_s": genomes/seconds,
+        "mb_per_s": bases/1e6/seconds,
+        "contigs_per_s": contigs/seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024, # KiB on Linux
+    }
+
+
+def run_profile(data_dir, work_dir, args):
+    """
+    01_gtdb_reps_analysis: get_single_genome_info over all genomes
+    """
+    sys.path.append(str(ANALYSES_DIR/"01_gtdb_reps_analysis"))
+    from profile_gtdb_reps import get_single_genome_info
+    df_index = pd.read_csv(data_dir/"genome_index.tsv", sep='\t')
+    start = time.perf_counter()
+    contigs = bases = 0
+    for accession, path in zip(df_index["accession"], df_index["path"]):
+        result, _, _ = get_single_genome_info((accession, Path(path)))
+        contigs += result["scan_contig_count"]
+        bases += result["scan_genome_size"]
+    return stage_result(time.perf_counter() - start, len(df_index), contigs, bases)
+
+
+def run_split(data_dir, work_dir, args):
+    """
+    02_split_plasmids: process_genome over all genomes, writes split_summary.csv for the manifest stage
+    """
+    sys.path.append(str(ANALYSES_DIR/"02_split_plasmids"))
+    from omegaconf import OmegaConf
+    from split_plasmids import process_genome
+    cfg = OmegaConf.create({
+        "unknown_mode": "chromosome",
+        "process": {"validate": True, "compression": args.compression, "compress_threads": 1},
+    })
+    df = pd.read_csv(data_dir/"metadata_ex.tsv", sep='\t')
+    gtdb_dir, split_dir = data_dir/"gtdb", work_dir/"gtdb_split"
+    start = time.perf_counter()
+    summary = []
+    for accession, path in zip(df["accession"], df["local_file_path"]):
+        path = Path(path)
+        result = process_genome(path, split_dir/path.relative_to(gtdb_dir).parent, cfg)
+        summary.append({"accession": accession, **result})
+    seconds = time.perf_counter() - start
+    cols = ["accession", "chromosome_path", "plasmid_path", "chromosome_reason", "plasmid_reason"]
+    pd.DataFrame(summary)[cols].to_csv(work_dir/"split_summary.csv", index=False)
+    return stage_result(seconds, len(df), df["contig_count"].sum(), df["genome_size"].sum())
+
+
+def run_manifest(data_dir, work_dir, args):
+    """
+    03_generate_manifest: generate_manifest main (Hydra) with the default filter
+    """
+    sys.path.append(str(ANALYSES_DIR/"03_generate_manifest"))
+    import generate_manifest
+    from common.metadata import cache_path_of
+    cache_path_of(data_dir/"metadata_ex.tsv").unlink(missing_ok=True) # time the cache build as a first run
+    split_summary = work_dir/"split_summary.csv"
+    if not split_summary.exists():
+        raise FileNotFoundError(f"{split_summary} not found, run the split stage first")
+    df = pd.read_csv(data_dir/"metadata_ex.tsv", sep='\t')
+    sys.argv = [
+        "generate_manifest.py",
+        f"--config-path={ANALYSES_DIR/'03_generate_manifest'/'config'}", # imported, not run as __main__
+        f"paths.metadata={data_dir/'metadata_ex.tsv'}",
+        f"paths.split_summary={split_summary}",
+        f"hydra.run.dir={work_dir/'manifest'}",
+    ]
+    start = time.perf_counter()
+    generate_manifest.main()
+    return stage_result(time.perf_counter() - start, len(df), df["contig_count"].sum(), df["genome_size"].sum())
+
+
+def run_sample(data_dir, work_dir, args):
+    """
+    04_dataset_generation: GenomeSampler.sample_from_genome over manifest genomes
+    """
+    sys.path.append(str(ANALYSES_DIR/"04_dataset_generation"))
+    from types import SimpleNamespace
+    from omegaconf import OmegaConf
+    from generate_dataset import GenomeSampler, num_contigs_of
+    manifest_path = work_dir/"manifest"/"manifest.csv"
+    df = pd.read_csv(manifest_path) if manifest_path.exists() else pd.read_csv(data_dir/"metadata_ex.tsv", sep='\t')
+    cfg = OmegaConf.create({
+        "dataset": {"min_len": args.min_len, "max_len": args.max_len, "decay": 0.5},
+        "process": {"seed": args.seed},
+        "paths": {},
+    })
+    sampler = GenomeSampler(cfg)
+    num_contigs = num_contigs_of(args.coverage, df["genome_size"].max(), sampler.expected_contig_len)
+    start = time.perf_counter()
+    contigs = 0
+    for row in df.to_dict('records'):
+        contigs += len(sampler.sample_from_genome(SimpleNamespace(**row), num_contigs))
+    return stage_result(time.perf_counter() - start, len(df), contigs, df["genome_size"].sum())
+
+
+STAGE_FUNCS = {"profile": run_profile, "split": run_split, "manifest": run_manifest, "sample": run_sample}
+
+
+def git_commit():
+    """
+    Commit of the working tree (None if not available)
+    """
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ANALYSES_DIR, capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ANALYSES_DIR, capture_output=True, text=True).stdout
+        return out.stdout.strip() + ("-dirty" if dirty.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Log throughput ratios (current/baseline) of stages in both results.
+
+    :param results: Current results
+    :param baseline: Baseline results
+    """
+    log.info(f"Comparison with {baseline.get('commit')} (ratio current/baseline):")
+    for stage, current in results["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            continue
+        ratios = {key: current[key]/base[key] for key in ["genomes_per_s", "mb_per_s", "contigs_per_s", "peak_rss_mb"] if base[key]}
+        log.info(f"  {stage}: " + ", ".join(f"{key}={ratio:.2f}x" for key, ratio in ratios.items()))
+
+
+def main():
+    args = parse_args()
+    data_dir = Path(args.data_dir).resolve()
+
+    # Child process: run one stage & write its result
+    if args.run_stage is not None:
+        work_dir = Path(args.work_dir)
+        result = STAGE_FUNCS[args.run_stage](data_dir, work_dir, args)
+        with open(work_dir/f"{args.run_stage}.json", 'w') as f:
+            json.dump(result, f)
+        return
+
+    # Synthetic tree
+    params_path = data_dir/"synthetic.json"
+    if params_path.exists() and json.loads(params_path.read_text()) == synthetic_params(args):
+        log.info(f"Reusing synthetic tree in {data_dir}")
+    else:
+        log.info(f"Generating synthetic tree of {args.n_genomes} genomes in {data_dir}...")
+        if params_path.exists():
+            params_path.unlink()
+        data_dir.mkdir(parents=True, exist_ok=True)
+        make_synthetic_gtdb(data_dir, args)
+
+    # Stages, each in a fresh process for its own peak RSS
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    work_dir = data_dir.parent/f"benchmark_{timestamp}"
+    work_dir.mkdir(parents=True, exist_ok=True)
+    results = {"commit": git_commit(), "timestamp": timestamp, "params": vars(args), "stages": {}}
+    for stage in [stage for stage in STAGES if stage in args.stages]:
+        log.info(f"Running {stage}...")
+        subprocess.run(
+            [sys.executable, __file__, "--run_stage", stage, "--work_dir", str(work_dir)] + sys.argv[1:],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        results["stages"][stage] = json.loads((work_dir/f"{stage}.json").read_text())
+        r = results["stages"][stage]
+        log.info(f"  {stage}: {r['genomes_per_s']:.2f} genomes/s, {r['mb_per_s']:.2f} MB/s, "
+                 f"{r['contigs_per_s']:.1f} contigs/s, peak RSS {r['peak_rss_mb']:.0f} MB")
+
+    out_path = Path(args.out or Path("out")/f"benchmark_{timestamp}.json")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    log.info(f"Results saved to {out_path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
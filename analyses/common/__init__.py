@@ -0,0 +1,5 @@
+"""Utilities shared across analysis stages.
+
+Stage scripts under analyses/ are not installed as a package, so they add
+analyses/ to sys.path before importing from here.
+"""
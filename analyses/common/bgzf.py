@@ -0,0 +1,199 @@
+import zlib
+import struct
+import bisect
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from .fasta import LINE_WIDTH, format_header, wrap_sequence
+
+
+BLOCK_SIZE = 0xff00 # max uncompressed bytes per block, as bgzip
+_HEADER = struct.Struct("<4BI2BH2BHH") # gzip header with BC extra subfield
+_FOOTER = struct.Struct("<II") # CRC32 & ISIZE
+# Empty block marking the end of a BGZF file
+EOF_BLOCK = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data: bytes, level: int = 6) -> bytes:
+    """Compresses up to BLOCK_SIZE bytes into a single BGZF block.
+    zlib releases the GIL, so blocks can be compressed on a thread pool.
+    """
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = c.compress(data) + c.flush()
+    block_size = _HEADER.size + len(deflated) + _FOOTER.size
+    header = _HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, block_size - 1)
+    return header + deflated + _FOOTER.pack(zlib.crc32(data), len(data))
+
+
+class BgzfWriter():
+    """Writes a BGZF file, compressing blocks on a thread pool.
+
+    Uncompressed data are cut into BLOCK_SIZE blocks & compressed in batches of
+    threads*4 blocks, written in order. Offsets of blocks are kept for the .gzi index.
+
+    Args:
+        f: Binary file object to write compressed data to (not closed by close())
+        threads (int): Compression threads
+        level (int): zlib compression level
+    """
+    def __init__(self, f, threads: int = 1, level: int = 6):
+        self.f = f
+        self.level = level
+        self.threads = max(1, threads)
+        self.pool = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+        self.buffer = bytearray()
+        self.blocks = [] # pending uncompressed blocks
+        self.tell = 0 # uncompressed bytes written
+        self.compressed = 0 # compressed bytes written
+        self.index = [] # (compressed offset, uncompressed offset) of blocks after the first
+
+    def write(self, data: bytes):
+        self.buffer += data
+        self.tell += len(data)
+        while len(self.buffer) >= BLOCK_SIZE:
+            self.blocks.append(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+            if len(self.blocks) >= self.threads*4:
+                self._flush_blocks()
+
+    def _flush_blocks(self):
+        """Compresses pending blocks & writes them in order.
+        """
+        if self.pool is not None:
+            compressed = self.pool.map(compress_block, self.blocks, [self.level]*len(self.blocks))
+        else:
+            compressed = (compress_block(block, self.level) for block in self.blocks)
+        uncompressed = self.tell - len(self.buffer) - sum(len(block) for block in self.blocks)
+        for block, data in zip(self.blocks, compressed):
+            if self.compressed > 0:
+                self.index.append((self.compressed, uncompressed))
+            self.f.write(data)
+            self.compressed += len(data)
+            uncompressed += len(block)
+        self.blocks = []
+
+    def close(self):
+        """Writes remaining data & the EOF block.
+        """
+        if self.buffer:
+            self.blocks.append(bytes(self.buffer))
+            self.buffer = bytearray()
+        self._flush_blocks()
+        self.f.write(EOF_BLOCK)
+        self.compressed += len(EOF_BLOCK)
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def gzi(self) -> bytes:
+        """Content of the .gzi index (as bgzip -i)
+        """
+        return struct.pack("<Q", len(self.index)) + b"".join(struct.pack("<QQ", *entry) for entry in self.index)
+
+
+class BgzfFastaWriter():
+    """Writes FASTA records into a BGZF file & collects its .fai index (as samtools faidx).
+
+    Args:
+        f: Binary file object to write compressed data to
+        threads (int): Compression threads
+        level (int): zlib compression level
+    """
+    def __init__(self, f, threads: int = 1, level: int = 6):
+        self.writer = BgzfWriter(f, threads, level)
+        self.fai = [] # (name, length, offset, line bases, line width)
+
+    def write_record(self, description: str, seq: bytes):
+        """Writes a record, wrapping the sequence at LINE_WIDTH
+        """
+        self.writer.write(format_header(description))
+        self.fai.append(((description.split() or [""])[0], len(seq), self.writer.tell, LINE_WIDTH, LINE_WIDTH + 1))
+        self.writer.write(wrap_sequence(seq))
+
+    def close(self):
+        self.writer.close()
+
+    def write_indexes(self, fai_path: Path, gzi_path: Path):
+        """Writes .fai & .gzi indexes (to temporary paths, renamed into place with the output by split_genome)
+        """
+        for path, data in [
+            (fai_path, "".join("\t".join(map(str, entry)) + "\n" for entry in self.fai).encode()),
+            (gzi_path, self.writer.gzi()),
+        ]:
+            with open(path, 'wb') as f:
+                f.write(data)
+
+
+def read_gzi(gzi_path: Path) -> List[Tuple[int, int]]:
+    """(compressed offset, uncompressed offset) of blocks, including the first block (0, 0)
+    """
+    with open(gzi_path, 'rb') as f:
+        data = f.read()
+    n, = struct.unpack_from("<Q", data)
+    return [(0, 0)] + [struct.unpack_from("<QQ", data, 8 + 16*i) for i in range(n)]
+
+
+class IndexedFasta():
+    """Random access to contigs of a BGZF FASTA with .fai & .gzi indexes.
+    Only blocks overlapping the requested range are read & decompressed.
+
+    Args:
+        path (Path): Path to BGZF FASTA (index files at <path>.fai & <path>.gzi)
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.fai = {}
+        with open(f"{self.path}.fai") as f:
+            for line in f:
+                name, length, offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+                self.fai[name] = (int(length), int(offset), int(line_bases), int(line_width))
+        index = read_gzi(f"{self.path}.gzi")
+        self.block_offsets = [c for c, _ in index]
+        self.data_offsets = [u for _, u in index]
+
+    @property
+    def references(self) -> List[str]:
+        return list(self.fai)
+
+    def length(self, name: str) -> int:
+        return self.fai[name][0]
+
+    def _read(self, start: int, stop: int) -> bytes:
+        """Uncompressed bytes [start, stop) of the file
+        """
+        i = bisect.bisect_right(self.data_offsets, start) - 1
+        out = bytearray()
+        with open(self.path, 'rb') as f:
+            f.seek(self.block_offsets[i])
+            position = self.data_offsets[i]
+            while position < stop:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                block_size = _HEADER.unpack(header)[-1] + 1
+                block = zlib.decompress(f.read(block_size - _HEADER.size)[:-_FOOTER.size], -15)
+                if not block:
+                    break
+                out += block[max(start - position, 0):stop - position]
+                position += len(block)
+        return bytes(out)
+
+    def fetch(self, name: str, start: int = 0, end: int = None) -> bytes:
+        """Sequence [start, end) of a contig, without line breaks.
+
+        Args:
+            name (str): Contig name (first word of the header)
+            start (int): 0-based start
+            end (int): End (exclusive), default: contig end
+
+        Returns:
+            bytes: Sequence (ASCII)
+        """
+        length, offset, line_bases, line_width = self.fai[name]
+        end = length if end is None else min(end, length)
+        if start >= end:
+            return b""
+        def file_offset(pos):
+            return offset + (pos//line_bases)*line_width + pos%line_bases
+        data = self._read(file_offset(start), file_offset(end - 1) + 1)
+        return data.replace(b"\n", b"").replace(b"\r", b"")
@@ -0,0 +1,243 @@
+import re
+import gzip
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .metrics import NO_METRICS
+from .prefetch import open_source
+
+
+PLASMID_REGEX = re.compile(
+    r"\bplasmids?\b|" # \b excludes "mycoplasmid"
+    r"extrachromosomal|"
+    r"\bInc[A-Z0-9]+[-_a-z0-9]*\b|" # Incompatibility group e.g. IncF, IncFII, IncP-1
+    r"\bInc\s+group\b|" # e.g. Inc group
+    r"\bp[A-Za-z]{2,}\d+|" # naming convention (p + <2 alphabets + number) e.g. pBR322, pXO1
+    r"megaplasmid", 
+    re.IGNORECASE
+)
+CHROMOSOME_REGEX = re.compile(
+    r"\bchromosomes?\b|" # Chromosome
+    r"complete\s+genome|" # Complete Genome
+    r"main\s+genome", # Main Genome
+    re.IGNORECASE
+)
+
+BLOCK_SIZE = 1 << 20 # decompressed bytes per read
+LINE_WIDTH = 60 # line width of written FASTA, as Bio.SeqIO
+
+
+def classify_sequence(description):
+    """Classify sequence type & its reason based on its header.
+    """
+    p_match = PLASMID_REGEX.search(description)
+    if p_match:
+        return "plasmid", f"match={p_match.group(0)}"
+    c_match = CHROMOSOME_REGEX.search(description)
+    if c_match:
+        return "chromosome", f"match={c_match.group(0)}"
+    return "unknown", "no_match"
+
+
+@contextmanager
+def open_fasta(file_path: Path, metrics=NO_METRICS):
+    """Open (gzipped) FASTA file in binary mode. Reads of the raw file are timed by metrics.
+    """
+    with open_source(file_path) as raw: # fetched copy if read ahead (see common.prefetch)
+        f = metrics.reader(raw)
+        if str(file_path).endswith(".gz"):
+            with gzip.GzipFile(fileobj=f, mode='rb') as gz:
+                yield gz
+        else:
+            yield f
+
+
+def scan_fasta(file_path: Path, block_size: int = BLOCK_SIZE, metrics=NO_METRICS) -> List[Dict]:
+    """Profiles each contig of a FASTA file in a single pass over decompressed bytes.
+
+    Sequence lines are never decoded or split. Each block is searched for b'>' 
+    markers & the sequence between them is counted with bytes.count(), 
+    so the scan is bound by decompression speed.
+
+    Args:
+        file_path (Path): Path to the (gzipped) FASTA file.
+        block_size (int): Number of decompressed bytes to read at once.
+        metrics (GenomeMetrics): Timings of read, decompress, parse & classify (optional).
+
+    Returns:
+        List[Dict]: Per-contig stats with keys 
+        ['header_id', 'description', 'length', 'gc_count', 'n_count', 'seq_type', 'class_reason'].
+    """
+    contigs = []
+    contig = None
+    header = None # bytearray while a header line is being read
+    with metrics.phase("parse"), open_fasta(file_path, metrics) as f:
+        while True:
+            with metrics.phase("decompress"):
+                block = f.read(block_size)
+            if not block:
+                break
+            pos, n = 0, len(block)
+            while pos < n:
+                if header is not None:
+                    eol = block.find(b'\n', pos)
+                    if eol < 0: # header continues into the next block
+                        header += block[pos:]
+                        break
+                    header += block[pos:eol]
+                    with metrics.phase("classify"):
+                        contig = _new_contig(bytes(header))
+                    contigs.append(contig)
+                    header = None
+                    pos = eol + 1
+                else:
+                    gt = block.find(b'>', pos)
+                    end = n if gt < 0 else gt
+                    if contig is not None and end > pos:
+                        newlines = block.count(b'\n', pos, end) + block.count(b'\r', pos, end)
+                        contig["length"] += end - pos - newlines
+                        contig["gc_count"] += (
+                            block.count(b'G', pos, end) + block.count(b'C', pos, end) + 
+                            block.count(b'g', pos, end) + block.count(b'c', pos, end)
+                        )
+                        contig["n_count"] += block.count(b'N', pos, end) + block.count(b'n', pos, end)
+                    if gt < 0:
+                        break
+                    header = bytearray()
+                    pos = gt + 1
+    if header is not None: # header without trailing newline at EOF
+        contigs.append(_new_contig(bytes(header)))
+
+    return contigs
+
+
+def _new_contig(header: bytes) -> Dict:
+    """Initializes per-contig stats from a header line (without '>').
+    """
+    description = header.decode('ascii', errors='replace').strip()
+    seq_type, reason = classify_sequence(description)
+    return {
+        "header_id": description.split()[0] if description else "", 
+        "description": description, 
+        "length": 0, 
+        "gc_count": 0, 
+        "n_count": 0, 
+        "seq_type": seq_type, 
+        "class_reason": reason, 
+    }
+
+
+def profile_record(header: str, seq: bytes, metrics=NO_METRICS) -> Dict:
+    """Stats of a single record, same as a contig of scan_fasta.
+
+    Args:
+        header (str): Header line without '>'.
+        seq (bytes): Sequence.
+        metrics (GenomeMetrics): Timing of classify (optional).
+
+    Returns:
+        Dict: Stats with the keys of scan_fasta.
+    """
+    with metrics.phase("classify"):
+        contig = _new_contig(header.encode('ascii', errors='replace'))
+    contig["length"] = len(seq)
+    contig["gc_count"] = seq.count(b'G') + seq.count(b'C') + seq.count(b'g') + seq.count(b'c')
+    contig["n_count"] = seq.count(b'N') + seq.count(b'n')
+    return contig
+
+
+def profile_records(records: Iterable[Tuple[str, bytes]], metrics=NO_METRICS) -> List[Dict]:
+    """Per-contig stats of records (from read_fasta or iter_fasta), same as scan_fasta.
+
+    Args:
+        records (Iterable[Tuple[str, bytes]]): (header line without '>', sequence).
+        metrics (GenomeMetrics): Timing of classify (optional).
+
+    Returns:
+        List[Dict]: Per-contig stats with the keys of scan_fasta.
+    """
+    return [profile_record(header, seq, metrics) for header, seq in records]
+
+
+def format_header(description: str) -> bytes:
+    """Header line of a record, as Bio.SeqIO
+    """
+    return f">{description}\n".encode()
+
+
+def wrap_sequence(seq: bytes, width: int = LINE_WIDTH) -> bytes:
+    """Sequence lines of a record, wrapped at width as Bio.SeqIO
+    """
+    return b"".join(seq[i:i + width] + b"\n" for i in range(0, len(seq), width))
+
+
+def _parse_record(chunk: bytes) -> Tuple[str, bytes]:
+    """(header line without '>', sequence) of a record, from its bytes between '>' markers.
+    """
+    header, _, body = chunk.partition(b'\n')
+    header = header.lstrip(b'>').decode('ascii', errors='replace').strip()
+    return header, body.replace(b'\n', b'').replace(b'\r', b'')
+
+
+def read_fasta(file_path: Path, metrics=NO_METRICS) -> List[Tuple[str, bytes]]:
+    """Reads all records of a FASTA file as bytes.
+
+    Args:
+        file_path (Path): Path to the (gzipped) FASTA file.
+        metrics (GenomeMetrics): Timings of read, decompress & parse (optional).
+
+    Returns:
+        List[Tuple[str, bytes]]: List of (header line without '>', sequence).
+    """
+    with metrics.phase("decompress"), open_fasta(file_path, metrics) as f:
+        data = f.read()
+    records = []
+    with metrics.phase("parse"):
+        for chunk in data.split(b'\n>'):
+            header, seq = _parse_record(chunk)
+            if header or seq:
+                records.append((header, seq))
+    return records
+
+
+def iter_fasta(file_path: Path, block_size: int = BLOCK_SIZE, metrics=NO_METRICS) -> Iterator[Tuple[str, bytes]]:
+    """Streams records of a FASTA file as bytes, same as read_fasta.
+
+    Only the record being read & one block of decompressed bytes are held in memory.
+    Phases are timed per block, never across a yield, so that the time spent
+    by the consumer is not charged to parsing.
+
+    Args:
+        file_path (Path): Path to the (gzipped) FASTA file.
+        block_size (int): Number of decompressed bytes to read at once.
+        metrics (GenomeMetrics): Timings of read, decompress & parse (optional).
+
+    Yields:
+        Tuple[str, bytes]: (header line without '>', sequence).
+    """
+    with open_fasta(file_path, metrics) as f:
+        buffer = bytearray()
+        searched = 0 # buffer[:searched] holds no record boundary
+        eof = False
+        while not eof:
+            with metrics.phase("decompress"):
+                block = f.read(block_size)
+            eof = not block
+            records = []
+            with metrics.phase("parse"):
+                buffer += block
+                start = 0
+                while True:
+                    pos = buffer.find(b'\n>', max(searched, start))
+                    if pos < 0:
+                        break
+                    records.append(_parse_record(bytes(buffer[start:pos])))
+                    start = pos + 1
+                if eof:
+                    records.append(_parse_record(bytes(buffer[start:])))
+                del buffer[:start] # once per block
+                searched = max(len(buffer) - 1, 0) # a boundary may span two blocks
+            for header, seq in records:
+                if header or seq:
+                    yield header, seq
@@ -0,0 +1,320 @@
+import os
+import json
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+import pandas as pd
+
+
+STORE_VERSION = 1
+INDEX_FILES = ["n_runs.npy", "contig_offsets.npy", "contig_n_runs.npy", "contigs.parquet", "genomes.parquet"]
+PARTS_DIR = ".parts" # sequence parts written by worker processes, see GenomePart
+COPY_SIZE = 1 << 20 # bytes per copy of a sequence part into the blob
+
+# Sequence part of this (worker) process per store: store dir -> file opened for appending
+_PARTS = {}
+
+
+def find_n_runs(seq: np.ndarray) -> np.ndarray:
+    """Finds runs of ambiguous bases ('N'/'n') in a sequence.
+
+    Args:
+        seq (np.ndarray): Sequence as uint8 (ASCII) array.
+
+    Returns:
+        np.ndarray: int64 array of shape (n_runs, 2) holding [start, end) of each run.
+    """
+    is_n = (seq == ord('N')) | (seq == ord('n'))
+    edges = np.diff(is_n.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return np.stack([starts, ends], axis=1).astype(np.int64)
+
+
+class GenomePart():
+    """Appends the contigs of a genome, one at a time, to the sequence part of the calling (worker) process.
+
+    Sequences stay in the worker: only the reference returned by commit is sent to the parent,
+    which passes it to GenomeStoreWriter.add_genome_part. Contigs of an aborted genome are dropped.
+
+    Args:
+        store_dir (Path): Output directory of the store (GenomeStoreWriter must be created first).
+    """
+    def __init__(self, store_dir: Path):
+        parts_dir = Path(store_dir)/PARTS_DIR
+        self.file = _PARTS.get(str(parts_dir))
+        if self.file is None:
+            parts_dir.mkdir(parents=True, exist_ok=True)
+            self.file = _PARTS[str(parts_dir)] = open(parts_dir/f"sequence-{os.getpid()}.bin", 'ab')
+        self.offset = self.file.tell()
+        self.ref = {"part": Path(self.file.name).name, "offset": self.offset, "header_ids": [], "lengths": [], "n_runs": []}
+
+    def add(self, header_id: str, seq: bytes):
+        """Appends a contig.
+        """
+        try:
+            self.ref["n_runs"].append(find_n_runs(np.frombuffer(seq, dtype=np.uint8)))
+            self.ref["header_ids"].append(header_id)
+            self.ref["lengths"].append(len(seq))
+            self.file.write(seq)
+        except BaseException:
+            self.abort()
+            raise
+
+    def commit(self) -> Dict:
+        """Flushes the contigs of the genome.
+
+        Returns:
+            Dict: Reference with keys ['part', 'offset', 'header_ids', 'lengths', 'n_runs'].
+        """
+        self.file.flush() # visible to the parent once the reference is returned
+        return self.ref
+
+    def abort(self):
+        """Drops the contigs written so far (e.g. of a genome whose file could not be read).
+        """
+        self.file.truncate(self.offset)
+        self.file.seek(self.offset)
+
+
+def write_genome_part(store_dir: Path, contigs: Iterable[Tuple[str, bytes]]) -> Dict:
+    """Appends the contigs of a genome to the sequence part of the calling (worker) process (see GenomePart).
+
+    Args:
+        store_dir (Path): Output directory of the store (GenomeStoreWriter must be created first).
+        contigs (Iterable[Tuple[str, bytes]]): (header_id, sequence) of each contig.
+
+    Returns:
+        Dict: Reference with keys ['part', 'offset', 'header_ids', 'lengths', 'n_runs'].
+    """
+    part = GenomePart(store_dir)
+    try:
+        for header_id, seq in contigs:
+            part.add(header_id, seq)
+    except BaseException:
+        part.abort()
+        raise
+    return part.commit()
+
+
+class GenomeStoreWriter():
+    """Writes genomes into a packed, memory-mappable genome store.
+
+    Layout of store_dir:
+        sequence.bin        uint8 (ASCII) blob of all contigs, concatenated
+        contig_offsets.npy  int64 (n_contigs+1), contig i is sequence[offsets[i]:offsets[i+1]]
+        n_runs.npy          int64 (n_runs, 2), [start, end) of N runs within its contig
+        contig_n_runs.npy   int64 (n_contigs+1), N runs of contig i are n_runs[c[i]:c[i+1]]
+        contigs.parquet     header_id of each contig
+        genomes.parquet     accession, local_file_path, contig_start, contig_stop
+        store.json          version & totals, written last (a store without it is incomplete)
+        .parts/             sequences written by workers (write_genome_part), until the store is closed
+
+    store.json of a previous store in store_dir is removed when the writer is created,
+    so an interrupted rebuild never leaves a store that looks complete.
+
+    Args:
+        store_dir (Path): Output directory of the store.
+    """
+    def __init__(self, store_dir: Path):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        (self.store_dir/"store.json").unlink(missing_ok=True) # previous store is incomplete from now on
+        shutil.rmtree(self.store_dir/PARTS_DIR, ignore_errors=True) # parts of an interrupted build
+        (self.store_dir/PARTS_DIR).mkdir()
+        self._seq_file = open(self.store_dir/"sequence.bin.tmp", 'wb')
+        self.part_genomes = [] # (accession, local_file_path, reference from write_genome_part)
+        self.n_bases = 0
+        self.contig_offsets = [0]
+        self.contig_n_runs = [0]
+        self.n_runs = []
+        self.headers = []
+        self.genomes = []
+
+    def add_genome(
+            self, 
+            accession: str, 
+            local_file_path: str, 
+            contigs: List[Tuple[str, np.ndarray, np.ndarray]]
+    ):
+        """Appends a genome to the store.
+
+        Args:
+            accession (str): Accession of the genome (key used by GenomeStore).
+            local_file_path (str): Original genome file.
+            contigs (List[Tuple[str, np.ndarray, np.ndarray]]): 
+                List of (header_id, sequence as uint8 array, N runs from find_n_runs).
+        """
+        for _, seq, _ in contigs:
+            self._seq_file.write(seq.tobytes())
+        self._index_genome(
+            accession, local_file_path, 
+            [header_id for header_id, _, _ in contigs], [len(seq) for _, seq, _ in contigs], [n_runs for _, _, n_runs in contigs]
+        )
+
+    def add_genome_part(self, accession: str, local_file_path: str, ref: Dict):
+        """Appends a genome whose sequences were written by a worker (see write_genome_part).
+        Sequence parts are copied into the blob when the store is closed.
+
+        Args:
+            accession (str): Accession of the genome (key used by GenomeStore).
+            local_file_path (str): Original genome file.
+            ref (Dict): Reference returned by write_genome_part.
+        """
+        self.part_genomes.append((accession, local_file_path, ref))
+
+    def _index_genome(
+            self, 
+            accession: str, 
+            local_file_path: str, 
+            header_ids: List[str], 
+            lengths: List[int], 
+            n_runs: List[np.ndarray]
+    ):
+        """Indexes contigs of a genome appended to the sequence blob.
+        """
+        contig_start = len(self.headers)
+        for header_id, length, runs in zip(header_ids, lengths, n_runs):
+            self.n_bases += length
+            self.contig_offsets.append(self.n_bases)
+            self.n_runs.append(runs)
+            self.contig_n_runs.append(self.contig_n_runs[-1] + len(runs))
+            self.headers.append(header_id)
+        self.genomes.append({
+            "accession": accession, 
+            "local_file_path": str(local_file_path), 
+            "contig_start": contig_start, 
+            "contig_stop": len(self.headers), 
+        })
+
+    def _copy_parts(self):
+        """Appends genomes of worker sequence parts to the blob, in order of their offsets in each part.
+        """
+        by_part = {}
+        for accession, local_file_path, ref in self.part_genomes:
+            by_part.setdefault(ref["part"], []).append((ref["offset"], accession, local_file_path, ref))
+        for part, genomes in sorted(by_part.items()):
+            with open(self.store_dir/PARTS_DIR/part, 'rb') as f:
+                for offset, accession, local_file_path, ref in sorted(genomes, key=lambda genome: genome[0]):
+                    f.seek(offset)
+                    remaining = sum(ref["lengths"])
+                    while remaining > 0:
+                        data = f.read(min(COPY_SIZE, remaining))
+                        if not data:
+                            raise IOError(f"Truncated sequence part {part} ({accession})")
+                        self._seq_file.write(data)
+                        remaining -= len(data)
+                    self._index_genome(accession, local_file_path, ref["header_ids"], ref["lengths"], ref["n_runs"])
+        self.part_genomes = []
+
+    def close(self):
+        """Writes index files to temporary paths, moves the sequence blob & index files into place
+        & writes store.json last, so an interrupted build never looks complete.
+        """
+        self._copy_parts()
+        self._seq_file.close()
+        shutil.rmtree(self.store_dir/PARTS_DIR, ignore_errors=True)
+        tmp = {name: self.store_dir/f"{name}.tmp" for name in ["sequence.bin"] + INDEX_FILES}
+        n_runs = np.concatenate(self.n_runs) if self.n_runs else np.empty((0, 2), dtype=np.int64)
+        arrays = {
+            "n_runs.npy": n_runs.astype(np.int64), 
+            "contig_offsets.npy": np.asarray(self.contig_offsets, dtype=np.int64), 
+            "contig_n_runs.npy": np.asarray(self.contig_n_runs, dtype=np.int64), 
+        }
+        for name, array in arrays.items():
+            with open(tmp[name], 'wb') as f: # np.save would append .npy to a .tmp path
+                np.save(f, array)
+        pd.DataFrame({"header_id": self.headers}).to_parquet(tmp["contigs.parquet"], index=False)
+        pd.DataFrame(
+            self.genomes, columns=["accession", "local_file_path", "contig_start", "contig_stop"]
+        ).to_parquet(tmp["genomes.parquet"], index=False)
+        for name, path in tmp.items():
+            path.replace(self.store_dir/name)
+        tmp_path = self.store_dir/"store.json.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "version": STORE_VERSION, 
+                "n_genomes": len(self.genomes), 
+                "n_contigs": len(self.headers), 
+                "n_bases": self.n_bases, 
+            }, f, indent=2)
+        tmp_path.replace(self.store_dir/"store.json")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._seq_file.close()
+
+
+class GenomeStore():
+    """Read-only, memory-mapped access to a store written by GenomeStoreWriter.
+
+    Sequences are returned as zero-copy views into the memory-mapped blob, so 
+    pages are shared across worker processes. The store is pickled by path 
+    and re-opened in each worker.
+
+    Args:
+        store_dir (Path): Directory of the store.
+    """
+    def __init__(self, store_dir: Path):
+        self.store_dir = Path(store_dir)
+        self._open()
+
+    def _open(self):
+        with open(self.store_dir/"store.json") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported genome store version: {self.meta['version']}")
+        self.sequence = np.memmap(self.store_dir/"sequence.bin", dtype=np.uint8, mode='r') \
+            if self.meta["n_bases"] > 0 else np.empty(0, dtype=np.uint8)
+        self.contig_offsets = np.load(self.store_dir/"contig_offsets.npy", mmap_mode='r')
+        self.n_runs = np.load(self.store_dir/"n_runs.npy", mmap_mode='r')
+        self.contig_n_runs = np.load(self.store_dir/"contig_n_runs.npy", mmap_mode='r')
+        self.headers = pd.read_parquet(self.store_dir/"contigs.parquet")["header_id"].to_numpy()
+        df_genomes = pd.read_parquet(self.store_dir/"genomes.parquet")
+        self.genomes = {
+            acc: (start, stop) for acc, start, stop in 
+            zip(df_genomes["accession"], df_genomes["contig_start"], df_genomes["contig_stop"])
+        }
+
+    def __getstate__(self):
+        return {"store_dir": self.store_dir}
+
+    def __setstate__(self, state):
+        self.store_dir = state["store_dir"]
+        self._open()
+
+    def __contains__(self, accession: str) -> bool:
+        return accession in self.genomes
+
+    def __len__(self) -> int:
+        return len(self.genomes)
+
+    def get_contig(self, contig_idx: int) -> Tuple[str, np.ndarray, np.ndarray]:
+        """Returns (header_id, sequence view, N runs) of a contig.
+        """
+        seq = self.sequence[self.contig_offsets[contig_idx]:self.contig_offsets[contig_idx + 1]]
+        n_runs = self.n_runs[self.contig_n_runs[contig_idx]:self.contig_n_runs[contig_idx + 1]]
+        return self.headers[contig_idx], seq, n_runs
+
+    def get_genome(self, accession: str) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """Returns contigs of a genome.
+
+        Args:
+            accession (str): Accession of the genome.
+
+        Returns:
+            Dict[str, Tuple[np.ndarray, np.ndarray]]: A dictionary where keys are 
+            sequence IDs and values are (sequence view, N runs).
+        """
+        start, stop = self.genomes[accession]
+        contigs = {}
+        for contig_idx in range(start, stop):
+            header_id, seq, n_runs = self.get_contig(contig_idx)
+            contigs[header_id] = (seq, n_runs)
+        return contigs
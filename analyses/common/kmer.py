@@ -0,0 +1,280 @@
+import os
+import json
+import shutil
+from pathlib import Path
+from functools import lru_cache
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+
+
+KMER_VERSION = 1
+MAX_K = 12 # canonical index lookup table has 4**k entries
+BATCH_BASES = 1 << 23 # bases encoded at once by count_kmers (bounds int64 temporaries)
+
+
+def _base_codes() -> np.ndarray:
+    """uint8 lookup table of 2-bit nucleotide codes (A=0, C=1, G=2, T=3, case-insensitive), other bytes map to 4.
+    """
+    table = np.full(256, 4, dtype=np.uint8)
+    for i, base in enumerate("ACGT"):
+        table[ord(base)] = table[ord(base.lower())] = i
+    table.flags.writeable = False
+    return table
+
+
+BASE_CODES = _base_codes()
+
+
+def reverse_complement_codes(codes: np.ndarray, k: int) -> np.ndarray:
+    """2-bit codes of reverse complements of k-mer codes (complement of code c is 3 - c).
+    """
+    rc = np.zeros_like(codes)
+    for j in range(k):
+        rc = (rc << 2) | (3 - ((codes >> (2*j)) & 3))
+    return rc
+
+
+@lru_cache(maxsize=None)
+def canonical_index(k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column of each k-mer code in canonical (strand-merged) count matrices.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: int32 lookup table code -> column (4**k),
+        & int64 canonical codes of columns (sorted).
+    """
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"k must be in [1, {MAX_K}], got {k}")
+    codes = np.arange(4**k, dtype=np.int64)
+    canonical = np.minimum(codes, reverse_complement_codes(codes, k))
+    columns, lut = np.unique(canonical, return_inverse=True)
+    lut = lut.astype(np.int32)
+    lut.flags.writeable = False
+    return lut, columns
+
+
+def n_features(k: int) -> int:
+    """Number of canonical k-mers, e.g. 136 for k=4
+    """
+    return len(canonical_index(k)[1])
+
+
+def kmer_names(k: int) -> List[str]:
+    """Canonical k-mers of columns, as strings
+    """
+    columns = canonical_index(k)[1]
+    return ["".join("ACGT"[(code >> (2*(k - 1 - j))) & 3] for j in range(k)) for code in columns]
+
+
+def _count_batch(buffer: np.ndarray, offsets: np.ndarray, k: int) -> np.ndarray:
+    """Canonical k-mer counts of rows buffer[offsets[i]:offsets[i+1]], see count_kmers
+    """
+    lut, columns = canonical_index(k)
+    n_rows, n_cols = len(offsets) - 1, len(columns)
+    n_windows = len(buffer) - k + 1
+    if n_windows <= 0:
+        return np.zeros((n_rows, n_cols), dtype=np.uint32)
+
+    # Rolling 2-bit codes of all windows: k shifted vector ops over the whole buffer
+    codes = BASE_CODES[buffer]
+    code = np.zeros(n_windows, dtype=np.int64)
+    for j in range(k):
+        code = (code << 2) | codes[j:j + n_windows]
+
+    # Windows with a non-ACGT base or crossing a row boundary are dropped
+    invalid = np.concatenate([[0], np.cumsum(codes == 4, dtype=np.int64)])
+    valid = invalid[k:] == invalid[:n_windows]
+    row_of = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(offsets))
+    valid &= row_of[:n_windows] == row_of[k - 1:]
+
+    # One bincount over (row, column) pairs
+    flat = row_of[:n_windows][valid]*n_cols + lut[code[valid]]
+    return np.bincount(flat, minlength=n_rows*n_cols).astype(np.uint32).reshape(n_rows, n_cols)
+
+
+def count_kmers(buffer: np.ndarray, offsets: np.ndarray, k: int) -> np.ndarray:
+    """Canonical k-mer counts of many sequences, vectorized over a contiguous buffer.
+
+    Sequences are processed in batches of about BATCH_BASES bases,
+    so that temporaries stay bounded for long genomes.
+
+    Args:
+        buffer (np.ndarray): uint8 (ASCII) sequences, concatenated.
+        offsets (np.ndarray): int64 offsets (n+1), sequence i is buffer[offsets[i]:offsets[i+1]].
+        k (int): k-mer length (<= MAX_K).
+
+    Returns:
+        np.ndarray: uint32 counts (n, n_features(k)), columns as canonical_index(k).
+    """
+    n_rows = len(offsets) - 1
+    counts = np.zeros((n_rows, n_features(k)), dtype=np.uint32)
+    start = 0
+    while start < n_rows:
+        # batch of rows up to BATCH_BASES bases (at least one row)
+        stop = max(start + 1, int(np.searchsorted(offsets, offsets[start] + BATCH_BASES, side='right')) - 1)
+        stop = min(stop, n_rows)
+        counts[start:stop] = _count_batch(
+            buffer[offsets[start]:offsets[stop]], offsets[start:stop + 1] - offsets[start], k
+        )
+        start = stop
+    return counts
+
+
+def concat_sequences(seqs: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenates sequences (bytes) into a uint8 buffer & offsets, as input of count_kmers
+    """
+    offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    np.cumsum([len(seq) for seq in seqs], out=offsets[1:])
+    buffer = np.frombuffer(b"".join(seqs), dtype=np.uint8)
+    return buffer, offsets
+
+
+class KmerMatrixWriter():
+    """Writes k-mer count rows into a chunked on-disk matrix.
+
+    Layout of out_dir:
+        chunk-XXXXX.npy     uint32 dense counts (rows, n_features) (dense)
+        chunk-XXXXX.npz     CSR indptr, indices, data of counts (sparse)
+        rows.parquet        keys of rows (e.g. accession, level, header_id) with chunk & row
+        kmer.json           version, k, format & totals
+
+    Only one chunk is held in memory. Output is written to a temporary directory
+    & renamed when closed with commit=True.
+
+    Args:
+        out_dir (Path): Output directory.
+        k (int): k-mer length.
+        dense (bool): Dense (.npy, memory-mappable) or sparse (CSR .npz) chunks.
+        chunk_rows (int): Rows per chunk.
+    """
+    def __init__(self, out_dir: Path, k: int, dense: bool = True, chunk_rows: int = 4096):
+        self.out_dir = Path(out_dir)
+        self.tmp_dir = self.out_dir.with_name(f".{self.out_dir.name}.tmp")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir(parents=True)
+        self.k = k
+        self.dense = dense
+        self.chunk_rows = chunk_rows
+        self.n_chunks = 0
+        self.n_rows = 0
+        self.rows = [] # keys of written chunks
+        self._keys, self._counts, self._pending = [], [], 0
+
+    def add(self, keys: pd.DataFrame, counts: np.ndarray):
+        """Appends rows.
+
+        Args:
+            keys (pd.DataFrame): Keys of rows (one row per count row).
+            counts (np.ndarray): Counts (len(keys), n_features(k)).
+        """
+        self._keys.append(keys)
+        self._counts.append(counts)
+        self._pending += len(keys)
+        if self._pending >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """Writes pending rows as a chunk
+        """
+        if self._pending == 0:
+            return
+        keys = pd.concat(self._keys, ignore_index=True)
+        counts = np.concatenate(self._counts).astype(np.uint32, copy=False)
+        name = f"chunk-{self.n_chunks:05d}"
+        if self.dense:
+            np.save(self.tmp_dir/f"{name}.npy", counts)
+        else:
+            rows, indices = np.nonzero(counts)
+            indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=len(counts)), out=indptr[1:])
+            np.savez(self.tmp_dir/f"{name}.npz", indptr=indptr, indices=indices.astype(np.int32), data=counts[rows, indices])
+        self.rows.append(keys.assign(chunk=self.n_chunks, row=np.arange(len(keys))))
+        self.n_chunks += 1
+        self.n_rows += len(keys)
+        self._keys, self._counts, self._pending = [], [], 0
+
+    def close(self, commit: bool = True):
+        if not commit:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            return
+        self.flush()
+        df_rows = pd.concat(self.rows, ignore_index=True) if self.rows else pd.DataFrame(columns=["chunk", "row"])
+        df_rows.to_parquet(self.tmp_dir/"rows.parquet", index=False)
+        with open(self.tmp_dir/"kmer.json", 'w') as f:
+            json.dump({
+                "version": KMER_VERSION,
+                "k": self.k,
+                "canonical": True,
+                "n_features": n_features(self.k),
+                "format": "dense" if self.dense else "sparse",
+                "n_chunks": self.n_chunks,
+                "n_rows": self.n_rows,
+            }, f, indent=2)
+        if self.out_dir.exists():
+            shutil.rmtree(self.out_dir)
+        os.replace(self.tmp_dir, self.out_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+
+class KmerMatrix():
+    """Read access to a matrix written by KmerMatrixWriter. Dense chunks are memory-mapped.
+
+    Args:
+        data_dir (Path): Directory of the matrix.
+    """
+    def __init__(self, data_dir: Path):
+        self.data_dir = Path(data_dir)
+        with open(self.data_dir/"kmer.json") as f:
+            self.info = json.load(f)
+        if self.info["version"] != KMER_VERSION:
+            raise ValueError(f"Unsupported k-mer matrix version {self.info['version']}")
+        self.k = self.info["k"]
+        self.rows = pd.read_parquet(self.data_dir/"rows.parquet")
+
+    @property
+    def features(self) -> List[str]:
+        return kmer_names(self.k)
+
+    def chunk(self, i: int) -> np.ndarray:
+        """Dense counts of chunk i
+        """
+        name = f"chunk-{i:05d}"
+        if self.info["format"] == "dense":
+            return np.load(self.data_dir/f"{name}.npy", mmap_mode='r')
+        with np.load(self.data_dir/f"{name}.npz") as z:
+            indptr, indices, data = z["indptr"], z["indices"], z["data"]
+        counts = np.zeros((len(indptr) - 1, self.info["n_features"]), dtype=np.uint32)
+        counts[np.repeat(np.arange(len(indptr) - 1), np.diff(indptr)), indices] = data
+        return counts
+
+    def iter_chunks(self):
+        """Yields (keys, dense counts) of each chunk
+        """
+        for i, keys in self.rows.groupby("chunk", sort=True):
+            yield keys, self.chunk(i)[keys["row"].to_numpy()]
+
+    def get(self, **keys) -> Tuple[pd.DataFrame, np.ndarray]:
+        """Rows matching key columns, e.g. get(accession="RS_GCF_000005845.2", level="genome").
+
+        Returns:
+            Tuple[pd.DataFrame, np.ndarray]: Keys & dense counts of matching rows.
+        """
+        mask = np.ones(len(self.rows), dtype=bool)
+        for col, value in keys.items():
+            mask &= (self.rows[col] == value).to_numpy()
+        selected = self.rows[mask]
+        counts = [self.chunk(i)[group["row"].to_numpy()] for i, group in selected.groupby("chunk", sort=True)]
+        selected = pd.concat([group for _, group in selected.groupby("chunk", sort=True)]) if counts else selected
+        return selected, np.concatenate(counts) if counts else np.zeros((0, self.info["n_features"]), dtype=np.uint32)
+
+
+def frequencies(counts: np.ndarray) -> np.ndarray:
+    """Row-normalized k-mer frequencies (rows without valid k-mers stay 0)
+    """
+    totals = counts.sum(axis=1, keepdims=True, dtype=np.float64)
+    return np.divide(counts, totals, out=np.zeros(counts.shape, dtype=np.float64), where=totals > 0)
@@ -0,0 +1,97 @@
+import os
+import logging
+from pathlib import Path
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+
+
+log = logging.getLogger(__name__)
+
+
+TAXONOMY_COLS = ["domain", "phylum", "class", "order", "family", "genus", "species"]
+MISSING_VALUES = ["none", "n/a", "N/A", ""] # missing values of numeric columns in GTDB metadata
+MAX_CATEGORY_RATIO = 0.1 # string columns with fewer unique values per row are stored as categorical
+
+
+def cache_path_of(path: Path) -> Path:
+    """Path of the typed Parquet cache of a metadata TSV (e.g. metadata_ex.tsv -> metadata_ex.parquet)
+    """
+    path = Path(path)
+    name = path.name
+    for ext in ['.gz', '.tsv']:
+        name = name.removesuffix(ext)
+    return path.with_name(f"{name}.parquet")
+
+
+def typed_metadata(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts metadata read with dtype=str into typed columns.
+
+    Columns whose values are all numbers (or missing, see MISSING_VALUES) become int64
+    (float64 if any is missing or fractional). Taxonomy & low cardinality string columns
+    become categorical. Other columns are kept as strings.
+
+    Args:
+        df (pd.DataFrame): Metadata with string columns
+
+    Returns:
+        pd.DataFrame: Typed metadata
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype != object and not pd.api.types.is_string_dtype(values):
+            columns[col] = values
+            continue
+        missing = values.isna() | values.isin(MISSING_VALUES)
+        numbers = pd.to_numeric(values.mask(missing), errors='coerce')
+        if col not in TAXONOMY_COLS and not missing.all() and numbers.notna().sum() == (~missing).sum():
+            is_int = not missing.any() and numbers.dtype.kind in 'iu' # e.g. "1.0" stays float
+            columns[col] = numbers.astype(np.int64 if is_int else np.float64)
+        elif col in TAXONOMY_COLS or values.nunique() <= MAX_CATEGORY_RATIO*len(values):
+            columns[col] = values.astype("category")
+        else:
+            columns[col] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def build_metadata_cache(path: Path) -> Path:
+    """Converts a metadata TSV into its typed Parquet cache (see cache_path_of).
+
+    Args:
+        path (Path): Path to metadata TSV (optionally gzipped)
+
+    Returns:
+        Path: Path to the cache
+    """
+    cache_path = cache_path_of(path)
+    log.info(f"Building typed metadata cache {cache_path}...")
+    df = typed_metadata(pd.read_csv(path, sep='\t', dtype=str))
+    tmp_path = cache_path.with_name(f".{cache_path.name}.tmp")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def read_metadata(path: Path, columns: List[str] = None, filters: List[Tuple] = None) -> pd.DataFrame:
+    """Loads metadata from its typed Parquet cache, building the cache on the first call
+    or when the TSV is newer than the cache.
+
+    Only the requested columns are read & filters are pushed down to the Parquet reader,
+    e.g. filters=[("file_status", "==", "found"), ("checkm2_completeness", ">=", 90.0)].
+
+    Args:
+        path (Path): Path to metadata TSV or its Parquet cache
+        columns (List[str]): Columns to load (default: all)
+        filters (List[Tuple]): Row filters in pyarrow (column, op, value) format, combined by AND
+
+    Returns:
+        pd.DataFrame: Typed metadata
+    """
+    path = Path(path)
+    if path.suffix != ".parquet":
+        cache_path = cache_path_of(path)
+        if not cache_path.exists() or cache_path.stat().st_mtime < path.stat().st_mtime:
+            build_metadata_cache(path)
+        path = cache_path
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
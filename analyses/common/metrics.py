@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import heapq
+from pathlib import Path
+from contextlib import contextmanager, nullcontext
+from collections import defaultdict
+from typing import Dict, List
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+TOP_N = 10 # slowest genomes in the end-of-run summary
+
+
+class GenomeMetrics():
+    """Per-genome timings & counters, recorded in a worker & sent back to the parent with the result.
+
+    Phases are timed exclusively: while a nested phase runs, the enclosing phase is paused,
+    e.g. "read" (raw file I/O) inside "decompress" inside "parse" of a streaming scan.
+
+    Args:
+        stage (str): Pipeline stage, e.g. "profile", "split", "sample".
+        name (str): Accession of the genome (or name of the step for stage-level metrics).
+    """
+    def __init__(self, stage: str, name: str):
+        self.stage = stage
+        self.name = name
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._stack = []
+        self._since = None
+        self._start = time.perf_counter()
+
+    def _charge(self, now: float):
+        if self._stack:
+            self.times[self._stack[-1]] += now - self._since
+        self._since = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times a phase, e.g. "read", "decompress", "parse", "classify", "sample", "write".
+        """
+        self._charge(time.perf_counter())
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge(time.perf_counter())
+            self._stack.pop()
+
+    def add(self, key: str, n: int = 1):
+        """Adds to a counter, e.g. "bytes_in", "bytes_out", "sample_rejections".
+        """
+        self.counts[key] += n
+
+    def reader(self, f):
+        """Wraps a raw binary file so that its reads are timed as "read" & counted as "bytes_in".
+        """
+        return TimedReader(f, self)
+
+    def record(self) -> Dict:
+        """Flat JSON record: stage, name, worker pid, total seconds, <phase>_s & counters.
+        """
+        record = {
+            "stage": self.stage,
+            "name": self.name,
+            "worker": os.getpid(),
+            "seconds": time.perf_counter() - self._start,
+        }
+        record.update({f"{phase}_s": seconds for phase, seconds in self.times.items()})
+        record.update(self.counts)
+        return record
+
+
+class NullMetrics():
+    """No-op GenomeMetrics, default of instrumented functions.
+    """
+    def phase(self, name: str):
+        return nullcontext()
+
+    def add(self, key: str, n: int = 1):
+        pass
+
+    def reader(self, f):
+        return f
+
+
+NO_METRICS = NullMetrics()
+
+
+class TimedReader():
+    """File wrapper timing reads of the underlying (compressed) file, see GenomeMetrics.reader.
+    """
+    def __init__(self, f, metrics: GenomeMetrics):
+        self.f = f
+        self.metrics = metrics
+
+    def read(self, size: int = -1) -> bytes:
+        with self.metrics.phase("read"):
+            data = self.f.read(size)
+        self.metrics.add("bytes_in", len(data))
+        return data
+
+    def close(self):
+        self.f.close()
+
+
+class MetricsWriter():
+    """Writes per-genome records to a JSONL file in the parent process & summarizes the run.
+
+    On close(), throughput, time per phase & the TOP_N slowest genomes are logged
+    & saved to <path stem>_summary.json.
+
+    Args:
+        path (Path): Output JSONL file, e.g. <run out dir>/metrics.jsonl.
+        top_n (int): Number of slowest genomes in the summary.
+    """
+    def __init__(self, path: Path, top_n: int = TOP_N):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.top_n = top_n
+        self.f = open(self.path, 'w')
+        self.start = time.perf_counter()
+        self.n_records = 0
+        self.totals = defaultdict(float)
+        self.slowest = [] # min-heap of (seconds, name, stage) of the top_n slowest records
+
+    def write(self, record: Dict):
+        self.f.write(json.dumps(record) + "\n")
+        self.n_records += 1
+        for key, value in record.items():
+            if key not in ("stage", "name", "worker") and isinstance(value, (int, float)):
+                self.totals[key] += value
+        heapq.heappush(self.slowest, (record["seconds"], str(record["name"]), record["stage"]))
+        if len(self.slowest) > self.top_n:
+            heapq.heappop(self.slowest)
+
+    def write_all(self, records: List[Dict]):
+        for record in records:
+            self.write(record)
+
+    def summary(self) -> Dict:
+        wall = time.perf_counter() - self.start
+        busy = self.totals.get("seconds", 0.0)
+        phases = {key[:-2]: value for key, value in self.totals.items() if key.endswith("_s")}
+        return {
+            "records": self.n_records,
+            "wall_seconds": wall,
+            "worker_seconds": busy,
+            "genomes_per_s": self.n_records/wall if wall > 0 else None,
+            "mb_in_per_s": self.totals.get("bytes_in", 0)/1e6/wall if wall > 0 else None,
+            "mb_out_per_s": self.totals.get("bytes_out", 0)/1e6/wall if wall > 0 else None,
+            "phase_seconds": phases,
+            "phase_ratio": {phase: value/busy for phase, value in phases.items()} if busy > 0 else {},
+            "counts": {key: value for key, value in self.totals.items() if key != "seconds" and not key.endswith("_s")},
+            "slowest": [
+                {"name": name, "stage": stage, "seconds": seconds}
+                for seconds, name, stage in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def close(self) -> Dict:
+        self.f.close()
+        summary = self.summary()
+        with open(self.path.with_name(f"{self.path.stem}_summary.json"), 'w') as f:
+            json.dump(summary, f, indent=2)
+        log.info(
+            f"Metrics: {summary['records']} records in {summary['wall_seconds']:.1f}s "
+            f"({summary['genomes_per_s'] or 0:.2f}/s, {summary['mb_in_per_s'] or 0:.2f} MB/s in)"
+        )
+        if summary["phase_ratio"]:
+            log.info("Time per phase: " + ", ".join(
+                f"{phase}={ratio:.1%}" for phase, ratio in sorted(summary["phase_ratio"].items(), key=lambda x: -x[1])
+            ))
+        for entry in summary["slowest"]:
+            log.info(f"  slow: {entry['name']} ({entry['stage']}) {entry['seconds']:.2f}s")
+        log.info(f"Metrics saved to {self.path}")
+        return summary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,161 @@
+import io
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple, Union
+
+
+# Genome files fetched ahead by ReadAhead, registered in the worker processing them:
+# original path -> compressed bytes (memory) or local copy (scratch)
+_PRELOADED: Dict[str, Union[bytes, Path]] = {}
+
+
+@contextmanager
+def preloaded(sources: Dict[str, Union[bytes, Path]]):
+    """Registers fetched genome files while a task runs, see open_source.
+    """
+    _PRELOADED.update(sources or {})
+    try:
+        yield
+    finally:
+        for path in sources or {}:
+            _PRELOADED.pop(path, None)
+
+
+def open_source(file_path: Path):
+    """Opens the raw (compressed) bytes of a file in binary mode, from its fetched copy if registered.
+    """
+    source = _PRELOADED.get(str(file_path))
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    return open(source if source is not None else file_path, 'rb')
+
+
+class ReadAhead():
+    """Fetches compressed bytes of upcoming genome files on a bounded thread pool, in the parent process.
+
+    Used by common.schedule.scheduled_imap: files of the next chunks are fetched while workers
+    process the current ones, so network latency (NFS) overlaps with decompression & parsing.
+    Files of a chunk are queued & fetched one by one while both caps allow, so a large chunk
+    never overshoots them. Fetched files are sent to workers with their chunk & served by
+    open_source; files of a chunk not fetched by its submission are read by the worker itself.
+
+    Fetched bytes count against max_mb until the results of their chunk are consumed,
+    i.e. while they wait to be sent (parent) & while the chunk runs (worker).
+    The parent drops its copy once the chunk is submitted (see scheduled_imap).
+
+    Args:
+        paths_of (Callable): Task -> genome file paths (None entries are skipped).
+        genomes (int): Maximum files fetched ahead of submission, 0 disables read-ahead.
+        threads (int): Fetch threads.
+        max_mb (int): Cap of fetched & not yet released MB (a single larger file is fetched only when nothing else is held).
+        scratch_dir (Path): Fetch onto local scratch instead of memory (files are deleted on release).
+    """
+    def __init__(
+            self,
+            paths_of: Callable,
+            genomes: int = 0,
+            threads: int = 4,
+            max_mb: int = 2048,
+            scratch_dir: Path = None
+    ):
+        self.paths_of = paths_of
+        self.genomes = genomes
+        self.max_bytes = max_mb << 20
+        self.scratch_dir = None
+        if genomes and scratch_dir is not None:
+            Path(scratch_dir).mkdir(parents=True, exist_ok=True)
+            self.scratch_dir = Path(tempfile.mkdtemp(prefix="read_ahead_", dir=scratch_dir))
+        self.pool = ThreadPoolExecutor(threads) if genomes else None
+        self.queue = deque() # (futures of a chunk, path, size) waiting for room, in dispatch order
+        self.reserved = 0 # bytes of fetched & unreleased files (from stat before fetching), parent thread only
+        self.pending = 0 # files fetched ahead, not yet taken
+
+    def has_room(self) -> bool:
+        """Whether files of another chunk can be queued: files of earlier chunks are all fetched & caps are not reached.
+        """
+        return not self.queue and self.pending < self.genomes and (self.reserved < self.max_bytes or self.reserved == 0)
+
+    def _fetch(self, path: str) -> Union[bytes, Path]:
+        if self.scratch_dir is None:
+            with open(path, 'rb') as f:
+                return f.read()
+        local_path = Path(tempfile.mkstemp(dir=self.scratch_dir, suffix=Path(path).name)[1])
+        shutil.copyfile(path, local_path)
+        return local_path
+
+    def fetch(self, chunk: List) -> Dict[str, Tuple[Future, int]]:
+        """Queues the genome files of a chunk of tasks & starts fetching them while caps allow (see pump).
+        Returns the futures of the chunk, filled as its files are started, to be passed to take.
+        """
+        futures, queued = {}, set()
+        for task in chunk:
+            for path in self.paths_of(task):
+                if path is None or str(path) in queued:
+                    continue
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    continue # missing files are reported by the task itself
+                queued.add(str(path))
+                self.queue.append((futures, str(path), size))
+        self.pump()
+        return futures
+
+    def pump(self):
+        """Starts fetching queued files in order, as long as the genomes & max_mb caps allow, checked per file.
+        """
+        while self.queue:
+            futures, path, size = self.queue[0]
+            if self.pending >= self.genomes or (self.reserved > 0 and self.reserved + size > self.max_bytes):
+                break
+            self.queue.popleft()
+            self.reserved += size
+            self.pending += 1
+            futures[path] = (self.pool.submit(self._fetch, path), size)
+
+    def take(self, futures: Dict) -> Tuple[Dict[str, Union[bytes, Path]], Dict[str, int]]:
+        """Waits for fetched files of a chunk about to be submitted (failed fetches are left to the task), see fetch.
+        Its queued files not fetched yet are dropped & read by the worker itself.
+        Returns fetched sources & their reserved sizes, to be passed to release.
+        """
+        while self.queue and self.queue[0][0] is futures: # the chunk submitted next is the oldest queued
+            self.queue.popleft()
+        self.pending -= len(futures)
+        sources, sizes = {}, {}
+        for path, (future, size) in futures.items():
+            try:
+                sources[path] = future.result()
+                sizes[path] = size
+            except OSError:
+                self.reserved -= size
+        self.pump()
+        return sources, sizes
+
+    def release(self, sources: Dict[str, Union[bytes, Path]], sizes: Dict[str, int]):
+        """Frees fetched files of a chunk whose results were consumed.
+        Sources only need to hold scratch copies (bytes are dropped by the parent on submission).
+        """
+        for path, source in sources.items():
+            if isinstance(source, Path):
+                source.unlink(missing_ok=True)
+        for size in sizes.values():
+            self.reserved -= size
+        self.pump()
+
+    def close(self):
+        self.queue.clear()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+        if self.scratch_dir is not None:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
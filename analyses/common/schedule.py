@@ -0,0 +1,161 @@
+import queue
+import itertools
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Sequence
+import numpy as np
+import pandas as pd
+
+from .prefetch import ReadAhead, preloaded
+
+
+# Per-contig overhead of a genome task (record parsing, header classification, output calls) in base equivalents
+CONTIG_COST = 1000
+MAX_CHUNK_SIZE = 16 # tasks per chunk (bounds the wait for read-ahead of a chunk & the results held by a worker)
+
+
+def genome_cost(genome_size, contig_count) -> np.ndarray:
+    """Estimated processing cost of genomes, from metadata columns.
+
+    Args:
+        genome_size: Genome sizes (bases), e.g. metadata genome_size.
+        contig_count: Contig counts, e.g. metadata contig_count.
+
+    Returns:
+        np.ndarray: float64 cost per genome; missing values are replaced by the median cost.
+    """
+    cost = (
+        pd.to_numeric(pd.Series(genome_size), errors='coerce').to_numpy(dtype=float) +
+        CONTIG_COST*pd.to_numeric(pd.Series(contig_count), errors='coerce').fillna(0).to_numpy(dtype=float)
+    )
+    missing = np.isnan(cost)
+    if missing.any():
+        cost[missing] = np.median(cost[~missing]) if (~missing).any() else 1.0
+    return cost
+
+
+def schedule_chunks(
+        tasks: Sequence,
+        costs: Sequence[float],
+        n_workers: int,
+        chunks_per_worker: int = 4,
+        max_chunk_size: int = MAX_CHUNK_SIZE
+) -> List[List]:
+    """Orders tasks largest first & groups them into chunks of decreasing cost (guided scheduling).
+
+    Each chunk is closed when its cost reaches remaining_cost/(n_workers*chunks_per_worker)
+    or when it holds max_chunk_size tasks, so the largest genomes are dispatched first in chunks 
+    of at most max_chunk_size, small genomes are batched up to max_chunk_size to amortize IPC, 
+    & the last chunks are small enough to keep every worker busy until the end.
+    A genome costing at least the target of its chunk is dispatched alone.
+
+    Args:
+        tasks (Sequence): Tasks.
+        costs (Sequence[float]): Cost of each task (see genome_cost).
+        n_workers (int): Number of workers.
+        chunks_per_worker (int): Granularity; higher values give smaller chunks.
+        max_chunk_size (int): Maximum tasks per chunk.
+
+    Returns:
+        List[List]: Chunks of tasks in dispatch order.
+    """
+    costs = np.asarray(costs, dtype=float)
+    order = np.argsort(-costs, kind="stable")
+    remaining = float(costs.sum())
+    divisor = max(1, n_workers*chunks_per_worker)
+    chunks, chunk, chunk_cost = [], [], 0.0
+    for i in order:
+        if not chunk:
+            target = remaining/divisor
+        chunk.append(tasks[i])
+        chunk_cost += costs[i]
+        if chunk_cost >= target or len(chunk) >= max_chunk_size:
+            chunks.append(chunk)
+            remaining -= chunk_cost
+            chunk, chunk_cost = [], 0.0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_chunk(func: Callable, chunk: List, sources: Dict = None) -> List:
+    """Runs a chunk of tasks in a worker, with genome files fetched by ReadAhead (optional).
+    """
+    with preloaded(sources):
+        return [func(task) for task in chunk]
+
+
+def scheduled_imap(
+        pool,
+        func: Callable,
+        tasks: Sequence,
+        costs: Sequence[float],
+        n_workers: int,
+        max_in_flight: int = None,
+        chunks_per_worker: int = 4,
+        read_ahead: ReadAhead = None,
+        max_chunk_size: int = MAX_CHUNK_SIZE
+) -> Iterator:
+    """Size-aware replacement of pool.imap_unordered(func, tasks).
+
+    Tasks are dispatched in chunks from schedule_chunks. At most max_in_flight chunks are
+    submitted & not yet consumed, so results waiting in the parent stay bounded (backpressure).
+    With read_ahead, genome files of upcoming chunks are fetched while workers are busy 
+    & sent with their chunk.
+
+    Args:
+        pool: multiprocessing.Pool.
+        func (Callable): Picklable function applied to each task.
+        tasks (Sequence): Tasks.
+        costs (Sequence[float]): Cost of each task (see genome_cost).
+        n_workers (int): Number of workers of the pool.
+        max_in_flight (int): Maximum chunks submitted & not consumed (default: 2*n_workers).
+        chunks_per_worker (int): See schedule_chunks.
+        read_ahead (ReadAhead): Read-ahead of genome files (optional).
+        max_chunk_size (int): See schedule_chunks.
+
+    Yields:
+        Results of func, in completion order.
+    """
+    chunks = deque(schedule_chunks(tasks, costs, n_workers, chunks_per_worker, max_chunk_size))
+    fetching = deque() # (chunk, fetch futures) in dispatch order
+    fetched = {} # submission id -> (scratch sources, sizes) released once its results are consumed
+    keys = itertools.count()
+    done = queue.Queue()
+    def prefetch():
+        while read_ahead is not None and chunks and read_ahead.has_room():
+            chunk = chunks.popleft()
+            fetching.append((chunk, read_ahead.fetch(chunk)))
+
+    def submit() -> int:
+        prefetch()
+        if fetching:
+            chunk, futures = fetching.popleft()
+            sources, sizes = read_ahead.take(futures)
+        elif chunks:
+            chunk, sources, sizes = chunks.popleft(), {}, {}
+        else:
+            return 0
+        key = next(keys)
+        pool.apply_async(
+            run_chunk, (func, chunk, sources), 
+            callback=lambda results, key=key: done.put((key, results)), 
+            error_callback=done.put
+        )
+        # the pool holds fetched bytes until they are sent, only scratch copies are kept for release
+        fetched[key] = ({path: source for path, source in sources.items() if not isinstance(source, bytes)}, sizes)
+        prefetch()
+        return 1
+
+    in_flight = 0
+    for _ in range(max_in_flight or 2*n_workers):
+        in_flight += submit()
+    while in_flight > 0:
+        results = done.get()
+        in_flight -= 1
+        if isinstance(results, BaseException):
+            raise results
+        key, results = results
+        if read_ahead is not None:
+            read_ahead.release(*fetched.pop(key))
+        in_flight += submit()
+        yield from results
@@ -0,0 +1,77 @@
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+def _complement_table() -> np.ndarray:
+    """uint8 lookup table of IUPAC nucleotide complements (case preserved), other bytes map to themselves.
+    """
+    table = np.arange(256, dtype=np.uint8)
+    pairs = ["AT", "CG", "RY", "KM", "BV", "DH", "SS", "WW", "NN"]
+    for a, b in pairs:
+        for x, y in [(a, b), (a.lower(), b.lower())]:
+            table[ord(x)], table[ord(y)] = ord(y), ord(x)
+    table.flags.writeable = False
+    return table
+
+
+COMPLEMENT = _complement_table()
+
+
+def reverse_complement(seq: np.ndarray) -> np.ndarray:
+    """Reverse complement of a uint8 (ASCII) sequence.
+    """
+    return COMPLEMENT[seq[::-1]]
+
+
+def extract_windows(
+        contigs: Dict[str, np.ndarray], 
+        windows: List[Tuple[str, int, int, str]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Extracts many windows from contigs into one contiguous buffer.
+
+    Contigs are concatenated once & all windows are gathered with a single index
+    (reversed within '-' strand windows), then '-' strand windows are complemented
+    with a single lookup-table pass over the buffer, instead of one slice or Bio.Seq object per window.
+
+    Args:
+        contigs (Dict[str, np.ndarray]): Contig ID -> sequence as uint8 (ASCII) array.
+        windows (List[Tuple[str, int, int, str]]): List of (contig ID, start, stop, strand).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: uint8 buffer & int64 offsets (len(windows)+1), 
+        window i is buffer[offsets[i]:offsets[i+1]].
+    """
+    # Concatenated sequences of contigs referenced by windows
+    contig_ids = list(dict.fromkeys(contig_id for contig_id, _, _, _ in windows))
+    position = {contig_id: i for i, contig_id in enumerate(contig_ids)}
+    seqs = [contigs[contig_id] for contig_id in contig_ids]
+    contig_offsets = np.zeros(len(seqs) + 1, dtype=np.int64)
+    np.cumsum([len(seq) for seq in seqs], out=contig_offsets[1:])
+    source = np.concatenate(seqs) if seqs else np.empty(0, dtype=np.uint8)
+
+    n = len(windows)
+    starts = np.fromiter(
+        (contig_offsets[position[contig_id]] + start for contig_id, start, _, _ in windows), dtype=np.int64, count=n
+    )
+    lengths = np.fromiter((stop - start for _, start, stop, _ in windows), dtype=np.int64, count=n)
+    reverse = np.fromiter((strand == "-" for _, _, _, strand in windows), dtype=bool, count=n)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # Gather index: position i of window w maps to starts[w] + i ('+') or starts[w] + lengths[w]-1 - i ('-')
+    index = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1], dtype=np.int64)
+    if reverse.any():
+        mask = np.repeat(reverse, lengths)
+        index[mask] = np.repeat(2*starts + lengths - 1, lengths)[mask] - index[mask]
+        buffer = source[index]
+        buffer[mask] = COMPLEMENT[buffer[mask]]
+    else:
+        buffer = source[index]
+    return buffer, offsets
+
+
+def decode_windows(buffer: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """Decodes windows of a buffer from extract_windows into strings.
+    """
+    text = buffer.tobytes().decode('ascii')
+    return [text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
@@ -0,0 +1,327 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+from contextlib import ExitStack
+
+from .fasta import classify_sequence, format_header, wrap_sequence
+from .bgzf import BgzfFastaWriter
+from .metrics import NO_METRICS
+
+
+log = logging.getLogger(__name__)
+
+
+def tmp_path_of(path: Path) -> Path:
+    """Temporary path in the same directory, so that os.replace() stays atomic
+    """
+    return path.with_name(f"{path.name}.tmp")
+
+
+def validate_output(tmp_path: Path, n_records: int, validate: bool = True):
+    """Validate a temporary gzipped FASTA before it is renamed into place.
+
+    Args:
+        tmp_path (Path): Path to the temporary output
+        n_records (int): Number of records written into the temporary output
+        validate (bool): Re-read the output & check gzip integrity & record count
+    """
+    if tmp_path.stat().st_size == 0:
+        raise IOError(f"Empty output: {tmp_path}")
+    if validate:
+        n_headers = count_headers(tmp_path)
+        if n_headers != n_records:
+            raise IOError(f"Record count mismatch in {tmp_path}: wrote {n_records}, read {n_headers}")
+
+
+def index_paths(path: Path) -> Tuple[Path, Path]:
+    """.fai & .gzi index paths of a BGZF output
+    """
+    return Path(f"{path}.fai"), Path(f"{path}.gzi")
+
+
+class HashingWriter():
+    """Binary file wrapper computing MD5 & size of the bytes written through it
+    """
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.md5.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def file_md5(file_path: Path, block_size: int = 1 << 20) -> str:
+    """MD5 of a file, read in blocks
+    """
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def read_journal(journal_path: Path) -> Dict[str, Dict]:
+    """Read the completion journal in one sequential pass.
+    Later entries of an accession override earlier ones & a truncated last line (crash) is ignored.
+
+    Args:
+        journal_path (Path): Path to the journal (.jsonl)
+
+    Returns:
+        Dict[str, Dict]: Accession -> journal entry
+    """
+    entries = {}
+    if not journal_path.exists():
+        return entries
+    with open(journal_path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                log.warning(f"Ignoring malformed journal line: {line[:80]!r}")
+                continue
+            entries[entry["accession"]] = entry
+    return entries
+
+
+def source_key(file_path: Path) -> Dict:
+    """Identity of a source genome file recorded in the journal: path, size & mtime (ns)
+    """
+    stat = os.stat(file_path)
+    return {"source": str(file_path), "source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def journal_options(unknown_mode: str, compression: str) -> Dict:
+    """Split options changing the outputs, recorded in the journal
+    """
+    return {"unknown_mode": unknown_mode, "compression": compression}
+
+
+def is_current(entry: Dict, file_path: Path, options: Dict) -> bool:
+    """Check that a journal entry was written from the same source path with the same split options 
+    (see journal_options). Only the journal is read; source files are checked by verify_entry.
+
+    Args:
+        entry (Dict): Journal entry
+        file_path (Path): Source genome file to be split
+        options (Dict): Split options of the current run
+
+    Returns:
+        bool: False if the source path or options changed (or are not recorded), i.e. outputs are stale
+    """
+    return entry.get("source") == str(file_path) and entry.get("options") == options
+
+
+def verify_entry(entry: Dict, mode: str) -> bool:
+    """Check a journal entry against the files on disk: source file (size & mtime) & outputs.
+
+    Args:
+        entry (Dict): Journal entry
+        mode (str): "size" compares byte sizes, "checksum" also compares MD5 of outputs
+
+    Returns:
+        bool: True if the source is unchanged & all outputs match
+    """
+    try:
+        key = source_key(entry["source"])
+    except OSError:
+        return False
+    if key["source_size"] != entry.get("source_size") or key["source_mtime_ns"] != entry.get("source_mtime_ns"):
+        return False
+    for out in entry["outputs"].values():
+        try:
+            if os.stat(out["path"]).st_size != out["size"]:
+                return False
+            if mode == "checksum" and file_md5(out["path"]) != out["md5"]:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def journal_result(entry: Dict) -> Dict:
+    """Result of split_genome restored from a journal entry
+    """
+    result = {"status": "skipped", "accession": entry["accession"]}
+    for seq_type in ["chromosome", "plasmid"]:
+        out = entry["outputs"].get(seq_type)
+        result[f"{seq_type}_path"] = out["path"] if out else None
+        result[f"{seq_type}_reason"] = out["reason"] if out else None
+    return result
+
+
+def count_headers(file_path: Path) -> int:
+    """Count FASTA headers of a gzipped file. Raises on truncated or corrupted files.
+    """
+    n_headers = 0
+    with gzip.open(file_path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                n_headers += 1
+    return n_headers
+
+
+def join_reasons(reasons):
+    """Join detection reasons of multiple records as in split_summary.csv
+    """
+    return ";".join(sorted(reasons)) if reasons else None
+
+
+def output_paths(file_path: Path, target_dir: Path) -> Tuple[Path, Path]:
+    """Chromosome & plasmid output paths of a genome file
+    """
+    name = Path(file_path).name
+    for ext in ['.gz', '.fna', '.fa', '.fasta']:
+        name = name.replace(ext, "")
+    return target_dir/f"{name}_chromosome.fna.gz", target_dir/f"{name}_plasmid.fna.gz"
+
+
+def empty_result() -> Dict:
+    """Result of split_genome before any output is written
+    """
+    return {
+        "status": "error", 
+        "chromosome_path": None, 
+        "plasmid_path": None, 
+        "chromosome_reason": None, 
+        "plasmid_reason": None, 
+        "outputs": {}, 
+    }
+
+
+def split_genome(
+        records: Iterable[Tuple[str, bytes]], 
+        chromosome_path: Path, 
+        plasmid_path: Path, 
+        unknown_mode: str = "chromosome", 
+        validate: bool = True, 
+        compression: str = "gzip", 
+        compress_threads: int = 1, 
+        metrics=NO_METRICS
+) -> Dict:
+    """Split records of a genome into chromosome & plasmid outputs.
+    Records are streamed into temporary files, which are all validated before any of them is renamed 
+    into place; outputs of a previous split that this split does not write are removed.
+
+    Args:
+        records (Iterable[Tuple[str, bytes]]): (header line without '>', sequence), 
+            streamed by iter_fasta or already read by read_fasta. Read errors are handled as split errors
+        chromosome_path (Path): Output path of chromosome records
+        plasmid_path (Path): Output path of plasmid records
+        unknown_mode (str): Unclassified records go to "chromosome" or are discarded ("discard")
+        validate (bool): Re-read outputs & check gzip integrity & record count
+        compression (str): "gzip" or "bgzf" (indexed with .fai & .gzi, compressed on threads)
+        compress_threads (int): Compression threads (bgzf only)
+        metrics (GenomeMetrics): Timings of classify, write & validate, & bytes_out (optional)
+
+    Returns:
+        Dict: Result containing status, output paths & detection reasons, 
+        & per output size, record count & MD5 for the completion journal
+    """
+    chromosome_path.parent.mkdir(parents=True, exist_ok=True)
+    result = empty_result()
+    outputs = {
+        "chromosome": {"path": chromosome_path, "handle": None, "n_records": 0, "reasons": set()}, 
+        "plasmid": {"path": plasmid_path, "handle": None, "n_records": 0, "reasons": set()}, 
+    }
+    bgzf = compression == "bgzf"
+    renamed = []
+    try:
+        # Split & write records into temporary outputs
+        with metrics.phase("write"), ExitStack() as stack:
+            for description, seq in records:
+                with metrics.phase("classify"):
+                    seq_type, reason = classify_sequence(description)
+                description += f" [seq_type={seq_type}] [class_reason={reason}]"
+                if seq_type == "unknown":
+                    if unknown_mode == "chromosome":
+                        description += " [seq_type=unknown]"
+                        seq_type = "chromosome"
+                    elif unknown_mode == "discard":
+                        continue
+
+                out = outputs[seq_type]
+                if out["handle"] is None:
+                    out["writer"] = HashingWriter(stack.enter_context(open(tmp_path_of(out["path"]), 'wb')))
+                    if bgzf:
+                        out["handle"] = BgzfFastaWriter(out["writer"], compress_threads)
+                        stack.callback(out["handle"].close)
+                    else:
+                        out["handle"] = stack.enter_context(gzip.GzipFile(fileobj=out["writer"], mode='wb'))
+                if bgzf:
+                    out["handle"].write_record(description, seq)
+                else:
+                    out["handle"].write(format_header(description) + wrap_sequence(seq))
+                out["n_records"] += 1
+                out["reasons"].add(reason)
+
+        # Validate all temporary outputs before any of them is renamed
+        for seq_type, out in outputs.items():
+            if out["n_records"] == 0:
+                continue
+            with metrics.phase("validate"):
+                if bgzf:
+                    out["handle"].write_indexes(*map(tmp_path_of, index_paths(out["path"])))
+                validate_output(tmp_path_of(out["path"]), out["n_records"], validate)
+            metrics.add("bytes_out", out["writer"].size)
+            result[f"{seq_type}_path"] = str(out["path"])
+            result[f"{seq_type}_reason"] = join_reasons(out["reasons"])
+            result["outputs"][seq_type] = {
+                "path": str(out["path"]), 
+                "size": out["writer"].size, 
+                "n_records": out["n_records"], 
+                "md5": out["writer"].md5.hexdigest(), 
+                "reason": result[f"{seq_type}_reason"], 
+            }
+
+        # Remove outputs of a previous split that this split does not write (e.g. no plasmid anymore, 
+        # or indexes of a bgzf output now written as gzip), then rename into place 
+        # (indexes first, so that a renamed output is always indexed)
+        for out in outputs.values():
+            stale = [] if out["n_records"] > 0 else [out["path"]]
+            if out["n_records"] == 0 or not bgzf:
+                stale += index_paths(out["path"])
+            for path in stale:
+                path.unlink(missing_ok=True)
+        for out in outputs.values():
+            if out["n_records"] == 0:
+                continue
+            for path in (*index_paths(out["path"]), out["path"]) if bgzf else (out["path"],):
+                os.replace(tmp_path_of(path), path) # atomic on the same filesystem
+                renamed.append(path)
+        result["status"] = "success"
+
+    except Exception as e:
+        log.error(f"Error splitting into {chromosome_path.name}: {e}")
+        for out in outputs.values():
+            for path in (out["path"], *index_paths(out["path"])):
+                tmp_path_of(path).unlink(missing_ok=True)
+        for path in renamed: # a genome is never left partially renamed
+            path.unlink(missing_ok=True)
+        result = empty_result()
+
+    return result
+
+
+def journal_entry(result: Dict, options: Dict) -> str:
+    """Journal line of a successfully split genome 
+    (result of split_genome with accession & source key from source_key, & split options from journal_options)
+    """
+    return json.dumps({
+        "accession": result["accession"], 
+        "source": str(result["source"]), 
+        "source_size": result["source_size"], 
+        "source_mtime_ns": result["source_mtime_ns"], 
+        "options": options, 
+        "outputs": result["outputs"], 
+    }) + "\n"